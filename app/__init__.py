@@ -14,6 +14,9 @@ def create_app():
 
     # 1. Inicializa las extensiones con la instancia de la aplicación.
     db.init_app(app)
+
+    from .services.logs import configurar_logging
+    configurar_logging(app, db)
     
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login' # Redirige aquí si se necesita login
@@ -31,7 +34,11 @@ def create_app():
 
     from .auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
-    
+
+    # 3. Comandos de mantenimiento (flask reconstruir-expedientes, etc.)
+    from .cli import registrar_comandos
+    registrar_comandos(app)
+
     with app.app_context():
         # Comentamos esta línea porque las tablas ya existen en tu base de datos.
         # Si estuvieras empezando de cero, la necesitarías.
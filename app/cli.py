@@ -0,0 +1,147 @@
+# app/cli.py
+# Comandos de mantenimiento (flask <comando>)
+
+import click
+
+from .models import db, Desglose, Aerolinea
+from .services.logs import obtener_logger, span
+
+log = obtener_logger('cli')
+
+
+def registrar_comandos(app):
+    """Registra los comandos de la aplicación en app.cli"""
+
+    @app.cli.command('reconstruir-expedientes')
+    def reconstruir_expedientes_cmd():
+        """Reconstruye la tabla expedientes desde desgloses y papeletas."""
+        from .services.expedientes import reconstruir_expedientes
+
+        try:
+            with span('expedientes.reconstruir', logger=log):
+                total = reconstruir_expedientes()
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            log.exception('Error al reconstruir expedientes')
+            raise click.ClickException('No se pudo reconstruir la tabla expedientes.')
+
+        click.echo(f'Expedientes reconstruidos: {total}')
+
+    @app.cli.command('normalizar-boletos')
+    @click.option('--todos', is_flag=True, help='Recalcular también los que ya tienen número normalizado.')
+    def normalizar_boletos_cmd(todos):
+        """Llena desgloses.numero_boleto_norm a partir de numero_boleto."""
+        from .services.conciliacion_bsp import normalizar_numero_boleto
+
+        query = db.session.query(Desglose.folio, Desglose.numero_boleto, Aerolinea.codigo_iata).outerjoin(
+            Aerolinea, Aerolinea.id == Desglose.aerolinea_id
+        ).filter(Desglose.numero_boleto.isnot(None))
+        if not todos:
+            query = query.filter(Desglose.numero_boleto_norm.is_(None))
+
+        # Normalizados que ya existen (para no chocar con el índice único)
+        ocupados = {} if todos else dict(db.session.query(Desglose.numero_boleto_norm, Desglose.folio).filter(
+            Desglose.numero_boleto_norm.isnot(None)
+        ).all())
+
+        cambios = []
+        duplicados = []
+        invalidos = []
+        for folio, numero, codigo_iata in query.order_by(Desglose.folio).yield_per(1000):
+            try:
+                norm = normalizar_numero_boleto(numero, codigo_iata)
+            except ValueError:
+                invalidos.append((folio, numero))
+                continue
+            if not norm:
+                continue
+            if norm in ocupados and ocupados[norm] != folio:
+                duplicados.append((folio, numero, ocupados[norm]))
+                continue
+            ocupados[norm] = folio
+            cambios.append({'folio': folio, 'numero_boleto_norm': norm})
+
+        try:
+            with span('desgloses.normalizar_boletos', logger=log, cambios=len(cambios)):
+                if todos:
+                    db.session.query(Desglose).update({Desglose.numero_boleto_norm: None}, synchronize_session=False)
+                if cambios:
+                    db.session.execute(db.update(Desglose), cambios)
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            log.exception('Error al normalizar números de boleto')
+            raise click.ClickException('No se pudieron normalizar los números de boleto.')
+
+        click.echo(f'Boletos normalizados: {len(cambios)}')
+        for folio, numero, folio_original in duplicados:
+            click.echo(f'  Duplicado: desglose {folio} ({numero}) es el mismo boleto que el desglose {folio_original}')
+        for folio, numero in invalidos:
+            click.echo(f'  Inválido: desglose {folio} ({numero}) tiene más de 13 dígitos')
+
+    @app.cli.command('procesar-trabajos')
+    @click.option('--una-vez', is_flag=True, help='Procesar los trabajos pendientes y salir.')
+    @click.option('--intervalo', default=2.0, show_default=True, help='Segundos de espera cuando no hay trabajos.')
+    def procesar_trabajos_cmd(una_vez, intervalo):
+        """Worker de la cola de trabajos (conciliaciones por archivo)."""
+        from .services import tareas_conciliacion  # noqa: F401 - registra las tareas
+        from .services.trabajos import procesar
+
+        click.echo('Procesando trabajos pendientes...' if una_vez else 'Worker iniciado (Ctrl+C para detener)')
+        total = procesar(una_vez=una_vez, intervalo=intervalo)
+        click.echo(f'Trabajos ejecutados: {total}')
+
+    @app.cli.command('verificar-totales-reportes')
+    @click.option('--corregir', is_flag=True, help='Recalcular desde las líneas los totales de todos los reportes.')
+    def verificar_totales_reportes_cmd(corregir):
+        """Compara los totales guardados de los reportes de ventas con los calculados desde sus líneas."""
+        from .services.reportes_ventas import recalcular_totales, reportes_con_diferencias
+
+        diferencias = reportes_con_diferencias()
+        for reporte_id, folio in diferencias:
+            click.echo(f'  Totales distintos: reporte {folio or reporte_id}')
+        click.echo(f'Reportes con diferencias: {len(diferencias)}')
+
+        if not corregir:
+            return
+        try:
+            with span('reportes_ventas.recalcular_totales', logger=log):
+                total = recalcular_totales()
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            log.exception('Error al recalcular totales de reportes de ventas')
+            raise click.ClickException('No se pudieron recalcular los totales.')
+
+        click.echo(f'Reportes recalculados: {total}')
+
+    @app.cli.command('generar-reportes-ventas')
+    @click.option('--fecha', type=click.DateTime(formats=['%Y-%m-%d']), help='Fecha de los reportes (por omisión hoy, hora de México).')
+    def generar_reportes_ventas_cmd(fecha):
+        """Genera el reporte de ventas del día de cada agente con sus papeletas de mostrador pendientes."""
+        from .models import Papeleta, Usuario
+        from .routes import fecha_mexico
+        from .services.reportes_ventas import filtro_papeletas_disponibles, generar_reporte_dia
+
+        fecha = fecha.date() if fecha else fecha_mexico()
+        agentes = Usuario.query.filter(Usuario.id.in_(
+            db.select(Papeleta.usuario_id).where(*filtro_papeletas_disponibles(None, fecha))
+        )).order_by(Usuario.id).all()
+
+        resultados = []
+        try:
+            # Todos los agentes en una sola transacción
+            with span('reportes_ventas.generar', logger=log, agentes=len(agentes)):
+                for agente in agentes:
+                    resultados.append((agente, *generar_reporte_dia(agente, fecha)))
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            log.exception('Error al generar reportes de ventas')
+            raise click.ClickException('No se generaron los reportes de ventas.')
+
+        for agente, reporte, agregadas, creado in resultados:
+            if reporte and agregadas:
+                click.echo(f'  {agente.nombre}: {reporte.folio} {"nuevo" if creado else "existente"}, {agregadas} papeletas')
+        click.echo(f'Reportes con papeletas agregadas: {sum(1 for r in resultados if r[2])}')
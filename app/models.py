@@ -453,6 +453,8 @@ class TarjetaCorporativa(db.Model):
 
     nombre_tarjeta = db.Column(db.String, nullable=False)
 
+    categoria = db.Column(db.String(20))  # 'volaris', 'vivaaerobus', 'compra_tc' (de nombre_tarjeta)
+
     banco = db.Column(db.String)
 
     titular = db.Column(db.String)
@@ -786,6 +788,7 @@ class Desglose(db.Model):
     # Nuevos campos
 
     numero_boleto = db.Column(db.String, unique=True)
+    numero_boleto_norm = db.Column(db.String(13), unique=True)  # Solo dígitos, 13 con prefijo de aerolínea
 
     fecha_emision = db.Column(db.Date, default=datetime.utcnow)
 
@@ -885,6 +888,8 @@ class Papeleta(db.Model):
 
     forma_pago = db.Column(db.String, nullable=False)
 
+    forma_pago_clase = db.Column(db.String(20))  # 'efectivo', 'deposito', 'voucher' (de forma_pago)
+
     usuario_id = db.Column(db.BigInteger, db.ForeignKey('usuarios.id'), nullable=False)
 
     empresa_id = db.Column(db.BigInteger, db.ForeignKey('empresas.id'))
@@ -931,6 +936,10 @@ class Papeleta(db.Model):
 
     fecha_conciliacion = db.Column(db.Date)
 
+    conciliada_por_id = db.Column(db.BigInteger, db.ForeignKey('usuarios.id'))
+
+    periodo_conciliacion = db.Column(db.String(50))  # Periodo del reporte de la aerolínea
+
     sucursal_id = db.Column(db.BigInteger, db.ForeignKey('sucursales.id'))
 
     reporte_venta_id = db.Column(db.BigInteger, db.ForeignKey('reportes_ventas.id'))
@@ -991,11 +1000,42 @@ class Papeleta(db.Model):
     # Relaciones de facturación
     facturada_por = db.relationship('Usuario', foreign_keys=[facturada_por_id])
     aprobada_por = db.relationship('Usuario', foreign_keys=[aprobada_por_id])
+    conciliada_por = db.relationship('Usuario', foreign_keys=[conciliada_por_id])
 
     def __repr__(self):
 
         return f'<Papeleta {self.folio}>'
 
+
+class Expediente(db.Model):
+    """Expediente materializado por clave normalizada (desglose + papeleta + factura).
+
+    Lo mantiene app/services/expedientes.py al escribir desgloses y papeletas;
+    se reconstruye completo con `flask reconstruir-expedientes`.
+    """
+    __tablename__ = 'expedientes'
+
+    clave = db.Column(db.String, primary_key=True)  # upper(clave_sabre o clave_reserva)
+    desglose_folio = db.Column(db.BigInteger)
+    papeleta_id = db.Column(db.BigInteger)
+    papeleta_folio = db.Column(db.String)
+    pasajero = db.Column(db.String)
+    ruta = db.Column(db.String)
+    total = db.Column(db.Numeric(10, 2), default=0)
+    fecha = db.Column(db.Date)
+    empresa_id = db.Column(db.BigInteger)
+    aerolinea_id = db.Column(db.BigInteger)
+    factura = db.Column(db.String(50))
+    requiere_papeleta = db.Column(db.Boolean, default=False)
+    docs_requeridos = db.Column(db.SmallInteger, default=2)
+    docs_completos = db.Column(db.SmallInteger, default=0)
+    completo = db.Column(db.Boolean, default=False)
+    usuario_ids = db.Column(db.ARRAY(db.BigInteger))  # Agentes dueños de algún documento
+    ultima_actividad = db.Column(db.DateTime(timezone=True))
+
+    def __repr__(self):
+        return f'<Expediente {self.clave}>'
+
 # =============================================================================
 
 # MODELOS DE CRÉDITO Y PAGOS
@@ -1254,6 +1294,8 @@ class ReporteVenta(db.Model):
 
     total_recibos = db.Column(db.Integer, default=0)
 
+    boletos_aerolinea = db.Column(db.JSON, nullable=False, default=dict)  # {clave_aerolinea: boletos}
+
     # Control
 
     estatus = db.Column(db.String(20), default='borrador')
@@ -1869,6 +1911,128 @@ class HistorialEntrega(db.Model):
 
         return descripciones.get(self.accion, self.accion)
 
+# =============================================================================
+# MODELOS DE CONCILIACIÓN
+# =============================================================================
+
+class ArchivoConciliacion(db.Model):
+    """Resultado del parser por archivo subido (BSP PDF/TXT, Volaris), identificado por hash del contenido"""
+    __tablename__ = 'archivos_conciliacion'
+    __table_args__ = (
+        db.UniqueConstraint('hash_sha256', 'tipo', 'version_parser', name='uq_archivos_conciliacion_hash'),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    hash_sha256 = db.Column(db.String(64), nullable=False)
+    tipo = db.Column(db.String(20), nullable=False)  # 'bsp_pdf', 'volaris_xlsx', 'viva'
+    version_parser = db.Column(db.String(20), nullable=False)
+    nombre_archivo = db.Column(db.String(255))
+    periodo = db.Column(db.String(50))
+    total_documentos = db.Column(db.Integer, default=0)
+    resultado = db.Column(db.JSON, nullable=False)  # {'periodo': ..., 'documentos': [...]}
+    usos = db.Column(db.Integer, default=1)
+    usuario_id = db.Column(db.BigInteger, db.ForeignKey('usuarios.id'))
+    created_at = db.Column(db.DateTime(timezone=True), default=func.now())
+    ultimo_uso = db.Column(db.DateTime(timezone=True), default=func.now())
+
+    def __repr__(self):
+        return f'<ArchivoConciliacion {self.tipo} {self.hash_sha256[:12]}>'
+
+
+class ConciliacionRun(db.Model):
+    """Una ejecución de conciliación (archivo BSP o Volaris cruzado contra el sistema)"""
+    __tablename__ = 'conciliacion_runs'
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)  # 'bsp', 'volaris', 'viva'
+    periodo = db.Column(db.String(50))
+    nombre_archivo = db.Column(db.String(255))
+    resumen = db.Column(db.JSON, nullable=False, default=dict)  # Contadores para las tarjetas del resultado
+    usuario_id = db.Column(db.BigInteger, db.ForeignKey('usuarios.id'))
+    created_at = db.Column(db.DateTime(timezone=True), default=func.now())
+
+    usuario = db.relationship('Usuario', foreign_keys=[usuario_id])
+    lineas = db.relationship('ConciliacionLinea', backref='run', lazy='dynamic', cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<ConciliacionRun {self.id} {self.tipo} {self.periodo}>'
+
+
+class ConciliacionLinea(db.Model):
+    """Un documento del archivo con el resultado del cruce dentro de un run"""
+    __tablename__ = 'conciliacion_lineas'
+    __table_args__ = (
+        db.Index('idx_conciliacion_lineas_run_resultado', 'run_id', 'resultado', 'orden'),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    run_id = db.Column(db.BigInteger, db.ForeignKey('conciliacion_runs.id', ondelete='CASCADE'), nullable=False)
+    orden = db.Column(db.Integer, nullable=False)  # Posición en el archivo
+    resultado = db.Column(db.String(20), nullable=False)  # 'conciliado', 'ya_conciliado', 'no_encontrado', 'removido'
+    clave = db.Column(db.String(30))  # Número completo (BSP) o PNR (Volaris, Viva)
+    tipo_documento = db.Column(db.String(10))  # TRNC en BSP
+    scope = db.Column(db.String(20))
+    folio = db.Column(db.String(255))  # Desglose o papeletas del sistema
+    pasajero = db.Column(db.String(255))
+    monto = db.Column(db.Numeric(12, 2))  # Monto según el archivo
+    monto_sistema = db.Column(db.Numeric(12, 2))
+    diferencia = db.Column(db.Numeric(12, 2))
+    neto = db.Column(db.Numeric(12, 2))  # Balance payable en BSP
+    datos = db.Column(db.JSON)  # Documento completo para mostrar
+
+    def __repr__(self):
+        return f'<ConciliacionLinea {self.run_id} {self.clave} {self.resultado}>'
+
+
+class ConciliacionBspDocumento(db.Model):
+    """Documento de un periodo BSP y el desglose con el que quedó cruzado en la última conciliación del periodo"""
+    __tablename__ = 'conciliacion_bsp_documentos'
+    __table_args__ = (
+        db.UniqueConstraint('periodo', 'clave', name='uq_conciliacion_bsp_documentos_periodo_clave'),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    periodo = db.Column(db.String(10), nullable=False)  # Mismo valor que desgloses.periodo_bsp
+    clave = db.Column(db.String(13), nullable=False)  # Número de boleto normalizado
+    folio = db.Column(db.BigInteger, db.ForeignKey('desgloses.folio', ondelete='SET NULL'))  # NULL = no encontrado
+    tipo_documento = db.Column(db.String(10))
+    monto = db.Column(db.Numeric(12, 2))
+    run_id = db.Column(db.BigInteger, db.ForeignKey('conciliacion_runs.id', ondelete='SET NULL'))  # Run que lo agregó
+    created_at = db.Column(db.DateTime(timezone=True), default=func.now())
+
+    def __repr__(self):
+        return f'<ConciliacionBspDocumento {self.periodo} {self.clave} {self.folio}>'
+
+
+class Trabajo(db.Model):
+    """Trabajo en segundo plano (cola en PostgreSQL; lo ejecuta flask procesar-trabajos)"""
+    __tablename__ = 'trabajos'
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)  # 'conciliar_bsp', 'conciliar_volaris', 'conciliar_viva'
+    estatus = db.Column(db.String(20), nullable=False, default='pendiente')  # pendiente, en_proceso, completado, error
+    parametros = db.Column(db.JSON, nullable=False, default=dict)
+    progreso = db.Column(db.JSON, nullable=False, default=dict)  # Lo actualiza el worker mientras corre
+    resultado = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    worker = db.Column(db.String(100))
+    usuario_id = db.Column(db.BigInteger, db.ForeignKey('usuarios.id'))
+    created_at = db.Column(db.DateTime(timezone=True), default=func.now())
+    iniciado_at = db.Column(db.DateTime(timezone=True))
+    actualizado_at = db.Column(db.DateTime(timezone=True))  # Último avance guardado (heartbeat del worker)
+    terminado_at = db.Column(db.DateTime(timezone=True))
+
+    usuario = db.relationship('Usuario', foreign_keys=[usuario_id])
+
+    @property
+    def terminado(self):
+        return self.estatus in ('completado', 'error')
+
+    def __repr__(self):
+        return f'<Trabajo {self.id} {self.tipo} {self.estatus}>'
+
+
 # ============================================================
 
 # Funciones auxiliares
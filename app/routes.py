@@ -7,12 +7,29 @@ from .models import (
     db, Usuario, Rol, Papeleta, Desglose, Empresa, Aerolinea, EmpresaBooking, 
     CargoServicio, Descuento, TarifaFija, Sucursal, TarjetaCorporativa, Autorizacion,
     TarjetaUsuario, AuditLog, ReporteVenta, DetalleReporteVenta, EntregaCorte, 
-    DetalleArqueo, HistorialEntrega, crear_entrega_desde_reporte, Notificacion
+    DetalleArqueo, HistorialEntrega, crear_entrega_desde_reporte, Notificacion, ConciliacionRun, Trabajo
 )
 from datetime import datetime, timedelta, date
 from sqlalchemy import func
 from collections import OrderedDict
 from functools import wraps
+from .services.logs import obtener_logger, span
+from .services.expedientes import consultar_expedientes, desgloses_por_clave, normalizar_pnr
+from .services.busqueda import filtro_busqueda, buscar_global
+from .services.conciliacion_bsp import normalizar_numero_boleto
+from .services.conciliacion_runs import consultar_lineas, RESULTADOS as RESULTADOS_CONCILIACION
+from .services.conciliacion import AEROLINEA_VOLARIS, AEROLINEA_VIVA
+from .services.trabajos import encolar, directorio_trabajos
+from .services.exportaciones import (
+    respuesta_exportacion, filas_papeletas, filas_reportes, COLUMNAS_PAPELETAS, COLUMNAS_REPORTES
+)
+from .services.reportes_ventas import (
+    aplicar_delta, valores_linea, linea_papeleta, agregar_papeletas,
+    filtro_papeletas_disponibles, generar_folio, generar_reporte_dia,
+    categoria_tarjeta, clase_forma_pago, conteo_por_estatus, pagina_reportes
+)
+
+log = obtener_logger('routes')
 
 
 # Importar servicio de notificaciones (con manejo de error si no existe aún)
@@ -104,7 +121,7 @@ def dashboard():
         if current_user.rol in ['director', 'administrador', 'admin']:
             context['autorizaciones_pendientes'] = Autorizacion.query.filter_by(estatus='pendiente').count()
     except Exception as e:
-        print(f"Error autorizaciones: {e}")
+        log.warning("Error autorizaciones: %s", e)
         db.session.rollback()
     
     try:
@@ -114,7 +131,7 @@ def dashboard():
             Papeleta.fecha_venta == fecha_hoy
         ).count()
     except Exception as e:
-        print(f"Error mis_papeletas_hoy: {e}")
+        log.warning("Error mis_papeletas_hoy: %s", e)
         db.session.rollback()
     
     try:
@@ -124,21 +141,18 @@ def dashboard():
         ).scalar()
         context['mi_total_hoy'] = float(mi_total or 0)
     except Exception as e:
-        print(f"Error mi_total_hoy: {e}")
+        log.warning("Error mi_total_hoy: %s", e)
         db.session.rollback()
     
     try:
         mi_efectivo = db.session.query(func.sum(Papeleta.total)).filter(
             Papeleta.usuario_id == current_user.id,
             Papeleta.fecha_venta == fecha_hoy,
-            db.or_(
-                Papeleta.forma_pago.ilike('%contado%'),
-                Papeleta.forma_pago.ilike('%efectivo%')
-            )
+            Papeleta.forma_pago_clase == 'efectivo'
         ).scalar()
         context['mi_efectivo_hoy'] = float(mi_efectivo or 0)
     except Exception as e:
-        print(f"Error mi_efectivo_hoy: {e}")
+        log.warning("Error mi_efectivo_hoy: %s", e)
         db.session.rollback()
     
     try:
@@ -165,10 +179,10 @@ def dashboard():
         context['papeletas_urgentes'] = len([p for p in mis_pendientes if p.dias > 3])
         context['mi_efectivo_pendiente'] = sum([
             float(p.total or 0) for p in mis_pendientes 
-            if p.forma_pago and ('contado' in p.forma_pago.lower() or 'efectivo' in p.forma_pago.lower())
+            if p.forma_pago_clase == 'efectivo'
         ])
     except Exception as e:
-        print(f"Error papeletas pendientes: {e}")
+        log.warning("Error papeletas pendientes: %s", e)
         db.session.rollback()
     
     try:
@@ -179,7 +193,7 @@ def dashboard():
             ReporteVenta.fecha >= primer_dia_mes
         ).count()
     except Exception as e:
-        print(f"Error reportes mes: {e}")
+        log.warning("Error reportes mes: %s", e)
         db.session.rollback()
     
     # ============================================================
@@ -199,7 +213,7 @@ def dashboard():
                 )
             ).count()
         except Exception as e:
-            print(f"Error total pendientes: {e}")
+            log.warning("Error total pendientes: %s", e)
             db.session.rollback()
         
         try:
@@ -208,15 +222,11 @@ def dashboard():
                 Papeleta.fecha_venta < fecha_hoy,
                 Papeleta.fecha_venta >= fecha_hoy - timedelta(days=30),
                 Papeleta.reporte_venta_id.is_(None),
-                db.or_(
-                    Papeleta.forma_pago.ilike('%contado%'),
-                    Papeleta.forma_pago.ilike('%efectivo%'),
-                    Papeleta.forma_pago == 'Contado'
-                )
+                Papeleta.forma_pago_clase == 'efectivo'
             ).scalar()
             context['total_efectivo_pendiente'] = float(total_efec or 0)
         except Exception as e:
-            print(f"Error total efectivo: {e}")
+            log.warning("Error total efectivo: %s", e)
             db.session.rollback()
         
         try:
@@ -228,7 +238,7 @@ def dashboard():
                 EntregaCorte.estatus.in_(['pendiente', 'entregado', 'en_custodia'])
             ).order_by(EntregaCorte.fecha.desc()).limit(5).all()
         except Exception as e:
-            print(f"Error entregas: {e}")
+            log.warning("Error entregas: %s", e)
             db.session.rollback()
         
         try:
@@ -236,7 +246,7 @@ def dashboard():
                 ReporteVenta.estatus == 'enviado'
             ).count()
         except Exception as e:
-            print(f"Error reportes revisar: {e}")
+            log.warning("Error reportes revisar: %s", e)
             db.session.rollback()
         
         try:
@@ -251,15 +261,11 @@ def dashboard():
             
             efec_hoy = db.session.query(func.sum(Papeleta.total)).filter(
                 Papeleta.fecha_venta == fecha_hoy,
-                db.or_(
-                    Papeleta.forma_pago.ilike('%contado%'),
-                    Papeleta.forma_pago.ilike('%efectivo%'),
-                    Papeleta.forma_pago == 'Contado'
-                )
+                Papeleta.forma_pago_clase == 'efectivo'
             ).scalar()
             context['total_efectivo_hoy'] = float(efec_hoy or 0)
         except Exception as e:
-            print(f"Error papeletas hoy: {e}")
+            log.warning("Error papeletas hoy: %s", e)
             db.session.rollback()
         
         try:
@@ -300,11 +306,7 @@ def dashboard():
                         Papeleta.fecha_venta < fecha_hoy,
                         Papeleta.fecha_venta >= fecha_hoy - timedelta(days=30),
                         Papeleta.reporte_venta_id.is_(None),
-                        db.or_(
-                            Papeleta.forma_pago.ilike('%contado%'),
-                            Papeleta.forma_pago.ilike('%efectivo%'),
-                            Papeleta.forma_pago == 'Contado'
-                        )
+                        Papeleta.forma_pago_clase == 'efectivo'
                     ).scalar()
                     
                     resumen.append({
@@ -320,7 +322,7 @@ def dashboard():
             resumen.sort(key=lambda x: (-x['pendientes'], x['agente']))
             context['resumen_agentes'] = resumen
         except Exception as e:
-            print(f"Error resumen agentes: {e}")
+            log.warning("Error resumen agentes: %s", e)
             db.session.rollback()
         
         # ============================================================
@@ -333,7 +335,7 @@ def dashboard():
                 Papeleta.numero_factura.is_(None)
             ).count()
         except Exception as e:
-            print(f"Error papeletas facturacion: {e}")
+            log.warning("Error papeletas facturacion: %s", e)
             db.session.rollback()
             context['papeletas_facturacion_pendientes'] = 0
         
@@ -355,7 +357,7 @@ def dashboard():
             ).count()
             context['desgloses_bsp_pendientes'] = desgloses_bsp
         except Exception as e:
-            print(f"Error desgloses BSP: {e}")
+            log.warning("Error desgloses BSP: %s", e)
             db.session.rollback()
             context['desgloses_bsp_pendientes'] = 0
         
@@ -371,7 +373,7 @@ def dashboard():
                 Desglose.fecha_emision == fecha_hoy
             ).count()
         except Exception as e:
-            print(f"Error desgloses hoy: {e}")
+            log.warning("Error desgloses hoy: %s", e)
             context['desgloses_hoy'] = 0
         
         try:
@@ -380,7 +382,7 @@ def dashboard():
                 Papeleta.numero_factura.isnot(None)
             ).order_by(Papeleta.fecha_facturacion.desc()).limit(5).all()
         except Exception as e:
-            print(f"Error ultimas facturas: {e}")
+            log.warning("Error ultimas facturas: %s", e)
             context['ultimas_facturas'] = []
 
     # Papeletas pendientes del usuario
@@ -958,7 +960,7 @@ def nueva_tarjeta():
         
         sucursal_id = request.form.get('sucursal_id')
         nueva = TarjetaCorporativa(
-            numero_tarjeta=numero, nombre_tarjeta=nombre,
+            numero_tarjeta=numero, nombre_tarjeta=nombre, categoria=categoria_tarjeta(nombre),
             banco=request.form.get('banco', '').strip() or None,
             titular=request.form.get('titular', '').strip() or None,
             sucursal_id=int(sucursal_id) if sucursal_id else None,
@@ -988,6 +990,7 @@ def editar_tarjeta(id):
         try:
             tarjeta.numero_tarjeta = request.form.get('numero_tarjeta', '').strip()
             tarjeta.nombre_tarjeta = request.form.get('nombre_tarjeta', '').strip()
+            tarjeta.categoria = categoria_tarjeta(tarjeta.nombre_tarjeta)
             tarjeta.banco = request.form.get('banco', '').strip() or None
             tarjeta.titular = request.form.get('titular', '').strip() or None
             sucursal_id = request.form.get('sucursal_id')
@@ -1098,10 +1101,10 @@ def solicitar_autorizacion():
             else:
                 flash(f'Solicitud enviada para tarjeta {tarjeta.nombre_tarjeta}.', 'success')
                 if resultado['errores']:
-                    print(f"Errores de notificación: {resultado['errores']}")
+                    log.warning("Errores de notificación: %s", resultado['errores'])
         except Exception as notif_error:
             # Si falla la notificación, no afecta la solicitud
-            print(f"Error enviando notificación: {notif_error}")
+            log.warning("Error enviando notificación: %s", notif_error)
             flash(f'Solicitud enviada para tarjeta {tarjeta.nombre_tarjeta}.', 'success')
         
     except Exception as e:
@@ -1145,7 +1148,7 @@ def responder_autorizacion(id):
                 autorizacion, db, Notificacion
             )
         except Exception as notif_error:
-            print(f"Error enviando notificación de respuesta: {notif_error}")
+            log.warning("Error enviando notificación de respuesta: %s", notif_error)
             
     except Exception as e:
         db.session.rollback()
@@ -1367,14 +1370,8 @@ def facturacion():
         Desglose.estatus_facturacion.in_(['facturada', 'aprobada', 'rechazada'])
     ).order_by(Desglose.fecha_facturacion.desc()).limit(50).all()
     
-    # Obtener desgloses para vincular con papeletas
-    desgloses = Desglose.query.all()
-    desgloses_dict = {}
-    for d in desgloses:
-        if d.clave_sabre:
-            desgloses_dict[d.clave_sabre] = d
-        if d.clave_reserva:
-            desgloses_dict[d.clave_reserva] = d
+    # Desgloses vinculados a las papeletas pendientes (vía tabla expedientes)
+    desgloses_dict = desgloses_por_clave(p.clave_sabre for p in papeletas_pendientes)
     
     return render_template('facturacion.html',
                            papeletas_pendientes=papeletas_pendientes,
@@ -1641,14 +1638,8 @@ def revision_facturas():
         Papeleta.fecha_aprobacion >= hoy_inicio
     ).count()
     
-    # Obtener desgloses para el modal
-    desgloses = Desglose.query.all()
-    desgloses_dict = {}
-    for d in desgloses:
-        if d.clave_sabre:
-            desgloses_dict[d.clave_sabre] = d
-        if d.clave_reserva:
-            desgloses_dict[d.clave_reserva] = d
+    # Desgloses para el modal (vía tabla expedientes)
+    desgloses_dict = desgloses_por_clave(p.clave_sabre for p in pendientes)
     
     return render_template('revision_facturas.html',
                            pendientes=pendientes,
@@ -1729,16 +1720,55 @@ def rechazar_factura(id):
 # RUTAS DE PAPELETAS
 # =============================================================================
 
+def _base_consulta_papeletas():
+    """Papeletas que ve el usuario: todas (admin), las de su sucursal (gerente) o las suyas"""
+    if current_user.es_admin():
+        return Papeleta.query
+    if current_user.es_gerente_o_superior():
+        return Papeleta.query.filter_by(sucursal_id=current_user.sucursal_id)
+    return Papeleta.query.filter_by(usuario_id=current_user.id)
+
+
+def _filtrar_consulta_papeletas(query, filtros):
+    """
+    Los filtros de la consulta de papeletas (que la página aplica en el
+    navegador): tarjeta, desde, hasta, buscar (folio, cliente o aerolínea) y
+    factura ('facturada' / 'pendiente').
+    """
+    tarjeta = filtros.get('tarjeta', '').strip()
+    if tarjeta:
+        # Misma tarjeta que agrupa la página: la del catálogo o el texto legacy
+        query = query.filter(db.or_(
+            Papeleta.tarjeta_id.in_(db.select(TarjetaCorporativa.id).filter_by(numero_tarjeta=tarjeta)),
+            db.and_(Papeleta.tarjeta_id.is_(None), Papeleta.tarjeta == tarjeta)
+        ))
+    desde = _fecha_filtro(filtros.get('desde'))
+    if desde:
+        query = query.filter(Papeleta.fecha_venta >= desde)
+    hasta = _fecha_filtro(filtros.get('hasta'))
+    if hasta:
+        query = query.filter(Papeleta.fecha_venta <= hasta)
+    buscar = filtros.get('buscar', '').strip()
+    if buscar:
+        patron = f'%{buscar}%'
+        query = query.filter(db.or_(
+            Papeleta.folio.ilike(patron),
+            Papeleta.facturar_a.ilike(patron),
+            Papeleta.aerolinea.has(Aerolinea.nombre.ilike(patron))
+        ))
+    factura = filtros.get('factura')
+    if factura == 'facturada':
+        query = query.filter(Papeleta.numero_factura.isnot(None), Papeleta.numero_factura != '')
+    elif factura == 'pendiente':
+        query = query.filter(db.or_(Papeleta.numero_factura.is_(None), Papeleta.numero_factura == ''))
+    return query
+
+
 @main.route('/papeletas', methods=['GET'])
 @login_required
 def consulta_papeletas():
     """Muestra la lista de papeletas agrupadas por tarjeta."""
-    if current_user.es_admin():
-        papeletas_list = Papeleta.query.order_by(Papeleta.tarjeta, Papeleta.fecha_venta.desc()).all()
-    elif current_user.es_gerente_o_superior():
-        papeletas_list = Papeleta.query.filter_by(sucursal_id=current_user.sucursal_id).order_by(Papeleta.tarjeta, Papeleta.fecha_venta.desc()).all()
-    else:
-        papeletas_list = Papeleta.query.filter_by(usuario_id=current_user.id).order_by(Papeleta.tarjeta, Papeleta.fecha_venta.desc()).all()
+    papeletas_list = _base_consulta_papeletas().order_by(Papeleta.tarjeta, Papeleta.fecha_venta.desc()).all()
     
     papeletas_por_tarjeta = OrderedDict()
     
@@ -1797,7 +1827,7 @@ def consulta_papeletas():
     
     # Efectivo pendiente
     efectivo_pendiente = sum([float(p.total or 0) for p in sin_reportar_list 
-                              if p.forma_pago and 'efectivo' in p.forma_pago.lower()])
+                              if p.forma_pago_clase == 'efectivo'])
     
     return render_template('consulta_papeletas.html', 
         papeletas_por_tarjeta=papeletas_por_tarjeta,
@@ -1814,6 +1844,17 @@ def consulta_papeletas():
         fecha_actual=fecha_hoy)
 
 
+@main.route('/papeletas/exportar')
+@login_required
+def exportar_papeletas():
+    """Papeletas de la consulta (mismos filtros) en CSV o Excel, generadas mientras se descargan"""
+    query = _filtrar_consulta_papeletas(_base_consulta_papeletas(), request.args)
+    return respuesta_exportacion(
+        f'papeletas_{fecha_mexico():%Y%m%d}', request.args.get('formato'),
+        COLUMNAS_PAPELETAS, filas_papeletas(query)
+    )
+
+
 @main.route('/papeletas/nueva', methods=['GET'])
 @login_required
 def nueva_papeleta_form():
@@ -1981,10 +2022,12 @@ def nueva_papeleta_post():
             fecha_venta=fecha_venta, total_ticket=float(request.form.get('total_ticket', 0)),
             diez_porciento=float(request.form.get('diez_porciento', 0)), cargo=float(request.form.get('cargo', 0)),
             total=float(request.form.get('total', 0)), facturar_a=facturar_a_nombre,
-            solicito=request.form.get('solicito', ''), clave_sabre=request.form.get('clave_sabre', ''),
-            clave_reserva=request.form.get('clave_reserva', '').strip().upper() or None,
+            solicito=request.form.get('solicito', ''), clave_sabre=normalizar_pnr(request.form.get('clave_sabre')) or '',
+            clave_reserva=normalizar_pnr(request.form.get('clave_reserva')),
             pasajero_nombre=request.form.get('pasajero_nombre', '').strip().upper() or None,
-            forma_pago=request.form.get('forma_pago', ''), empresa_id=empresa_id, aerolinea_id=aerolinea_id,
+            forma_pago=request.form.get('forma_pago', ''),
+            forma_pago_clase=clase_forma_pago(request.form.get('forma_pago')),
+            empresa_id=empresa_id, aerolinea_id=aerolinea_id,
             usuario_id=current_user.id, autorizacion_id=autorizacion_id, sucursal_id=current_user.sucursal_id,
             tipo_cargo=request.form.get('tipo_cargo', ''), proveedor=request.form.get('proveedor', ''),
             extemporanea=es_extemporanea, fecha_cargo_real=fecha_cargo_real, motivo_extemporanea=motivo_extemporanea,
@@ -2048,9 +2091,10 @@ def editar_papeleta(id):
             papeleta.total = float(request.form.get('total', 0))
             papeleta.solicito = request.form.get('solicito', '')
             papeleta.pasajero_nombre = request.form.get('pasajero_nombre', '').strip().upper() or None
-            papeleta.clave_sabre = request.form.get('clave_sabre', '')
-            papeleta.clave_reserva = request.form.get('clave_reserva', '').strip().upper() or None
+            papeleta.clave_sabre = normalizar_pnr(request.form.get('clave_sabre')) or ''
+            papeleta.clave_reserva = normalizar_pnr(request.form.get('clave_reserva'))
             papeleta.forma_pago = request.form.get('forma_pago', '')
+            papeleta.forma_pago_clase = clase_forma_pago(papeleta.forma_pago)
             
             empresa_id = request.form.get('facturar_a')
             if empresa_id:
@@ -2215,7 +2259,7 @@ def consulta_desgloses():
     if empresa_id:
         query = query.filter(Desglose.empresa_id == empresa_id)
     if clave:
-        query = query.filter(Desglose.clave_reserva.ilike(f'%{clave}%'))
+        query = query.filter(filtro_busqueda('desgloses', clave))
     if estatus:
         query = query.filter(Desglose.estatus == estatus)
     
@@ -2268,6 +2312,16 @@ def editar_desglose(folio):
     desglose = Desglose.query.get_or_404(folio)
     if request.method == 'POST':
         try:
+            numero_boleto = request.form.get('numero_boleto', '').strip() or None
+            aerolinea = Aerolinea.query.get(int(request.form.get('aerolinea_id')))
+            numero_boleto_norm = normalizar_numero_boleto(numero_boleto, aerolinea.codigo_iata if aerolinea else None)
+            duplicado = numero_boleto_norm and Desglose.query.filter(
+                Desglose.numero_boleto_norm == numero_boleto_norm,
+                Desglose.folio != desglose.folio
+            ).first()
+            if duplicado:
+                raise ValueError(f'El boleto {numero_boleto} ya está registrado en el desglose {duplicado.folio}')
+            
             desglose.empresa_id = int(request.form.get('empresa_id'))
             desglose.aerolinea_id = int(request.form.get('aerolinea_id'))
             desglose.tarifa_base = float(request.form.get('tarifa_base') or 0)
@@ -2277,10 +2331,11 @@ def editar_desglose(folio):
             desglose.otros_cargos = float(request.form.get('otros_cargos') or 0)
             desglose.cargo_por_servicio = float(request.form.get('cargo_por_servicio') or 0)
             desglose.total = float(request.form.get('total') or 0)
-            desglose.clave_reserva = request.form.get('clave_reserva')
+            desglose.clave_reserva = normalizar_pnr(request.form.get('clave_reserva')) or ''
             desglose.pasajero_nombre = request.form.get('pasajero_nombre') or None
             desglose.ruta = request.form.get('ruta') or None
-            desglose.numero_boleto = request.form.get('numero_boleto', '').strip() or None
+            desglose.numero_boleto = numero_boleto
+            desglose.numero_boleto_norm = numero_boleto_norm
             db.session.commit()
             flash(f'Desglose {desglose.folio} actualizado con éxito.', 'success')
             return redirect(url_for('main.consulta_desgloses'))
@@ -2316,215 +2371,106 @@ def eliminar_desglose(folio):
 def expedientes():
     """
     Vista de expedientes - Agrupa documentos por clave de reservación.
-    Un expediente es una vista virtual que muestra todos los documentos
-    relacionados con una misma clave de reservación (desglose, papeleta, factura).
+    Cada expediente es un renglón de la tabla materializada `expedientes`, que
+    reúne los documentos de una misma clave de reservación (desglose, papeleta, factura).
     
     Permisos:
-    - Agente: Solo expedientes que él creó (sus propios desgloses y papeletas)
+    - Agente: Solo expedientes con documentos que él creó
     - Gerente: Todos los de su sucursal
     - Director/Admin/Facturación: Todos
     """
-    from datetime import date
-    
     # Filtros
     q = request.args.get('q', '').strip().upper()
     estatus = request.args.get('estatus', '')
     empresa_id = request.args.get('empresa_id', '')
     fecha_desde = request.args.get('fecha_desde', '')
     fecha_hasta = request.args.get('fecha_hasta', '')
+    pagina = request.args.get('pagina', 1, type=int)
     
     # Determinar nivel de permisos
-    rol_usuario = current_user.rol_relacion.nombre if current_user.rol_relacion else current_user.rol
-    roles_ver_todo = ['administrador', 'admin', 'director', 'facturacion', 'gerente']
-    
-    puede_ver_todo = rol_usuario in roles_ver_todo
-    
-    # Query base para desgloses
-    query_desgloses = db.session.query(
-        Desglose.clave_reserva,
-        Desglose.clave_sabre,
-        Desglose.folio,
-        Desglose.pasajero_nombre,
-        Desglose.ruta,
-        Desglose.total,
-        Desglose.fecha_emision,
-        Desglose.empresa_id,
-        Desglose.aerolinea_id,
-        Desglose.numero_boleto,
-        Desglose.numero_factura,
-        Desglose.sucursal_id,
-        Desglose.usuario_id
-    )
-    
-    # Query base para papeletas
-    query_papeletas = db.session.query(
-        Papeleta.clave_sabre,
-        Papeleta.id,
-        Papeleta.folio,
-        Papeleta.facturar_a,
-        Papeleta.total,
-        Papeleta.fecha_venta,
-        Papeleta.empresa_id,
-        Papeleta.aerolinea_id,
-        Papeleta.numero_factura,
-        Papeleta.sucursal_id,
-        Papeleta.usuario_id
-    )
-    
-    # Aplicar filtros según rol
-    if puede_ver_todo:
-        # Admin/Director/Facturación/Gerente: Ve todos
-        pass
-    else:
-        # Agente: Solo ve los que él creó
-        query_desgloses = query_desgloses.filter(Desglose.usuario_id == current_user.id)
-        query_papeletas = query_papeletas.filter(Papeleta.usuario_id == current_user.id)
-    
-    claves_desgloses = query_desgloses.all()
-    claves_papeletas = query_papeletas.all()
-    
-    # Crear diccionario de expedientes
-    expedientes_dict = {}
-    
-    # Procesar desgloses — agrupar por clave_sabre (vínculo con papeleta)
-    for d in claves_desgloses:
-        clave = (d.clave_sabre or d.clave_reserva or '').upper() or 'SIN-CLAVE'
-        if clave not in expedientes_dict:
-            expedientes_dict[clave] = {
-                'clave': clave,
-                'pasajero': d.pasajero_nombre or 'Sin nombre',
-                'ruta': d.ruta,
-                'total': float(d.total or 0),
-                'fecha': d.fecha_emision,
-                'empresa_id': d.empresa_id,
-                'empresa': None,
-                'aerolinea_id': d.aerolinea_id,
-                'aerolinea': None,
-                'desglose': d,
-                'papeleta': None,
-                'factura': d.numero_factura,  # Número de factura real (no boleto)
-                'es_lowcost': False,
-                'es_facturacion': True
-            }
-        else:
-            # Actualizar con datos del desglose si ya existe
-            expedientes_dict[clave]['desglose'] = d
-            if d.pasajero_nombre:
-                expedientes_dict[clave]['pasajero'] = d.pasajero_nombre
-            if d.ruta:
-                expedientes_dict[clave]['ruta'] = d.ruta
-            if d.total:
-                expedientes_dict[clave]['total'] = max(expedientes_dict[clave]['total'], float(d.total))
-    
-    # Procesar papeletas
-    for p in claves_papeletas:
-        clave = p.clave_sabre.upper() if p.clave_sabre else 'SIN-CLAVE'
-        if clave not in expedientes_dict:
-            expedientes_dict[clave] = {
-                'clave': clave,
-                'pasajero': p.facturar_a or 'Sin nombre',
-                'ruta': None,
-                'total': float(p.total or 0),
-                'fecha': p.fecha_venta,
-                'empresa_id': p.empresa_id,
-                'empresa': None,
-                'aerolinea_id': p.aerolinea_id,
-                'aerolinea': None,
-                'desglose': None,
-                'papeleta': p,
-                'factura': p.numero_factura,
-                'es_lowcost': True,
-                'es_facturacion': True
-            }
-        else:
-            # Vincular papeleta al expediente existente
-            expedientes_dict[clave]['papeleta'] = p
-            expedientes_dict[clave]['es_lowcost'] = True
-            if p.numero_factura:
-                expedientes_dict[clave]['factura'] = p.numero_factura
-            if not expedientes_dict[clave]['fecha'] and p.fecha_venta:
-                expedientes_dict[clave]['fecha'] = p.fecha_venta
-    
-    # Obtener nombres de empresas y aerolíneas
-    empresas_dict = {e.id: e.nombre_empresa for e in Empresa.query.all()}
-    aerolineas_dict = {a.id: a.nombre for a in Aerolinea.query.all()}
-    
-    # Crear lista de expedientes con datos completos
-    expedientes_list = []
-    for clave, exp in expedientes_dict.items():
-        # Obtener nombres
-        exp['empresa'] = empresas_dict.get(exp['empresa_id'], '')
-        exp['aerolinea'] = aerolineas_dict.get(exp['aerolinea_id'], 'Sin aerolínea')
-        
-        # Determinar requisitos
-        exp['requiere_desglose'] = exp['es_facturacion']
-        exp['requiere_papeleta'] = exp['es_lowcost']
-        exp['requiere_factura'] = exp['es_facturacion']
-        
-        # Calcular progreso
-        docs_requeridos = 0
-        docs_completos = 0
-        
-        if exp['requiere_desglose']:
-            docs_requeridos += 1
-            if exp['desglose']:
-                docs_completos += 1
-        
-        if exp['requiere_papeleta']:
-            docs_requeridos += 1
-            if exp['papeleta']:
-                docs_completos += 1
-        
-        if exp['requiere_factura']:
-            docs_requeridos += 1
-            if exp['factura']:
-                docs_completos += 1
-        
-        exp['docs_requeridos'] = docs_requeridos if docs_requeridos > 0 else 1
-        exp['docs_completos'] = docs_completos
-        exp['progreso'] = int((docs_completos / exp['docs_requeridos']) * 100) if exp['docs_requeridos'] > 0 else 0
-        exp['completo'] = docs_completos >= docs_requeridos and docs_requeridos > 0
-        
-        expedientes_list.append(exp)
-    
-    # Aplicar filtros
-    if q:
-        expedientes_list = [e for e in expedientes_list if q in e['clave'] or q in (e['pasajero'] or '').upper()]
+    puede_ver_todo = _puede_ver_todos_los_documentos()
     
-    if estatus == 'completo':
-        expedientes_list = [e for e in expedientes_list if e['completo']]
-    elif estatus == 'pendiente':
-        expedientes_list = [e for e in expedientes_list if not e['completo']]
+    try:
+        fecha_desde_dt = datetime.strptime(fecha_desde, '%Y-%m-%d').date() if fecha_desde else None
+        fecha_hasta_dt = datetime.strptime(fecha_hasta, '%Y-%m-%d').date() if fecha_hasta else None
+    except ValueError:
+        fecha_desde_dt = fecha_hasta_dt = None
+    
+    # Agrupación, completitud, filtros y paginación se resuelven en SQL
+    with span('expedientes.consulta'):
+        resultado = consultar_expedientes(
+            hoy=fecha_mexico(),
+            usuario_id=None if puede_ver_todo else current_user.id,
+            q=q,
+            estatus=estatus,
+            empresa_id=int(empresa_id) if empresa_id.isdigit() else None,
+            fecha_desde=fecha_desde_dt,
+            fecha_hasta=fecha_hasta_dt,
+            pagina=pagina
+        )
     
-    if empresa_id:
-        expedientes_list = [e for e in expedientes_list if e['empresa_id'] == int(empresa_id)]
+    # Empresas para filtro
+    empresas_filtro = Empresa.query.filter_by(activa=True).order_by(Empresa.nombre_empresa).all()
     
-    if fecha_desde:
-        fecha_desde_dt = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
-        expedientes_list = [e for e in expedientes_list if e['fecha'] and e['fecha'] >= fecha_desde_dt]
+    return render_template('expedientes.html',
+                           expedientes=resultado['expedientes'],
+                           stats=resultado['stats'],
+                           pagina=resultado['pagina'],
+                           total_paginas=resultado['total_paginas'],
+                           empresas=empresas_filtro)
+
+
+def _puede_ver_todos_los_documentos():
+    """True si el rol ve desgloses/papeletas de todos los agentes (no solo los suyos)"""
+    rol_usuario = current_user.rol_relacion.nombre if current_user.rol_relacion else current_user.rol
+    return rol_usuario in ['administrador', 'admin', 'director', 'facturacion', 'gerente']
+
+
+# =============================================================================
+# BÚSQUEDA GLOBAL
+# =============================================================================
+
+@main.route('/api/buscar')
+@login_required
+def api_buscar():
+    """Busca en desgloses, papeletas y expedientes; resultados mezclados por relevancia"""
+    termino = request.args.get('q', '').strip()
+    limite = min(max(request.args.get('limite', 20, type=int), 1), 100)
+    tipos = [t for t in request.args.get('tipos', '').split(',') if t in ('desgloses', 'papeletas', 'expedientes')]
     
-    if fecha_hasta:
-        fecha_hasta_dt = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
-        expedientes_list = [e for e in expedientes_list if e['fecha'] and e['fecha'] <= fecha_hasta_dt]
+    if len(termino) < 2:
+        return jsonify({'success': True, 'modo': None, 'resultados': []})
     
-    # Ordenar por fecha más reciente
-    expedientes_list.sort(key=lambda x: x['fecha'] or date.min, reverse=True)
+    try:
+        with span('busqueda.global', termino_len=len(termino)):
+            modo, filas = buscar_global(
+                termino,
+                usuario_id=None if _puede_ver_todos_los_documentos() else current_user.id,
+                limite=limite,
+                entidades=tipos or None
+            )
+    except Exception as e:
+        db.session.rollback()
+        log.exception('Error en búsqueda global')
+        return jsonify({'success': False, 'error': str(e)}), 500
     
-    # Estadísticas
-    hoy = fecha_mexico()
-    stats = {
-        'completos': len([e for e in expedientes_list if e['completo']]),
-        'pendientes': len([e for e in expedientes_list if not e['completo']]),
-        'hoy': len([e for e in expedientes_list if e['fecha'] == hoy])
+    urls = {
+        'desglose': lambda f: url_for('main.editar_desglose', folio=int(f['id'])),
+        'papeleta': lambda f: url_for('main.editar_papeleta', id=int(f['id'])),
+        'expediente': lambda f: url_for('main.expedientes', q=f['clave']),
     }
+    resultados = [{
+        'tipo': f['tipo'],
+        'id': f['id'],
+        'clave': f['clave'],
+        'titulo': f['titulo'],
+        'detalle': f['detalle'],
+        'fecha': f['fecha'].strftime('%d/%m/%Y') if f['fecha'] else None,
+        'score': round(float(f['score'] or 0), 3),
+        'url': urls[f['tipo']](f),
+    } for f in filas]
     
-    # Empresas para filtro
-    empresas_filtro = Empresa.query.filter_by(activa=True).order_by(Empresa.nombre_empresa).all()
-    
-    return render_template('expedientes.html',
-                           expedientes=expedientes_list,
-                           stats=stats,
-                           empresas=empresas_filtro)
+    return jsonify({'success': True, 'modo': modo, 'resultados': resultados})
 
 
 # =============================================================================
@@ -2967,43 +2913,21 @@ def eliminar_archivo_papeleta(id):
 # CONSULTA DE REPORTES DE VENTAS
 # =============================================================================
 
-def _generar_folio_reporte():
-    """Genera folio automático RV-YYYY-NNNN"""
-    from datetime import date
-    anio = date.today().year
-    ultimo = ReporteVenta.query.filter(
-        ReporteVenta.folio.like(f'RV-{anio}-%')
-    ).order_by(ReporteVenta.folio.desc()).first()
+def _filtrar_reportes_ventas(filtros, con_estatus=True):
+    """Reportes del listado: los del usuario (todos si es admin), por desde, hasta y estatus"""
+    query = ReporteVenta.query
     
-    if ultimo and ultimo.folio:
-        try:
-            num = int(ultimo.folio.split('-')[-1]) + 1
-        except (ValueError, IndexError):
-            num = 1
-    else:
-        num = 1
-    return f'RV-{anio}-{num:04d}'
-
-
-def _recalcular_totales_reporte(reporte):
-    """Recalcula todos los totales del reporte sumando sus detalles"""
-    detalles = reporte.detalles.all()
-    
-    reporte.total_bsp = sum(float(d.monto_bsp or 0) for d in detalles)
-    reporte.total_volaris = sum(float(d.monto_volaris or 0) for d in detalles)
-    reporte.total_vivaerobus = sum(float(d.monto_vivaerobus or 0) for d in detalles)
-    reporte.total_compra_tc = sum(float(d.monto_compra_tc or 0) for d in detalles)
-    reporte.total_cargo_expedicion = sum(float(d.cargo_expedicion or 0) for d in detalles)
-    reporte.total_cargo_315 = sum(float(d.cargo_315 or 0) for d in detalles)
-    reporte.total_seguros = sum(float(d.monto_seguros or 0) for d in detalles)
-    reporte.total_hoteles_paquetes = sum(float(d.monto_hoteles_paquetes or 0) for d in detalles)
-    reporte.total_transporte_terrestre = sum(float(d.monto_transporte_terrestre or 0) for d in detalles)
-    reporte.total_pago_directo_tc = sum(float(d.pago_directo_tc or 0) for d in detalles)
-    reporte.total_voucher_tc = sum(float(d.voucher_tc or 0) for d in detalles)
-    reporte.total_efectivo = sum(float(d.efectivo or 0) for d in detalles)
-    reporte.total_general = sum(float(d.total_linea or 0) for d in detalles)
-    reporte.total_boletos = sum(int(d.num_boletos or 0) for d in detalles)
-    reporte.total_recibos = len(detalles)
+    # Si no es admin, solo ver sus reportes
+    if not current_user.es_admin():
+        query = query.filter_by(usuario_id=current_user.id)
+    
+    if filtros.get('desde'):
+        query = query.filter(ReporteVenta.fecha >= filtros['desde'])
+    if filtros.get('hasta'):
+        query = query.filter(ReporteVenta.fecha <= filtros['hasta'])
+    if con_estatus and filtros.get('estatus'):
+        query = query.filter_by(estatus=filtros['estatus'])
+    return query
 
 
 @main.route('/reportes-ventas')
@@ -3015,22 +2939,39 @@ def reportes_ventas():
     fecha_hasta = request.args.get('hasta')
     estatus = request.args.get('estatus')
     
-    query = ReporteVenta.query
+    query = _filtrar_reportes_ventas(request.args, con_estatus=False)
     
-    # Si no es admin, solo ver sus reportes
-    if not current_user.es_admin():
-        query = query.filter_by(usuario_id=current_user.id)
+    # Conteo por estatus con los demás filtros (barra de estatus)
+    conteos = conteo_por_estatus(query)
     
-    if fecha_desde:
-        query = query.filter(ReporteVenta.fecha >= fecha_desde)
-    if fecha_hasta:
-        query = query.filter(ReporteVenta.fecha <= fecha_hasta)
     if estatus:
         query = query.filter_by(estatus=estatus)
     
-    reportes = query.order_by(ReporteVenta.fecha.desc(), ReporteVenta.id.desc()).all()
+    reportes, cursor_anterior, cursor_siguiente = pagina_reportes(
+        query, despues=request.args.get('despues'), antes=request.args.get('antes')
+    )
+    
+    # Filtros actuales para los enlaces de estatus y de página
+    filtros = {k: v for k, v in (('desde', fecha_desde), ('hasta', fecha_hasta), ('estatus', estatus)) if v}
     
-    return render_template('reportes_ventas/lista.html', reportes=reportes)
+    return render_template('reportes_ventas/lista.html',
+        reportes=reportes,
+        conteos=conteos,
+        total_reportes=sum(conteos.values()),
+        filtros=filtros,
+        cursor_anterior=cursor_anterior,
+        cursor_siguiente=cursor_siguiente
+    )
+
+
+@main.route('/reportes-ventas/exportar')
+@login_required
+def exportar_reportes_ventas():
+    """Reportes del listado (mismos filtros) en CSV o Excel, generados mientras se descargan"""
+    return respuesta_exportacion(
+        f'reportes_ventas_{fecha_mexico():%Y%m%d}', request.args.get('formato'),
+        COLUMNAS_REPORTES, filas_reportes(_filtrar_reportes_ventas(request.args))
+    )
 
 
 @main.route('/reportes-ventas/nuevo', methods=['GET', 'POST'])
@@ -3065,7 +3006,7 @@ def nuevo_reporte_venta():
                     return redirect(url_for('main.editar_reporte_venta', id=existente.id))
             
             reporte = ReporteVenta(
-                folio=_generar_folio_reporte(),
+                folio=generar_folio(),
                 fecha=fecha,
                 usuario_id=current_user.id,
                 sucursal_id=current_user.sucursal_id,
@@ -3084,6 +3025,34 @@ def nuevo_reporte_venta():
     return render_template('reportes_ventas/nuevo.html', fecha_hoy=fecha_mexico())
 
 
+@main.route('/reportes-ventas/generar', methods=['POST'])
+@login_required
+def generar_reporte_venta():
+    """Crear (o completar) el reporte del día con todas las papeletas de mostrador disponibles"""
+    try:
+        fecha = request.form.get('fecha')
+        fecha = datetime.strptime(fecha, '%Y-%m-%d').date() if fecha else fecha_mexico()
+        
+        reporte, agregadas, creado = generar_reporte_dia(current_user, fecha, request.form.get('notas', ''))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al generar reporte: {str(e)}', 'danger')
+        return redirect(url_for('main.nuevo_reporte_venta'))
+    
+    if not reporte:
+        flash(f'No hay papeletas de mostrador pendientes al {fecha.strftime("%d/%m/%Y")}.', 'warning')
+        return redirect(url_for('main.nuevo_reporte_venta'))
+    
+    if creado:
+        flash(f'Reporte {reporte.folio} generado con {agregadas} papeletas.', 'success')
+    elif agregadas:
+        flash(f'Se agregaron {agregadas} papeletas al reporte {reporte.folio}.', 'success')
+    else:
+        flash(f'El reporte {reporte.folio} ya tiene todas las papeletas disponibles.', 'info')
+    return redirect(url_for('main.editar_reporte_venta', id=reporte.id))
+
+
 @main.route('/reportes-ventas/<int:id>')
 @login_required
 def ver_reporte_venta(id):
@@ -3097,16 +3066,10 @@ def ver_reporte_venta(id):
     
     detalles = reporte.detalles.order_by(DetalleReporteVenta.orden).all()
     
-    # Contar boletos por aerolínea
-    boletos_aerolinea = db.session.query(
-        DetalleReporteVenta.clave_aerolinea,
-        func.sum(DetalleReporteVenta.num_boletos)
-    ).filter_by(reporte_id=id).group_by(DetalleReporteVenta.clave_aerolinea).all()
-    
     return render_template('reportes_ventas/ver.html', 
                           reporte=reporte, 
                           detalles=detalles,
-                          boletos_aerolinea=dict(boletos_aerolinea))
+                          boletos_aerolinea=reporte.boletos_aerolinea or {})
 
 
 @main.route('/reportes-ventas/<int:id>/editar', methods=['GET', 'POST'])
@@ -3141,19 +3104,9 @@ def editar_reporte_venta(id):
             db.session.rollback()
             flash(f'Error al actualizar: {str(e)}', 'danger')
     
-    # Obtener papeletas de MOSTRADOR del usuario que no están en ningún reporte
-    # Solo mostrador = sin empresa asignada o facturar_a = 'MOSTRADOR'
-    fecha_limite = reporte.fecha - timedelta(days=30)
-    
+    # Papeletas de MOSTRADOR del usuario que no están en ningún reporte
     papeletas_disponibles = Papeleta.query.filter(
-        Papeleta.usuario_id == reporte.usuario_id,
-        Papeleta.reporte_venta_id.is_(None),
-        Papeleta.fecha_venta >= fecha_limite,
-        Papeleta.fecha_venta <= reporte.fecha,
-        db.or_(
-            Papeleta.empresa_id.is_(None),
-            Papeleta.facturar_a.ilike('%MOSTRADOR%')
-        )
+        *filtro_papeletas_disponibles(reporte.usuario_id, reporte.fecha)
     ).order_by(Papeleta.fecha_venta.desc(), Papeleta.id).all()
     
     # Papeletas ya agregadas
@@ -3357,13 +3310,10 @@ def agregar_linea_reporte(id):
             if papeleta:
                 papeleta.reporte_venta_id = id
         
-        # Recalcular totales del reporte
-        _recalcular_totales_reporte(reporte)
+        # Sumar la línea a los totales del reporte (se recargan en el commit)
+        aplicar_delta(id, nuevo=valores_linea(detalle))
         db.session.commit()
         
-        # Recargar reporte para obtener totales actualizados
-        db.session.refresh(reporte)
-        
         return jsonify({
             'success': True,
             'detalle_id': detalle.id,
@@ -3403,106 +3353,17 @@ def agregar_papeleta_reporte(id):
         return jsonify({'success': False, 'error': 'Papeleta ya está en otro reporte'}), 400
     
     try:
-        # Determinar clave de aerolínea
-        clave_aerolinea = ''
-        nombre_aerolinea = ''
-        if papeleta.aerolinea:
-            clave_aerolinea = papeleta.aerolinea.codigo_iata or papeleta.aerolinea.nombre[:2].upper()
-            nombre_aerolinea = (papeleta.aerolinea.nombre or '').upper()
-        
-        # Obtener nombre de la tarjeta corporativa usada
-        nombre_tarjeta = (papeleta.tarjeta or '').upper()
-        if papeleta.tarjeta_rel:
-            nombre_tarjeta = (papeleta.tarjeta_rel.nombre_tarjeta or '').upper()
-        
-        # Forma de pago del cliente
-        forma_pago = (papeleta.forma_pago or '').lower()
-        total_ticket = float(papeleta.total_ticket or 0)
-        total = float(papeleta.total or 0)
-        
-        # Inicializar montos
-        monto_volaris = 0
-        monto_vivaerobus = 0
-        monto_compra_tc = 0
-        voucher_tc = 0
-        efectivo = 0
-        pago_directo_tc = 0
-        
-        # ============================================================
-        # CLASIFICACIÓN POR TARJETA CORPORATIVA USADA
-        # ============================================================
-        # - CREDITO VOLARIS (CVOL) → Columna Volaris
-        # - CREDITO VIVAAEROBUS (CVIV) → Columna VivaAerobus  
-        # - Otras tarjetas (VISA, MASTER, INVEX, etc.) → Columna Compra TC
-        # ============================================================
-        
-        es_tarjeta_volaris = (
-            'VOLARIS' in nombre_tarjeta or 
-            'CVOL' in nombre_tarjeta or
-            nombre_tarjeta.startswith('CREDITO VOL')
-        )
-        
-        es_tarjeta_vivaerobus = (
-            'VIVA' in nombre_tarjeta or 
-            'CVIV' in nombre_tarjeta or
-            nombre_tarjeta.startswith('CREDITO VIV')
-        )
-        
-        # Determinar si el cliente pagó en efectivo o con voucher
-        es_pago_efectivo = (
-            'efectivo' in forma_pago or 
-            'depósito' in forma_pago or 
-            'deposito' in forma_pago or
-            'transferencia' in forma_pago or
-            'contado' in forma_pago
-        )
-        
-        # Clasificar según la tarjeta corporativa
-        if es_tarjeta_volaris:
-            monto_volaris = total_ticket
-        elif es_tarjeta_vivaerobus:
-            monto_vivaerobus = total_ticket
-        else:
-            # Cualquier otra tarjeta va a Compra TC
-            monto_compra_tc = total_ticket
-        
-        # El total va a efectivo o voucher según cómo pagó el cliente
-        if es_pago_efectivo:
-            efectivo = total
-        else:
-            voucher_tc = total
-        
         max_orden = db.session.query(func.max(DetalleReporteVenta.orden)).filter_by(reporte_id=id).scalar() or 0
         
-        detalle = DetalleReporteVenta(
-            reporte_id=id,
-            papeleta_id=papeleta_id,
-            clave_aerolinea=clave_aerolinea,
-            num_boletos=1,
-            reserva=papeleta.clave_reserva or papeleta.clave_sabre or '',
-            num_recibo='',
-            num_papeleta=papeleta.folio,
-            monto_volaris=monto_volaris,
-            monto_vivaerobus=monto_vivaerobus,
-            monto_compra_tc=monto_compra_tc,
-            cargo_expedicion=float(papeleta.cargo or 0),
-            cargo_315=float(papeleta.diez_porciento or 0),
-            voucher_tc=voucher_tc,
-            efectivo=efectivo,
-            pago_directo_tc=pago_directo_tc,
-            total_linea=total,
-            orden=max_orden + 1
-        )
+        detalle = DetalleReporteVenta(reporte_id=id, orden=max_orden + 1, **linea_papeleta(papeleta))
         
         db.session.add(detalle)
         papeleta.reporte_venta_id = id
         
-        # Recalcular totales del reporte
-        _recalcular_totales_reporte(reporte)
+        # Sumar la línea a los totales del reporte (se recargan en el commit)
+        aplicar_delta(id, nuevo=valores_linea(detalle))
         db.session.commit()
         
-        db.session.refresh(reporte)
-        
         return jsonify({
             'success': True,
             'detalle_id': detalle.id,
@@ -3519,6 +3380,50 @@ def agregar_papeleta_reporte(id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+
+@main.route('/api/reporte-venta/<int:id>/agregar-papeletas', methods=['POST'])
+@login_required
+def agregar_papeletas_reporte(id):
+    """
+    Agregar varias papeletas al reporte en una sola operación.
+
+    Ver agregar_papeletas(): un UPDATE toma las que no están en ningún
+    reporte, un INSERT de varios renglones agrega las líneas y los totales
+    se recalculan una vez. Las que ya estaban en un reporte se regresan como
+    omitidas.
+    """
+    reporte = ReporteVenta.query.get_or_404(id)
+    
+    if not reporte.puede_editar:
+        return jsonify({'success': False, 'error': 'Reporte no editable'}), 400
+    
+    data = request.get_json() or {}
+    papeleta_ids = list(dict.fromkeys(int(i) for i in data.get('papeleta_ids') or [] if str(i).isdigit()))
+    
+    if not papeleta_ids:
+        return jsonify({'success': False, 'error': 'Papeletas no especificadas'}), 400
+    
+    try:
+        tomadas = agregar_papeletas(id, Papeleta.id.in_(papeleta_ids))
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'agregadas': len(tomadas),
+            'omitidas': [pid for pid in papeleta_ids if pid not in tomadas],
+            'totales': {
+                'total_general': float(reporte.total_general or 0),
+                'total_efectivo': float(reporte.total_efectivo or 0),
+                'total_voucher_tc': float(reporte.total_voucher_tc or 0),
+                'total_boletos': reporte.total_boletos,
+                'total_recibos': reporte.total_recibos
+            }
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @main.route('/api/reporte-venta/detalle/<int:detalle_id>', methods=['PUT', 'DELETE'])
 @login_required
 def modificar_detalle_reporte(detalle_id):
@@ -3537,10 +3442,9 @@ def modificar_detalle_reporte(detalle_id):
                 if papeleta:
                     papeleta.reporte_venta_id = None
             
+            # Restar la línea de los totales del reporte
+            aplicar_delta(reporte.id, anterior=valores_linea(detalle))
             db.session.delete(detalle)
-            
-            # Recalcular totales del reporte
-            _recalcular_totales_reporte(reporte)
             db.session.commit()
             
             return jsonify({
@@ -3560,6 +3464,7 @@ def modificar_detalle_reporte(detalle_id):
     elif request.method == 'PUT':
         data = request.get_json()
         try:
+            anterior = valores_linea(detalle)
             detalle.clave_aerolinea = data.get('clave_aerolinea', detalle.clave_aerolinea)
             detalle.num_boletos = int(data.get('num_boletos', detalle.num_boletos))
             detalle.reserva = data.get('reserva', detalle.reserva)
@@ -3578,8 +3483,8 @@ def modificar_detalle_reporte(detalle_id):
             detalle.efectivo = float(data.get('efectivo', detalle.efectivo))
             detalle.total_linea = float(data.get('total_linea', detalle.total_linea))
             
-            # Recalcular totales del reporte
-            _recalcular_totales_reporte(reporte)
+            # Aplicar a los totales la diferencia entre la línea anterior y la nueva
+            aplicar_delta(reporte.id, anterior=anterior, nuevo=valores_linea(detalle))
             db.session.commit()
             
             return jsonify({
@@ -3603,12 +3508,6 @@ def obtener_totales_reporte(id):
     """Obtener totales actualizados del reporte"""
     reporte = ReporteVenta.query.get_or_404(id)
     
-    # Contar boletos por aerolínea
-    boletos_aerolinea = db.session.query(
-        DetalleReporteVenta.clave_aerolinea,
-        func.sum(DetalleReporteVenta.num_boletos)
-    ).filter_by(reporte_id=id).group_by(DetalleReporteVenta.clave_aerolinea).all()
-    
     return jsonify({
         'success': True,
         'totales': {
@@ -3628,7 +3527,7 @@ def obtener_totales_reporte(id):
             'total_boletos': reporte.total_boletos,
             'total_recibos': reporte.total_recibos
         },
-        'boletos_aerolinea': {k: int(v) for k, v in boletos_aerolinea if k}
+        'boletos_aerolinea': reporte.boletos_aerolinea or {}
     })
 
 
@@ -4135,7 +4034,7 @@ def control_papeletas():
     
     # Efectivo pendiente (sin reportar y forma de pago efectivo)
     efectivo_pendiente = sum([float(p.total or 0) for p in sin_reportar_list 
-                              if p.forma_pago and 'efectivo' in p.forma_pago.lower()])
+                              if p.forma_pago_clase == 'efectivo'])
     
     return render_template('control_papeletas.html',
         papeletas=papeletas,
@@ -4189,7 +4088,7 @@ def api_papeleta_detalle_control(id):
                 })
         except Exception as e:
             # Si no existe la tabla de historial aún
-            print(f"Error historial: {e}")
+            log.warning("Error historial: %s", e)
             historial = [{'accion': 'creada', 'usuario': papeleta.usuario.nombre if papeleta.usuario else '-', 
                           'fecha': papeleta.created_at.strftime('%d/%m/%Y %H:%M') if papeleta.created_at else ''}]
         
@@ -4215,7 +4114,7 @@ def api_papeleta_detalle_control(id):
         })
     except Exception as e:
         db.session.rollback()
-        print(f"Error api_papeleta_detalle_control: {e}")
+        log.warning("Error api_papeleta_detalle_control: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -4581,28 +4480,20 @@ def api_empresa_esquema(id):
 @login_required
 def guardar_desglose_calculadora():
     """Guarda un desglose desde la calculadora"""
-    from flask import current_app
     from werkzeug.utils import secure_filename
-    import sys
     import os
     
-    # Debug: imprimir datos recibidos
-    current_app.logger.info("=== DATOS DEL FORMULARIO ===")
-    print("=== DATOS DEL FORMULARIO ===", file=sys.stderr)
-    for key, value in request.form.items():
-        current_app.logger.info(f"{key}: {value}")
-        print(f"{key}: {value}", file=sys.stderr)
-    print("============================", file=sys.stderr)
+    log.debug('formulario desglose', extra={'campos': {'form': request.form.to_dict()}})
     
     try:
-        ultimo_folio = db.session.query(func.max(Desglose.folio)).scalar() or 0
+        with span('desglose.siguiente_folio'):
+            ultimo_folio = db.session.query(func.max(Desglose.folio)).scalar() or 0
         nuevo_folio = ultimo_folio + 1
-        print(f"Nuevo folio: {nuevo_folio}", file=sys.stderr)
         
         # Validar campos requeridos
         empresa_id = request.form.get('empresa_id')
         aerolinea_id = request.form.get('aerolinea_id')
-        clave_reserva = request.form.get('clave_reserva', '').strip()
+        clave_reserva = normalizar_pnr(request.form.get('clave_reserva'))
         
         if not empresa_id:
             return jsonify({'success': False, 'error': 'Empresa es requerida'}), 400
@@ -4611,6 +4502,21 @@ def guardar_desglose_calculadora():
         if not clave_reserva:
             return jsonify({'success': False, 'error': 'Clave de reservación es requerida'}), 400
         
+        # Número de boleto canónico (13 dígitos) para la conciliación BSP
+        numero_boleto = request.form.get('numero_boleto', '').strip() or None
+        aerolinea = Aerolinea.query.get(int(aerolinea_id))
+        try:
+            numero_boleto_norm = normalizar_numero_boleto(numero_boleto, aerolinea.codigo_iata if aerolinea else None)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        if numero_boleto_norm:
+            duplicado = Desglose.query.filter_by(numero_boleto_norm=numero_boleto_norm).first()
+            if duplicado:
+                return jsonify({
+                    'success': False,
+                    'error': f'El boleto {numero_boleto} ya está registrado en el desglose {duplicado.folio}'
+                }), 400
+        
         # Obtener empresa_booking_id automáticamente (usar el primero disponible)
         empresa_booking = EmpresaBooking.query.first()
         if not empresa_booking:
@@ -4618,39 +4524,26 @@ def guardar_desglose_calculadora():
         
         # Procesar archivo de boleto BSP si se subió
         archivo_boleto_nombre = None
-        print(f"=== DEBUG ARCHIVO ===", file=sys.stderr)
-        print(f"request.files keys: {list(request.files.keys())}", file=sys.stderr)
-        if 'archivo_boleto' in request.files:
-            archivo = request.files['archivo_boleto']
-            print(f"archivo.filename: '{archivo.filename}'", file=sys.stderr)
-            print(f"archivo.content_length: {archivo.content_length}", file=sys.stderr)
-            if archivo and archivo.filename:
-                # Validar extensión
-                ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
-                extension = archivo.filename.rsplit('.', 1)[1].lower() if '.' in archivo.filename else ''
+        archivo = request.files.get('archivo_boleto')
+        if archivo and archivo.filename:
+            # Validar extensión
+            ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
+            extension = archivo.filename.rsplit('.', 1)[1].lower() if '.' in archivo.filename else ''
+            
+            if extension in ALLOWED_EXTENSIONS:
+                # Crear nombre único para el archivo
+                archivo_boleto_nombre = f"bsp_{nuevo_folio}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{extension}"
+                archivo_boleto_nombre = secure_filename(archivo_boleto_nombre)
                 
-                if extension in ALLOWED_EXTENSIONS:
-                    # Crear nombre único para el archivo
-                    archivo_boleto_nombre = f"bsp_{nuevo_folio}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{extension}"
-                    archivo_boleto_nombre = secure_filename(archivo_boleto_nombre)
-                    
-                    # Ruta de guardado
-                    upload_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'uploads', 'boletos')
-                    os.makedirs(upload_folder, exist_ok=True)
-                    
-                    ruta_completa = os.path.join(upload_folder, archivo_boleto_nombre)
+                # Ruta de guardado
+                upload_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'uploads', 'boletos')
+                os.makedirs(upload_folder, exist_ok=True)
+                
+                ruta_completa = os.path.join(upload_folder, archivo_boleto_nombre)
+                with span('desglose.guardar_archivo', folio=nuevo_folio, archivo=archivo_boleto_nombre):
                     archivo.save(ruta_completa)
-                    print(f"Archivo boleto guardado: {archivo_boleto_nombre}", file=sys.stderr)
-                    print(f"Ruta completa: {ruta_completa}", file=sys.stderr)
-                    print(f"Existe: {os.path.exists(ruta_completa)}", file=sys.stderr)
-                else:
-                    print(f"Extension no permitida: '{extension}'", file=sys.stderr)
-        else:
-            print(f"'archivo_boleto' NO está en request.files", file=sys.stderr)
-        
-        print(f"archivo_boleto_nombre final: {archivo_boleto_nombre}", file=sys.stderr)
-        
-        print(f"Creando desglose...", file=sys.stderr)
+            else:
+                log.debug('extensión de boleto no permitida', extra={'campos': {'extension': extension}})
         
         nuevo = Desglose(
             folio=nuevo_folio,
@@ -4665,8 +4558,9 @@ def guardar_desglose_calculadora():
             cargo_por_servicio=float(request.form.get('cargo_por_servicio') or 0),
             total=float(request.form.get('total') or 0),
             clave_reserva=clave_reserva,
-            clave_sabre=request.form.get('clave_sabre') or None,
-            numero_boleto=request.form.get('numero_boleto', '').strip() or None,
+            clave_sabre=normalizar_pnr(request.form.get('clave_sabre')),
+            numero_boleto=numero_boleto,
+            numero_boleto_norm=numero_boleto_norm,
             pasajero_nombre=request.form.get('pasajero_nombre') or None,
             ruta=request.form.get('ruta') or None,
             archivo_boleto=archivo_boleto_nombre,
@@ -4676,11 +4570,10 @@ def guardar_desglose_calculadora():
             fecha_emision=fecha_mexico()
         )
         
-        print(f"Agregando a sesión...", file=sys.stderr)
         db.session.add(nuevo)
-        print(f"Haciendo commit...", file=sys.stderr)
-        db.session.commit()
-        print(f"¡Éxito! Folio: {nuevo_folio}", file=sys.stderr)
+        with span('desglose.commit', folio=nuevo_folio):
+            db.session.commit()
+        log.info('desglose guardado', extra={'campos': {'folio': nuevo_folio, 'usuario_id': current_user.id}})
         
         return jsonify({
             'success': True,
@@ -4690,14 +4583,13 @@ def guardar_desglose_calculadora():
         
     except Exception as e:
         db.session.rollback()
-        import traceback
-        error_detail = traceback.format_exc()
-        print(f"ERROR: {str(e)}", file=sys.stderr)
-        print(f"DETALLE: {error_detail}", file=sys.stderr)
+        log.exception('error al guardar desglose')
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500# ============================================
+        }), 500
+
+# ============================================
 # MÓDULO DE BOLETOS - Listado y Conciliación BSP
 # Agregar estas rutas al final de routes.py
 # ============================================
@@ -4706,14 +4598,60 @@ def guardar_desglose_calculadora():
 # LISTADO DE BOLETOS (DESGLOSES)
 # ============================================================
 
+def _fecha_filtro(valor):
+    """Fecha YYYY-MM-DD de un filtro del listado, o None si viene vacía o mal formada"""
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _contadores_conciliacion(query, modelo):
+    """Total, conciliados y sin conciliar de un listado en una sola consulta"""
+    total, conciliados = query.with_entities(
+        db.func.count(),
+        db.func.count().filter(modelo.conciliada == True),
+    ).one()
+    return {'total': total, 'conciliados': conciliados, 'sin_conciliar': total - conciliados}
+
+
+def _base_boletos():
+    """Boletos del listado: solo aerolíneas BSP"""
+    return Desglose.query.join(Aerolinea).filter(Aerolinea.es_bsp == True)
+
+
+def _filtrar_boletos(query, filtros):
+    """Aplica los filtros del listado de boletos (request.args o los de una acción masiva)"""
+    aerolinea_id = str(filtros.get('aerolinea_id') or '')
+    if aerolinea_id.isdigit():
+        query = query.filter(Desglose.aerolinea_id == int(aerolinea_id))
+    
+    if filtros.get('estatus'):
+        query = query.filter(Desglose.estatus == filtros['estatus'])
+    
+    conciliada = filtros.get('conciliada', '')
+    if conciliada == 'si':
+        query = query.filter(Desglose.conciliada == True)
+    elif conciliada == 'no':
+        query = query.filter(db.or_(Desglose.conciliada == False, Desglose.conciliada.is_(None)))
+    
+    fd = _fecha_filtro(filtros.get('fecha_desde'))
+    if fd:
+        query = query.filter(Desglose.fecha_emision >= fd)
+    fh = _fecha_filtro(filtros.get('fecha_hasta'))
+    if fh:
+        query = query.filter(Desglose.fecha_emision <= fh)
+    
+    buscar = (filtros.get('buscar') or '').strip()
+    if buscar:
+        query = query.filter(filtro_busqueda('desgloses', buscar))
+    return query
+
+
 @main.route('/boletos')
 @login_required
 def listado_boletos():
     """Listado de todos los boletos (desgloses) con filtros"""
-    from datetime import date, timedelta
-    
-    fecha_hoy = fecha_mexico()
-    
     # Parámetros de filtro
     aerolinea_id = request.args.get('aerolinea_id', type=int)
     estatus = request.args.get('estatus', '')  # pendiente, emitido, conciliado
@@ -4724,42 +4662,7 @@ def listado_boletos():
     pagina = request.args.get('pagina', 1, type=int)
     por_pagina = 50
     
-    # Query base - solo aerolíneas BSP
-    query = Desglose.query.join(Aerolinea).filter(Aerolinea.es_bsp == True)
-    
-    # Filtros
-    if aerolinea_id:
-        query = query.filter(Desglose.aerolinea_id == aerolinea_id)
-    
-    if estatus:
-        query = query.filter(Desglose.estatus == estatus)
-    
-    if conciliada == 'si':
-        query = query.filter(Desglose.conciliada == True)
-    elif conciliada == 'no':
-        query = query.filter(db.or_(Desglose.conciliada == False, Desglose.conciliada.is_(None)))
-    
-    if fecha_desde:
-        try:
-            fd = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
-            query = query.filter(Desglose.fecha_emision >= fd)
-        except:
-            pass
-    
-    if fecha_hasta:
-        try:
-            fh = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
-            query = query.filter(Desglose.fecha_emision <= fh)
-        except:
-            pass
-    
-    if buscar:
-        query = query.filter(db.or_(
-            Desglose.numero_boleto.ilike(f'%{buscar}%'),
-            Desglose.pasajero_nombre.ilike(f'%{buscar}%'),
-            Desglose.clave_reserva.ilike(f'%{buscar}%'),
-            Desglose.ruta.ilike(f'%{buscar}%')
-        ))
+    query = _filtrar_boletos(_base_boletos(), request.args)
     
     # Ordenar y paginar
     query = query.order_by(Desglose.fecha_emision.desc(), Desglose.folio.desc())
@@ -4769,9 +4672,7 @@ def listado_boletos():
     total_paginas = (total + por_pagina - 1) // por_pagina
     
     # Stats (solo BSP)
-    total_boletos = Desglose.query.join(Aerolinea).filter(Aerolinea.es_bsp == True).count()
-    total_conciliados = Desglose.query.join(Aerolinea).filter(Aerolinea.es_bsp == True, Desglose.conciliada == True).count()
-    total_sin_conciliar = total_boletos - total_conciliados
+    contadores = _contadores_conciliacion(_base_boletos(), Desglose)
     
     # Aerolíneas para filtro
     aerolineas = Aerolinea.query.filter_by(activa=True, es_bsp=True).order_by(Aerolinea.nombre).all()
@@ -4780,9 +4681,9 @@ def listado_boletos():
         boletos=boletos,
         aerolineas=aerolineas,
         total=total,
-        total_boletos=total_boletos,
-        total_conciliados=total_conciliados,
-        total_sin_conciliar=total_sin_conciliar,
+        total_boletos=contadores['total'],
+        total_conciliados=contadores['conciliados'],
+        total_sin_conciliar=contadores['sin_conciliar'],
         pagina=pagina,
         total_paginas=total_paginas,
         # Filtros actuales
@@ -4795,67 +4696,81 @@ def listado_boletos():
     )
 
 
-@main.route('/boletos/conciliar', methods=['POST'])
-@login_required
-def conciliar_boleto():
-    """Conciliar un boleto individual"""
-    folio = request.form.get('folio', type=int)
-    if not folio:
-        flash('Folio no válido', 'error')
-        return redirect(url_for('main.listado_boletos'))
+def _conciliacion_masiva(modelo, columna_id, base, filtrar, columna_periodo):
+    """
+    Concilia o desconcilia varios registros de un listado con un solo UPDATE.
+
+    El JSON trae accion ('conciliar' o 'desconciliar') y los ids marcados, o
+    todos=true con los filtros del listado. Solo se tocan registros del
+    universo del listado (base) que cambian de estado.
+
+    Returns:
+        JSON con los registros actualizados y los contadores del listado
+    """
+    datos = request.get_json(silent=True) or {}
+    accion = datos.get('accion')
+    if accion not in ('conciliar', 'desconciliar'):
+        return jsonify({'success': False, 'error': 'Acción no válida'}), 400
     
-    desglose = Desglose.query.get(folio)
-    if not desglose:
-        flash('Desglose no encontrado', 'error')
-        return redirect(url_for('main.listado_boletos'))
+    if datos.get('todos'):
+        seleccion = filtrar(base(), datos.get('filtros') or {})
+    else:
+        ids = [int(i) for i in datos.get('ids') or [] if str(i).isdigit()]
+        if not ids:
+            return jsonify({'success': False, 'error': 'No se seleccionó ningún registro'}), 400
+        seleccion = base().filter(columna_id.in_(ids))
+    
+    if accion == 'conciliar':
+        seleccion = seleccion.filter(db.or_(modelo.conciliada == False, modelo.conciliada.is_(None)))
+        valores = {
+            modelo.conciliada: True,
+            modelo.fecha_conciliacion: fecha_mexico(),
+            modelo.conciliada_por_id: current_user.id,
+        }
+    else:
+        seleccion = seleccion.filter(modelo.conciliada == True)
+        valores = {
+            modelo.conciliada: False,
+            modelo.fecha_conciliacion: None,
+            modelo.conciliada_por_id: None,
+            columna_periodo: None,
+        }
     
-    desglose.conciliada = True
-    desglose.fecha_conciliacion = fecha_mexico()
-    desglose.conciliada_por_id = current_user.id
-    db.session.commit()
+    try:
+        actualizados = db.session.query(modelo).filter(
+            columna_id.in_(seleccion.with_entities(columna_id).scalar_subquery())
+        ).update(valores, synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        log.exception('Error en conciliación masiva')
+        return jsonify({'success': False, 'error': str(e)}), 500
     
-    flash(f'Boleto {desglose.numero_boleto or desglose.folio} conciliado correctamente', 'success')
-    return redirect(request.referrer or url_for('main.listado_boletos'))
+    return jsonify({
+        'success': True,
+        'actualizados': actualizados,
+        'contadores': _contadores_conciliacion(base(), modelo),
+    })
 
 
-@main.route('/boletos/desconciliar', methods=['POST'])
+@main.route('/boletos/conciliar-masivo', methods=['POST'])
 @login_required
-def desconciliar_boleto():
-    """Quitar conciliación de un boleto"""
-    folio = request.form.get('folio', type=int)
-    if not folio:
-        flash('Folio no válido', 'error')
-        return redirect(url_for('main.listado_boletos'))
-    
-    desglose = Desglose.query.get(folio)
-    if not desglose:
-        flash('Desglose no encontrado', 'error')
-        return redirect(url_for('main.listado_boletos'))
-    
-    desglose.conciliada = False
-    desglose.fecha_conciliacion = None
-    desglose.conciliada_por_id = None
-    desglose.periodo_bsp = None
-    db.session.commit()
-    
-    flash(f'Conciliación removida para boleto {desglose.numero_boleto or desglose.folio}', 'warning')
-    return redirect(request.referrer or url_for('main.listado_boletos'))
+def conciliar_boletos_masivo():
+    """API: Conciliar / desconciliar los boletos marcados o todos los del filtro"""
+    return _conciliacion_masiva(Desglose, Desglose.folio, _base_boletos, _filtrar_boletos, Desglose.periodo_bsp)
 
 
 # =============================================================================
-# CONCILIACIÓN BSP - Parser PDF + Lógica de conciliación
-# Reemplaza: conciliar_bsp() + _parsear_bsp_txt()
-# Requiere: pip install pdfplumber
+# CONCILIACIÓN BSP
+# El upload encola un trabajo (services/trabajos.py) que corre el worker
+# flask procesar-trabajos; el parser y el cruce están en services/
 # =============================================================================
 
 
 @main.route('/boletos/conciliar-bsp', methods=['POST'])
 @login_required
 def conciliar_bsp():
-    """Subir archivo BSP (PDF o TXT) y conciliar automáticamente"""
-    import tempfile
-    import os
-    
+    """Subir archivo BSP (PDF o TXT); la conciliación corre en segundo plano"""
     archivo = request.files.get('archivo_bsp')
     if not archivo:
         flash('No se seleccionó ningún archivo', 'error')
@@ -4863,318 +4778,234 @@ def conciliar_bsp():
     
     filename = archivo.filename.lower()
     
-    # Determinar tipo de archivo y parsear
     if filename.endswith('.pdf'):
-        # Guardar temporalmente para pdfplumber
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        archivo.save(tmp.name)
-        tmp.close()
-        try:
-            resultado = _parsear_bsp_pdf(tmp.name)
-        finally:
-            os.unlink(tmp.name)
+        formato = 'pdf'
     elif filename.endswith('.txt') or filename.endswith('.csv'):
-        resultado = _parsear_bsp_txt(archivo)
+        formato = 'txt'
     else:
         flash('Formato no soportado. Sube el archivo PDF o TXT del FCAGBILLDET', 'error')
         return redirect(url_for('main.listado_boletos'))
     
-    if not resultado['documentos']:
-        flash('No se encontraron documentos en el archivo', 'error')
+    trabajo = _encolar_conciliacion('conciliar_bsp', archivo, formato)
+    if trabajo is None:
         return redirect(url_for('main.listado_boletos'))
-    
-    # Filtrar CANX (cancelaciones) — no se concilian
-    docs_a_conciliar = [d for d in resultado['documentos'] if d['trnc'] != 'CANX']
-    docs_canx = [d for d in resultado['documentos'] if d['trnc'] == 'CANX']
-    
-    # Cruzar con desgloses
-    encontrados = 0
-    no_encontrados = []
-    ya_conciliados = 0
-    conciliados_ahora = 0
-    conciliados_list = []
-    ya_conciliados_list = []
-    periodo = resultado.get('periodo', '')
-    
-    for doc in docs_a_conciliar:
-        numero_completo = doc['numero_completo']  # Ej: "1395463633094"
-        
-        # Búsqueda principal: numero_boleto exacto
-        desglose = Desglose.query.filter(
-            Desglose.numero_boleto == numero_completo
-        ).first()
-        
-        # Fallback: solo document_number sin prefijo
-        if not desglose:
-            desglose = Desglose.query.filter(
-                Desglose.numero_boleto == doc['document_number']
-            ).first()
-        
-        # Fallback: con guión
-        if not desglose:
-            numero_con_guion = doc['airline_code'] + '-' + doc['document_number']
-            desglose = Desglose.query.filter(
-                Desglose.numero_boleto == numero_con_guion
-            ).first()
-        
-        if desglose:
-            encontrados += 1
-            doc['folio_desglose'] = desglose.folio
-            doc['pasajero'] = desglose.pasajero_nombre or ''
-            if desglose.conciliada:
-                ya_conciliados += 1
-                ya_conciliados_list.append(doc)
-            else:
-                desglose.conciliada = True
-                desglose.fecha_conciliacion = fecha_mexico()
-                desglose.conciliada_por_id = current_user.id
-                desglose.periodo_bsp = periodo
-                conciliados_ahora += 1
-                conciliados_list.append(doc)
-        else:
-            no_encontrados.append(doc)
-    
-    db.session.commit()
-    
-    # Guardar resultados en sesión
-    from flask import session
-    session['bsp_resultado'] = {
-        'total_bsp': len(resultado['documentos']),
-        'total_a_conciliar': len(docs_a_conciliar),
-        'cancelaciones': len(docs_canx),
-        'encontrados': encontrados,
-        'ya_conciliados': ya_conciliados,
-        'conciliados_ahora': conciliados_ahora,
-        'conciliados_list': conciliados_list,
-        'ya_conciliados_list': ya_conciliados_list,
-        'no_encontrados': no_encontrados,
-        'periodo': periodo,
-        'por_tipo': {
-            'TKTT': sum(1 for d in docs_a_conciliar if d['trnc'] == 'TKTT'),
-            'EMDS': sum(1 for d in docs_a_conciliar if d['trnc'] == 'EMDS'),
-            'EMDA': sum(1 for d in docs_a_conciliar if d['trnc'] == 'EMDA'),
-        },
-        'revisados': sum(1 for d in docs_a_conciliar if d.get('es_revisado'))
-    }
-    
-    flash(
-        f'Conciliación BSP completada: {conciliados_ahora} conciliados, '
-        f'{ya_conciliados} ya estaban conciliados, '
-        f'{len(no_encontrados)} no encontrados',
-        'success' if not no_encontrados else 'warning'
-    )
-    
-    return redirect(url_for('main.resultado_conciliacion_bsp'))
+    return _respuesta_trabajo_encolado(trabajo)
 
 
 @main.route('/boletos/resultado-conciliacion')
+@main.route('/boletos/resultado-conciliacion/<int:run_id>')
 @login_required
-def resultado_conciliacion_bsp():
-    """Muestra resultado de la conciliación BSP"""
+def resultado_conciliacion_bsp(run_id=None):
+    """Muestra resultado de una conciliación BSP, paginado y filtrable por sección"""
     from flask import session
-    resultado = session.get('bsp_resultado', {})
-    if not resultado:
-        flash('No hay resultados de conciliación disponibles', 'info')
+    if run_id is None:
+        run_id = session.get('bsp_run_id')
+        if not run_id:
+            flash('No hay resultados de conciliación disponibles', 'info')
+            return redirect(url_for('main.listado_boletos'))
+        return redirect(url_for('main.resultado_conciliacion_bsp', run_id=run_id))
+    
+    run = _obtener_run_conciliacion(run_id, 'bsp')
+    if run is None:
         return redirect(url_for('main.listado_boletos'))
-    return render_template('resultado_conciliacion_bsp.html', resultado=resultado)
-
-
-def _parsear_bsp_pdf(filepath):
-    """Parsear archivo FCAGBILLDET en formato PDF"""
-    import pdfplumber
-    import re
     
-    documentos = []
-    periodo = ''
-    ultimo_doc = None
+    resultado = run.resumen or {}
+    # 'diferencia' = encontrados cuyo monto no coincide con el desglose, de mayor a menor
+    seccion = request.args.get('seccion', '')
+    if seccion not in RESULTADOS_CONCILIACION + ('diferencia',):
+        seccion = 'no_encontrado' if resultado.get('no_encontrados') else 'conciliado'
+    filtro_buscar = request.args.get('buscar', '').strip()
+    filtro_tipo = request.args.get('tipo', '')
+    filtro_scope = request.args.get('scope', '')
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+    por_pagina = 50
     
-    # Regex para línea de documento
-    doc_pattern = re.compile(
-        r'^(\d{3})\s+'                    # CIA (3 dígitos)
-        r'(TKTT|EMDS|EMDA|CANX)\s+'       # TRNC
-        r'(\d{7,10})\s+'                   # NO. DOCUMENTO
-        r'(\d{2}[A-Z]{3}\d{2})\s+'        # FECHA EMISION
-        r'(\S+)\s+'                        # CPN
+    lineas, totales = consultar_lineas(
+        run.id, pagina=pagina, por_pagina=por_pagina,
+        resultado=None if seccion == 'diferencia' else seccion,
+        con_diferencia=seccion == 'diferencia',
+        buscar=filtro_buscar,
+        tipo_documento=filtro_tipo, scope=filtro_scope,
     )
-    
-    rtdn_pattern = re.compile(r'^\+RTDN:\s*(\d{7,10})')
-    periodo_pattern = re.compile(r'Billing Period:(\d{6})')
-    
-    # Líneas a ignorar
-    skip_prefixes = (
-        'ESAC:', 'ISSUES TOTAL', 'FCAGBILLDET', 'SCOPE', 'CIA ', 'NO. DE',
-        '***', 'GRAND TOTAL', 'DOMESTIC TOTAL', 'INTERNATIONAL TOTAL',
-        'ISSUES', 'CA ', 'CC ', '**'
+    total_paginas = (totales['registros'] + por_pagina - 1) // por_pagina
+    
+    return render_template(
+        'resultado_conciliacion_bsp.html',
+        run=run,
+        resultado=resultado,
+        lineas=lineas,
+        totales=totales,
+        seccion=seccion,
+        filtro_buscar=filtro_buscar,
+        filtro_tipo=filtro_tipo,
+        filtro_scope=filtro_scope,
+        pagina=pagina,
+        total_paginas=total_paginas,
     )
-    
-    with pdfplumber.open(filepath) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text()
-            if not text:
-                continue
-            
-            for line in text.split('\n'):
-                line = line.strip()
-                
-                # Extraer periodo
-                pm = periodo_pattern.search(line)
-                if pm:
-                    periodo = pm.group(1)
-                    continue
-                
-                # Detectar +RTDN (revisado/cambio)
-                rm = rtdn_pattern.match(line)
-                if rm and ultimo_doc:
-                    ultimo_doc['rtdn'] = rm.group(1)
-                    ultimo_doc['es_revisado'] = True
-                    continue
-                
-                # Saltar líneas no relevantes
-                if any(line.startswith(p) for p in skip_prefixes) or 'Page :' in line:
-                    continue
-                
-                # Parsear documento
-                dm = doc_pattern.match(line)
-                if not dm:
-                    continue
-                
-                airline_code = dm.group(1)
-                trnc = dm.group(2)
-                document_number = dm.group(3)
-                fecha_emision = dm.group(4)
-                
-                # Extraer montos del resto de la línea
-                rest = line[dm.end():]
-                montos = re.findall(r'-?[\d,]+\.\d{2}', rest)
-                
-                transaction_amount = float(montos[0].replace(',', '')) if montos else 0.0
-                tarifa = float(montos[1].replace(',', '')) if len(montos) >= 2 else 0.0
-                balance_payable = float(montos[-1].replace(',', '')) if montos else 0.0
-                
-                # FOP y Scope
-                fop = 'CA'
-                fop_match = re.search(r'\s[ID]\s+(CA|CC)\s', line)
-                if fop_match:
-                    fop = fop_match.group(1)
-                
-                scope = 'Doméstico'
-                scope_match = re.search(r'\s([ID])\s+(?:CA|CC)\s', line)
-                if scope_match and scope_match.group(1) == 'I':
-                    scope = 'Internacional'
-                
-                doc = {
-                    'airline_code': airline_code,
-                    'trnc': trnc,
-                    'document_number': document_number,
-                    'numero_completo': airline_code + document_number,
-                    'fecha_emision': fecha_emision,
-                    'fop': fop,
-                    'scope': scope,
-                    'transaction_amount': transaction_amount,
-                    'tarifa': tarifa,
-                    'balance_payable': balance_payable,
-                    'es_revisado': False,
-                    'rtdn': None
-                }
-                
-                documentos.append(doc)
-                ultimo_doc = doc
-    
-    return {
-        'periodo': periodo,
-        'documentos': documentos
-    }
 
 
+def _obtener_run_conciliacion(run_id, tipo):
+    """Run de conciliación si existe y el usuario puede verlo (quien concilió o roles de supervisión)"""
+    run = ConciliacionRun.query.filter_by(id=run_id, tipo=tipo).first()
+    if run is None:
+        flash('La conciliación solicitada no existe', 'error')
+        return None
+    if run.usuario_id != current_user.id and not _puede_ver_todos_los_documentos():
+        flash('No tienes permiso para ver esta conciliación', 'error')
+        return None
+    return run
 
-def _parsear_bsp_txt(archivo):
-    """Parsear archivo FCAGBILLDETSIMP (.txt/.csv)"""
-    import csv
-    import io
-    
-    contenido = archivo.read().decode('utf-8', errors='ignore')
-    lineas = contenido.strip().split('\n')
-    
-    resultado = {
-        'periodo': '',
-        'documentos': []
-    }
-    
-    for linea in lineas:
-        linea = linea.strip()
-        
-        # Extraer Agent Code (primera línea)
-        if linea.startswith('Agent Code'):
-            continue
-        
-        # Saltar header
-        if linea.startswith('Airline Code,'):
-            continue
-        
-        # Parsear línea de datos
-        if not linea or linea.startswith('#'):
-            continue
-        
-        campos = linea.split(',')
-        if len(campos) < 8:
-            continue
-        
-        airline_code = campos[0].strip().zfill(3)  # Asegurar 3 dígitos: 001, 006, etc.
-        trnc = campos[1].strip()
-        document_number = campos[2].strip()
-        fop = campos[3].strip()
-        
-        try:
-            transaction_amount = float(campos[4].strip())
-        except:
-            transaction_amount = 0.0
-        
-        try:
-            tax_on_commission = float(campos[5].strip())
-        except:
-            tax_on_commission = 0.0
-        
-        try:
-            balance_payable = float(campos[6].strip())
-        except:
-            balance_payable = 0.0
-        
-        currency = campos[7].strip() if len(campos) > 7 else 'MXN'
-        
-        # Solo incluir TKTT (boletos) y EMD (servicios), ignorar CANX (cancelaciones con monto 0)
-        if trnc == 'CANX':
-            continue
-        
-        resultado['documentos'].append({
-            'airline_code': airline_code,
-            'trnc': trnc,
-            'document_number': document_number,
-            'fop': fop,
-            'transaction_amount': transaction_amount,
-            'tax_on_commission': tax_on_commission,
-            'balance_payable': balance_payable,
-            'currency': currency
-        })
+
+# Página de resultado, clave de sesión del último run y listado de regreso por tipo de trabajo
+_DESTINOS_TRABAJO = {
+    'conciliar_bsp': ('main.resultado_conciliacion_bsp', 'bsp_run_id', 'main.listado_boletos'),
+    'conciliar_volaris': ('main.resultado_conciliacion_volaris', 'volaris_run_id', 'main.listado_papeletas_volaris'),
+    'conciliar_viva': ('main.resultado_conciliacion_viva', 'viva_run_id', 'main.listado_boletos_viva'),
+}
+
+
+def _encolar_conciliacion(tipo, archivo, formato):
+    """Guarda el archivo subido donde lo lee el worker y encola el trabajo de conciliación"""
+    import os
+    import uuid
     
-    # Extraer periodo del nombre del archivo si posible
-    # Formato: FCAGBILLDETSIMP_MX_86506696_260104.txt
+    extension = os.path.splitext(archivo.filename)[1].lower()
+    ruta = os.path.join(directorio_trabajos(), f'{uuid.uuid4().hex}{extension}')
     try:
-        nombre = archivo.filename
-        partes = nombre.replace('.txt', '').replace('.csv', '').split('_')
-        for p in partes:
-            if len(p) == 6 and p.isdigit():
-                resultado['periodo'] = p
-                break
-    except:
-        pass
-    
-    return resultado
+        archivo.save(ruta)
+        trabajo = encolar(tipo, {
+            'ruta': ruta,
+            'nombre_archivo': archivo.filename,
+            'formato': formato,
+            'fecha': fecha_mexico().isoformat(),
+        }, current_user.id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        if os.path.exists(ruta):
+            os.unlink(ruta)
+        log.exception('Error al encolar la conciliación')
+        flash(f'Error al recibir el archivo: {str(e)}', 'error')
+        return None
+    return trabajo
+
+
+def _respuesta_trabajo_encolado(trabajo):
+    """JSON con el id del trabajo para llamadas AJAX; si no, redirige a la página de progreso"""
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({
+            'success': True,
+            'trabajo_id': trabajo.id,
+            'url_progreso': url_for('main.progreso_trabajo', trabajo_id=trabajo.id),
+            'url_estado': url_for('main.api_estado_trabajo', trabajo_id=trabajo.id),
+        })
+    return redirect(url_for('main.progreso_trabajo', trabajo_id=trabajo.id))
+
+
+def _obtener_trabajo(trabajo_id):
+    """Trabajo si existe y el usuario puede verlo (quien lo subió o roles de supervisión)"""
+    trabajo = Trabajo.query.get(trabajo_id)
+    if trabajo is None or trabajo.tipo not in _DESTINOS_TRABAJO:
+        return None
+    if trabajo.usuario_id != current_user.id and not _puede_ver_todos_los_documentos():
+        return None
+    return trabajo
+
+
+@main.route('/conciliacion/trabajos/<int:trabajo_id>')
+@login_required
+def progreso_trabajo(trabajo_id):
+    """Progreso de una conciliación en segundo plano; al terminar lleva al resultado"""
+    from flask import session
+    trabajo = _obtener_trabajo(trabajo_id)
+    if trabajo is None:
+        flash('El trabajo solicitado no existe', 'error')
+        return redirect(url_for('main.index'))
+    
+    endpoint_resultado, clave_sesion, endpoint_listado = _DESTINOS_TRABAJO[trabajo.tipo]
+    if trabajo.estatus == 'completado':
+        resultado = trabajo.resultado or {}
+        session[clave_sesion] = resultado['run_id']
+        if resultado.get('mensaje'):
+            flash(resultado['mensaje'], 'success')
+        return redirect(url_for(endpoint_resultado, run_id=resultado['run_id']))
+    
+    return render_template(
+        'progreso_trabajo.html',
+        trabajo=trabajo,
+        url_listado=url_for(endpoint_listado),
+    )
+
+
+@main.route('/api/trabajos/<int:trabajo_id>')
+@login_required
+def api_estado_trabajo(trabajo_id):
+    """Estado y avance de un trabajo (para la página de progreso)"""
+    trabajo = _obtener_trabajo(trabajo_id)
+    if trabajo is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    
+    progreso = trabajo.progreso or {}
+    respuesta = {
+        'success': True,
+        'id': trabajo.id,
+        'tipo': trabajo.tipo,
+        'estatus': trabajo.estatus,
+        'etapa': progreso.get('etapa', ''),
+        'paginas_leidas': progreso.get('paginas_leidas', 0),
+        'paginas_total': progreso.get('paginas_total', 0),
+        'documentos': progreso.get('documentos', 0),
+        'documentos_cruzados': progreso.get('documentos_cruzados', 0),
+        'encontrados': progreso.get('encontrados', 0),
+        'errores': progreso.get('errores', []),
+        'error': trabajo.error,
+    }
+    if trabajo.estatus == 'completado':
+        endpoint_resultado = _DESTINOS_TRABAJO[trabajo.tipo][0]
+        respuesta['url_resultado'] = url_for(endpoint_resultado, run_id=(trabajo.resultado or {}).get('run_id'))
+    return jsonify(respuesta)
 
 
 # ============================================
 # MÓDULO VOLARIS - Listado y Conciliación
 # ============================================
 
+def _filtrar_papeletas(query, filtros):
+    """Filtros de los listados de papeletas por aerolínea (request.args o los de una acción masiva)"""
+    conciliada = filtros.get('conciliada', '')
+    if conciliada == 'si':
+        query = query.filter(Papeleta.conciliada == True)
+    elif conciliada == 'no':
+        query = query.filter(db.or_(Papeleta.conciliada == False, Papeleta.conciliada.is_(None)))
+    
+    fd = _fecha_filtro(filtros.get('fecha_desde'))
+    if fd:
+        query = query.filter(Papeleta.fecha_venta >= fd)
+    fh = _fecha_filtro(filtros.get('fecha_hasta'))
+    if fh:
+        query = query.filter(Papeleta.fecha_venta <= fh)
+    
+    buscar = (filtros.get('buscar') or '').strip()
+    if buscar:
+        query = query.filter(filtro_busqueda('papeletas', buscar))
+    return query
+
+
+def _base_volaris():
+    """
+    Papeletas de Volaris ya revisadas:
+      - Crédito: factura aprobada (estatus_facturacion = 'aprobada')
+      - Mostrador: incluida en reporte de ventas (reporte_venta_id IS NOT NULL)
+    """
+    return Papeleta.query.join(Aerolinea).filter(
+        Aerolinea.nombre.ilike(AEROLINEA_VOLARIS),
+        db.or_(
+            Papeleta.estatus_facturacion == 'aprobada',
+            Papeleta.reporte_venta_id.isnot(None)
+        )
+    )
+
+
 @main.route('/papeletas-volaris')
 @login_required
 def listado_papeletas_volaris():
@@ -5189,71 +5020,24 @@ def listado_papeletas_volaris():
     pagina = request.args.get('pagina', 1, type=int)
     por_pagina = 50
     
-    # Solo Volaris — únicamente papeletas ya revisadas:
-    #   - Crédito: factura aprobada (estatus_facturacion = 'aprobada')
-    #   - Mostrador: incluida en reporte de ventas (reporte_venta_id IS NOT NULL)
-    query = Papeleta.query.options(
-        db.joinedload(Papeleta.usuario)
-    ).join(Aerolinea).filter(
-        Aerolinea.nombre.ilike('%volaris%'),
-        db.or_(
-            Papeleta.estatus_facturacion == 'aprobada',
-            Papeleta.reporte_venta_id.isnot(None)
-        )
+    query = _filtrar_papeletas(
+        _base_volaris().options(db.joinedload(Papeleta.usuario)), request.args
     )
     
-    if conciliada == 'si':
-        query = query.filter(Papeleta.conciliada == True)
-    elif conciliada == 'no':
-        query = query.filter(db.or_(Papeleta.conciliada == False, Papeleta.conciliada.is_(None)))
-    
-    if fecha_desde:
-        try:
-            fd = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
-            query = query.filter(Papeleta.fecha_venta >= fd)
-        except:
-            pass
-    
-    if fecha_hasta:
-        try:
-            fh = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
-            query = query.filter(Papeleta.fecha_venta <= fh)
-        except:
-            pass
-    
-    if buscar:
-        query = query.filter(db.or_(
-            Papeleta.clave_sabre.ilike(f'%{buscar}%'),
-            Papeleta.clave_reserva.ilike(f'%{buscar}%'),
-            Papeleta.pasajero_nombre.ilike(f'%{buscar}%'),
-            Papeleta.facturar_a.ilike(f'%{buscar}%'),
-            Papeleta.solicito.ilike(f'%{buscar}%'),
-            Papeleta.folio.ilike(f'%{buscar}%')
-        ))
-    
     query = query.order_by(Papeleta.fecha_venta.desc(), Papeleta.id.desc())
     
     total = query.count()
     papeletas = query.offset((pagina - 1) * por_pagina).limit(por_pagina).all()
     total_paginas = (total + por_pagina - 1) // por_pagina
     
-    base_query = Papeleta.query.join(Aerolinea).filter(
-        Aerolinea.nombre.ilike('%volaris%'),
-        db.or_(
-            Papeleta.estatus_facturacion == 'aprobada',
-            Papeleta.reporte_venta_id.isnot(None)
-        )
-    )
-    total_papeletas = base_query.count()
-    total_conciliadas = base_query.filter(Papeleta.conciliada == True).count()
-    total_sin_conciliar = total_papeletas - total_conciliadas
+    contadores = _contadores_conciliacion(_base_volaris(), Papeleta)
     
     return render_template('listado_papeletas_volaris.html',
         papeletas=papeletas,
         total=total,
-        total_papeletas=total_papeletas,
-        total_conciliadas=total_conciliadas,
-        total_sin_conciliar=total_sin_conciliar,
+        total_papeletas=contadores['total'],
+        total_conciliadas=contadores['conciliados'],
+        total_sin_conciliar=contadores['sin_conciliar'],
         pagina=pagina,
         total_paginas=total_paginas,
         filtro_conciliada=conciliada,
@@ -5263,59 +5047,17 @@ def listado_papeletas_volaris():
     )
 
 
-@main.route('/papeletas-volaris/conciliar', methods=['POST'])
+@main.route('/papeletas-volaris/conciliar-masivo', methods=['POST'])
 @login_required
-def conciliar_papeleta_volaris():
-    """Conciliar una papeleta de Volaris manualmente"""
-    papeleta_id = request.form.get('papeleta_id', type=int)
-    if not papeleta_id:
-        flash('ID no válido', 'error')
-        return redirect(url_for('main.listado_papeletas_volaris'))
-    
-    papeleta = Papeleta.query.get(papeleta_id)
-    if not papeleta:
-        flash('Papeleta no encontrada', 'error')
-        return redirect(url_for('main.listado_papeletas_volaris'))
-    
-    papeleta.conciliada = True
-    papeleta.fecha_conciliacion = fecha_mexico()
-    papeleta.conciliada_por_id = current_user.id
-    db.session.commit()
-    
-    flash(f'Papeleta {papeleta.folio} conciliada correctamente', 'success')
-    return redirect(request.referrer or url_for('main.listado_papeletas_volaris'))
-
-
-@main.route('/papeletas-volaris/desconciliar', methods=['POST'])
-@login_required
-def desconciliar_papeleta_volaris():
-    """Quitar conciliación de una papeleta de Volaris"""
-    papeleta_id = request.form.get('papeleta_id', type=int)
-    if not papeleta_id:
-        flash('ID no válido', 'error')
-        return redirect(url_for('main.listado_papeletas_volaris'))
-    
-    papeleta = Papeleta.query.get(papeleta_id)
-    if not papeleta:
-        flash('Papeleta no encontrada', 'error')
-        return redirect(url_for('main.listado_papeletas_volaris'))
-    
-    papeleta.conciliada = False
-    papeleta.fecha_conciliacion = None
-    papeleta.conciliada_por_id = None
-    papeleta.periodo_conciliacion = None
-    db.session.commit()
-    
-    flash(f'Conciliación removida para papeleta {papeleta.folio}', 'warning')
-    return redirect(request.referrer or url_for('main.listado_papeletas_volaris'))
+def conciliar_papeletas_volaris_masivo():
+    """API: Conciliar / desconciliar las papeletas de Volaris marcadas o todas las del filtro"""
+    return _conciliacion_masiva(Papeleta, Papeleta.id, _base_volaris, _filtrar_papeletas, Papeleta.periodo_conciliacion)
 
 
 @main.route('/papeletas-volaris/conciliar-archivo', methods=['POST'])
 @login_required
 def conciliar_volaris():
-    """Subir reporte de ventas de Volaris (.xlsx) y conciliar automáticamente"""
-    import openpyxl
-    
+    """Subir reporte de ventas de Volaris (.xlsx); la conciliación corre en segundo plano"""
     archivo = request.files.get('archivo_volaris')
     if not archivo:
         flash('No se seleccionó ningún archivo', 'error')
@@ -5326,173 +5068,72 @@ def conciliar_volaris():
         flash('Formato no soportado. Sube el archivo Excel (.xlsx) de Volaris', 'error')
         return redirect(url_for('main.listado_papeletas_volaris'))
     
-    try:
-        wb = openpyxl.load_workbook(archivo, data_only=True)
-    except Exception as e:
-        flash(f'Error al leer el archivo: {str(e)}', 'error')
-        return redirect(url_for('main.listado_papeletas_volaris'))
-    
-    documentos = []
-    periodo = ''
-    
-    for ws in wb.worksheets:
-        titulo = ws.cell(row=1, column=1).value or ''
-        if not periodo and titulo:
-            periodo = titulo.replace('REPORTE DE VENTAS DEL ', '').strip()
-        
-        for row_num in range(2, ws.max_row + 1):
-            fecha = ws.cell(row=row_num, column=1).value
-            pnr = ws.cell(row=row_num, column=2).value
-            agente = ws.cell(row=row_num, column=3).value
-            pasajero = ws.cell(row=row_num, column=4).value
-            pago = ws.cell(row=row_num, column=6).value
-            
-            if not pnr or not isinstance(pnr, str) or len(pnr.strip()) < 3:
-                continue
-            
-            pnr = pnr.strip().upper()
-            
-            if pnr.startswith('=') or pnr == 'PNR':
-                continue
-            
-            try:
-                pago_num = float(pago) if pago else 0.0
-            except (ValueError, TypeError):
-                continue
-            
-            documentos.append({
-                'fecha': fecha.strftime('%d/%m/%Y') if hasattr(fecha, 'strftime') else str(fecha or ''),
-                'pnr': pnr,
-                'agente': str(agente or '').strip(),
-                'pasajero': str(pasajero or '').strip(),
-                'pago': pago_num
-            })
-    
-    if not documentos:
-        flash('No se encontraron registros en el archivo', 'error')
+    trabajo = _encolar_conciliacion('conciliar_volaris', archivo, 'xlsx')
+    if trabajo is None:
         return redirect(url_for('main.listado_papeletas_volaris'))
-    
-    encontrados = 0
-    no_encontrados = []
-    ya_conciliados = 0
-    conciliados_ahora = 0
-    con_diferencia_monto = []
-    conciliados_list = []
-    ya_conciliados_list = []
-    
-    for doc in documentos:
-        # Buscar TODAS las papeletas con esta clave_reserva
-        papeletas_found = Papeleta.query.options(
-            db.joinedload(Papeleta.usuario)
-        ).filter(
-            db.func.upper(Papeleta.clave_reserva) == doc['pnr']
-        ).order_by(Papeleta.fecha_venta, Papeleta.id).all()
-        
-        # Fallback: buscar por clave_sabre si no encuentra por clave_reserva
-        if not papeletas_found:
-            papeletas_found = Papeleta.query.options(
-                db.joinedload(Papeleta.usuario)
-            ).filter(
-                db.func.upper(Papeleta.clave_sabre) == doc['pnr']
-            ).order_by(Papeleta.fecha_venta, Papeleta.id).all()
-        
-        if papeletas_found:
-            encontrados += 1
-            
-            # Sumar totales de todas las papeletas con esta clave
-            # Usar total_ticket (no total) porque Volaris reporta el monto del boleto
-            # sin comisión ni cargo de servicio de la agencia
-            monto_sistema = sum(float(p.total_ticket or 0) for p in papeletas_found)
-            monto_volaris = doc['pago']
-            diferencia = round(monto_sistema - monto_volaris, 2)
-            
-            # Datos del primer registro para mostrar
-            primera = papeletas_found[0]
-            folios = ', '.join(p.folio for p in papeletas_found)
-            
-            # Pasajero: preferir pasajero_nombre, luego solicito
-            pasajero_sis = primera.pasajero_nombre or primera.solicito or primera.facturar_a or ''
-            
-            doc_info = {
-                'pnr': doc['pnr'],
-                'fecha': doc['fecha'],
-                'agente_volaris': doc['agente'],
-                'pasajero_volaris': doc['pasajero'],
-                'monto_volaris': monto_volaris,
-                'monto_sistema': monto_sistema,
-                'diferencia': diferencia,
-                'agente_sistema': primera.usuario.nombre if primera.usuario else '',
-                'pasajero_sistema': pasajero_sis,
-                'folio': folios,
-                'clave_reserva': primera.clave_reserva or '',
-                'num_papeletas': len(papeletas_found)
-            }
-            
-            # Verificar si TODAS ya están conciliadas
-            todas_conciliadas = all(p.conciliada for p in papeletas_found)
-            alguna_conciliada = any(p.conciliada for p in papeletas_found)
-            
-            if todas_conciliadas:
-                ya_conciliados += 1
-                ya_conciliados_list.append(doc_info)
-            else:
-                # Conciliar las que falten
-                for p in papeletas_found:
-                    if not p.conciliada:
-                        p.conciliada = True
-                        p.fecha_conciliacion = fecha_mexico()
-                        p.conciliada_por_id = current_user.id
-                        p.periodo_conciliacion = periodo
-                conciliados_ahora += 1
-                conciliados_list.append(doc_info)
-            
-            if abs(diferencia) > 0.01:
-                con_diferencia_monto.append(doc_info)
-        else:
-            no_encontrados.append(doc)
-    
-    db.session.commit()
-    
-    from flask import session
-    session['volaris_resultado'] = {
-        'total_reporte': len(documentos),
-        'encontrados': encontrados,
-        'ya_conciliados': ya_conciliados,
-        'conciliados_ahora': conciliados_ahora,
-        'conciliados_list': conciliados_list,
-        'ya_conciliados_list': ya_conciliados_list,
-        'no_encontrados': no_encontrados,
-        'con_diferencia_monto': con_diferencia_monto,
-        'periodo': periodo
-    }
-    
-    flash(
-        f'Conciliación Volaris completada: {conciliados_ahora} conciliados, '
-        f'{ya_conciliados} ya estaban conciliados, '
-        f'{len(no_encontrados)} no encontrados en el sistema',
-        'success' if not no_encontrados else 'warning'
-    )
-    
-    return redirect(url_for('main.resultado_conciliacion_volaris'))
+    return _respuesta_trabajo_encolado(trabajo)
 
 
 @main.route('/papeletas-volaris/resultado')
+@main.route('/papeletas-volaris/resultado/<int:run_id>')
 @login_required
-def resultado_conciliacion_volaris():
-    """Mostrar resultado de la conciliación Volaris"""
+def resultado_conciliacion_volaris(run_id=None):
+    """Mostrar resultado de una conciliación Volaris, paginado y filtrable por sección"""
     from flask import session
-    resultado = session.pop('volaris_resultado', None)
-    
-    if not resultado:
+    if run_id is None:
+        run_id = session.get('volaris_run_id')
+        if not run_id:
+            return redirect(url_for('main.listado_papeletas_volaris'))
+        return redirect(url_for('main.resultado_conciliacion_volaris', run_id=run_id))
+    
+    run = _obtener_run_conciliacion(run_id, 'volaris')
+    if run is None:
         return redirect(url_for('main.listado_papeletas_volaris'))
     
-    return render_template('resultado_conciliacion_volaris.html', resultado=resultado)
+    resultado = run.resumen or {}
+    # 'diferencia' = encontrados (conciliados o ya conciliados) cuyo monto no coincide
+    seccion = request.args.get('seccion', '')
+    if seccion not in ('conciliado', 'ya_conciliado', 'no_encontrado', 'diferencia'):
+        if resultado.get('con_diferencia_monto'):
+            seccion = 'diferencia'
+        elif resultado.get('no_encontrados'):
+            seccion = 'no_encontrado'
+        else:
+            seccion = 'conciliado'
+    filtro_buscar = request.args.get('buscar', '').strip()
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+    por_pagina = 50
+    
+    lineas, totales = consultar_lineas(
+        run.id, pagina=pagina, por_pagina=por_pagina,
+        resultado=None if seccion == 'diferencia' else seccion,
+        con_diferencia=seccion == 'diferencia',
+        buscar=filtro_buscar,
+    )
+    total_paginas = (totales['registros'] + por_pagina - 1) // por_pagina
+    
+    return render_template(
+        'resultado_conciliacion_volaris.html',
+        run=run,
+        resultado=resultado,
+        lineas=lineas,
+        totales=totales,
+        seccion=seccion,
+        filtro_buscar=filtro_buscar,
+        pagina=pagina,
+        total_paginas=total_paginas,
+    )
 
 
 # ============================================
-# MÓDULO VIVA AEROBUS - Listado y Conciliación Manual
+# MÓDULO VIVA AEROBUS - Listado y Conciliación
 # ============================================
 
+def _base_viva():
+    """Papeletas de Viva Aerobus"""
+    return Papeleta.query.join(Aerolinea).filter(Aerolinea.nombre.ilike(AEROLINEA_VIVA))
+
+
 @main.route('/papeletas-viva')
 @login_required
 def listado_boletos_viva():
@@ -5507,35 +5148,7 @@ def listado_boletos_viva():
     pagina = request.args.get('pagina', 1, type=int)
     por_pagina = 50
     
-    # Solo Viva Aerobus
-    query = Papeleta.query.join(Aerolinea).filter(Aerolinea.nombre.ilike('%viva%'))
-    
-    if conciliada == 'si':
-        query = query.filter(Papeleta.conciliada == True)
-    elif conciliada == 'no':
-        query = query.filter(db.or_(Papeleta.conciliada == False, Papeleta.conciliada.is_(None)))
-    
-    if fecha_desde:
-        try:
-            fd = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
-            query = query.filter(Papeleta.fecha_venta >= fd)
-        except:
-            pass
-    
-    if fecha_hasta:
-        try:
-            fh = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
-            query = query.filter(Papeleta.fecha_venta <= fh)
-        except:
-            pass
-    
-    if buscar:
-        query = query.filter(db.or_(
-            Papeleta.clave_sabre.ilike(f'%{buscar}%'),
-            Papeleta.facturar_a.ilike(f'%{buscar}%'),
-            Papeleta.solicito.ilike(f'%{buscar}%'),
-            Papeleta.folio.ilike(f'%{buscar}%')
-        ))
+    query = _filtrar_papeletas(_base_viva(), request.args)
     
     query = query.order_by(Papeleta.fecha_venta.desc(), Papeleta.id.desc())
     
@@ -5543,17 +5156,14 @@ def listado_boletos_viva():
     papeletas = query.offset((pagina - 1) * por_pagina).limit(por_pagina).all()
     total_paginas = (total + por_pagina - 1) // por_pagina
     
-    base_query = Papeleta.query.join(Aerolinea).filter(Aerolinea.nombre.ilike('%viva%'))
-    total_papeletas = base_query.count()
-    total_conciliadas = base_query.filter(Papeleta.conciliada == True).count()
-    total_sin_conciliar = total_papeletas - total_conciliadas
+    contadores = _contadores_conciliacion(_base_viva(), Papeleta)
     
     return render_template('listado_boletos_viva.html',
         papeletas=papeletas,
         total=total,
-        total_papeletas=total_papeletas,
-        total_conciliadas=total_conciliadas,
-        total_sin_conciliar=total_sin_conciliar,
+        total_papeletas=contadores['total'],
+        total_conciliadas=contadores['conciliados'],
+        total_sin_conciliar=contadores['sin_conciliar'],
         pagina=pagina,
         total_paginas=total_paginas,
         filtro_conciliada=conciliada,
@@ -5563,51 +5173,90 @@ def listado_boletos_viva():
     )
 
 
-@main.route('/papeletas-viva/conciliar', methods=['POST'])
+@main.route('/papeletas-viva/conciliar-masivo', methods=['POST'])
 @login_required
-def conciliar_papeleta_viva():
-    """Conciliar una papeleta de Viva Aerobus"""
-    papeleta_id = request.form.get('papeleta_id', type=int)
-    if not papeleta_id:
-        flash('ID no válido', 'error')
+def conciliar_papeletas_viva_masivo():
+    """API: Conciliar / desconciliar las papeletas de Viva Aerobus marcadas o todas las del filtro"""
+    return _conciliacion_masiva(Papeleta, Papeleta.id, _base_viva, _filtrar_papeletas, Papeleta.periodo_conciliacion)
+
+
+@main.route('/papeletas-viva/conciliar-archivo', methods=['POST'])
+@login_required
+def conciliar_viva():
+    """Subir reporte de ventas o compensaciones de Viva Aerobus (.csv/.xlsx); la conciliación corre en segundo plano"""
+    archivo = request.files.get('archivo_viva')
+    if not archivo:
+        flash('No se seleccionó ningún archivo', 'error')
         return redirect(url_for('main.listado_boletos_viva'))
     
-    papeleta = Papeleta.query.get(papeleta_id)
-    if not papeleta:
-        flash('Papeleta no encontrada', 'error')
+    filename = archivo.filename.lower()
+    if filename.endswith('.csv'):
+        formato = 'csv'
+    elif filename.endswith('.xlsx'):
+        formato = 'xlsx'
+    else:
+        flash('Formato no soportado. Sube el reporte de Viva Aerobus en CSV o Excel (.xlsx)', 'error')
         return redirect(url_for('main.listado_boletos_viva'))
     
-    papeleta.conciliada = True
-    papeleta.fecha_conciliacion = fecha_mexico()
-    papeleta.conciliada_por_id = current_user.id
-    db.session.commit()
-    
-    flash(f'Papeleta {papeleta.folio} conciliada correctamente', 'success')
-    return redirect(request.referrer or url_for('main.listado_boletos_viva'))
+    trabajo = _encolar_conciliacion('conciliar_viva', archivo, formato)
+    if trabajo is None:
+        return redirect(url_for('main.listado_boletos_viva'))
+    return _respuesta_trabajo_encolado(trabajo)
 
 
-@main.route('/papeletas-viva/desconciliar', methods=['POST'])
+@main.route('/papeletas-viva/resultado')
+@main.route('/papeletas-viva/resultado/<int:run_id>')
 @login_required
-def desconciliar_papeleta_viva():
-    """Quitar conciliación de una papeleta de Viva Aerobus"""
-    papeleta_id = request.form.get('papeleta_id', type=int)
-    if not papeleta_id:
-        flash('ID no válido', 'error')
-        return redirect(url_for('main.listado_boletos_viva'))
-    
-    papeleta = Papeleta.query.get(papeleta_id)
-    if not papeleta:
-        flash('Papeleta no encontrada', 'error')
+def resultado_conciliacion_viva(run_id=None):
+    """Mostrar resultado de una conciliación Viva Aerobus, paginado y filtrable por sección"""
+    from flask import session
+    if run_id is None:
+        run_id = session.get('viva_run_id')
+        if not run_id:
+            return redirect(url_for('main.listado_boletos_viva'))
+        return redirect(url_for('main.resultado_conciliacion_viva', run_id=run_id))
+    
+    run = _obtener_run_conciliacion(run_id, 'viva')
+    if run is None:
         return redirect(url_for('main.listado_boletos_viva'))
     
-    papeleta.conciliada = False
-    papeleta.fecha_conciliacion = None
-    papeleta.conciliada_por_id = None
-    papeleta.periodo_conciliacion = None
-    db.session.commit()
+    resultado = run.resumen or {}
+    # 'diferencia' = encontrados cuyo total no coincide con total_ticket;
+    # 'comision' = encontrados cuya compensación no coincide con comision_agencia
+    seccion = request.args.get('seccion', '')
+    if seccion not in ('conciliado', 'ya_conciliado', 'no_encontrado', 'diferencia', 'comision'):
+        if resultado.get('con_diferencia_monto'):
+            seccion = 'diferencia'
+        elif resultado.get('con_diferencia_comision'):
+            seccion = 'comision'
+        elif resultado.get('no_encontrados'):
+            seccion = 'no_encontrado'
+        else:
+            seccion = 'conciliado'
+    filtro_buscar = request.args.get('buscar', '').strip()
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+    por_pagina = 50
     
-    flash(f'Conciliación removida para papeleta {papeleta.folio}', 'warning')
-    return redirect(request.referrer or url_for('main.listado_boletos_viva'))
+    lineas, totales = consultar_lineas(
+        run.id, pagina=pagina, por_pagina=por_pagina,
+        resultado=None if seccion in ('diferencia', 'comision') else seccion,
+        con_diferencia=seccion == 'diferencia',
+        con_diferencia_comision=seccion == 'comision',
+        buscar=filtro_buscar,
+    )
+    total_paginas = (totales['registros'] + por_pagina - 1) // por_pagina
+    
+    return render_template(
+        'resultado_conciliacion_viva.html',
+        run=run,
+        resultado=resultado,
+        lineas=lineas,
+        totales=totales,
+        seccion=seccion,
+        filtro_buscar=filtro_buscar,
+        pagina=pagina,
+        total_paginas=total_paginas,
+    )
 
 # ============================================
 # MÓDULO RESTRICCIÓN DE CRÉDITO
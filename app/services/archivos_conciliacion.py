@@ -0,0 +1,75 @@
+# app/services/archivos_conciliacion.py
+# Caché de archivos de conciliación ya leídos
+#
+# Facturación sube varias veces el mismo FCAGBILLDET o reporte de aerolínea
+# mientras corrige desgloses faltantes. El resultado del parser se guarda en
+# archivos_conciliacion con el hash SHA-256 del contenido, el tipo y la
+# versión del parser; si el archivo vuelve a subirse se usa ese resultado y
+# se pasa directo al cruce. Cambiar la versión del parser invalida la caché.
+
+import hashlib
+
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models import db, ArchivoConciliacion
+from app.services.logs import obtener_logger
+
+log = obtener_logger('conciliacion')
+
+_TAMANO_BLOQUE = 1024 * 1024
+
+
+def hash_archivo(stream):
+    """SHA-256 del contenido de un stream; lo deja otra vez al inicio"""
+    sha = hashlib.sha256()
+    stream.seek(0)
+    for bloque in iter(lambda: stream.read(_TAMANO_BLOQUE), b''):
+        sha.update(bloque)
+    stream.seek(0)
+    return sha.hexdigest()
+
+
+def parsear_con_cache(archivo, tipo, version, parsear, usuario_id=None):
+    """
+    Regresa el resultado del parser para un archivo subido, usando la caché.
+
+    Args:
+        archivo: FileStorage del upload
+        tipo: 'bsp_pdf', 'volaris_xlsx' o 'viva' (el TXT de BSP se lee en stream, sin caché)
+        version: Versión del parser (al cambiarla se vuelve a leer)
+        parsear: Función parsear(archivo) -> {'periodo': ..., 'documentos': [...]}
+        usuario_id: Quién subió el archivo
+
+    Returns:
+        (resultado, desde_cache). El registro nuevo o el contador de usos se
+        guardan con el commit de la conciliación.
+    """
+    hash_sha256 = hash_archivo(archivo.stream)
+
+    cache = ArchivoConciliacion.query.filter_by(
+        hash_sha256=hash_sha256, tipo=tipo, version_parser=version
+    ).first()
+    if cache is not None:
+        cache.usos = (cache.usos or 0) + 1
+        cache.ultimo_uso = db.func.now()
+        log.info('archivo de conciliación en caché', extra={'campos': {
+            'tipo': tipo, 'hash': hash_sha256[:12], 'documentos': cache.total_documentos,
+        }})
+        return cache.resultado, True
+
+    resultado = parsear(archivo)
+
+    # Si otro request guardó el mismo archivo mientras tanto, se conserva el primero
+    if resultado.get('documentos'):
+        db.session.execute(insert(ArchivoConciliacion).values(
+            hash_sha256=hash_sha256,
+            tipo=tipo,
+            version_parser=version,
+            nombre_archivo=(archivo.filename or '')[:255],
+            periodo=resultado.get('periodo') or None,
+            total_documentos=len(resultado['documentos']),
+            resultado=resultado,
+            usuario_id=usuario_id,
+        ).on_conflict_do_nothing(constraint='uq_archivos_conciliacion_hash'))
+
+    return resultado, False
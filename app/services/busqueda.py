@@ -0,0 +1,192 @@
+# app/services/busqueda.py
+# Búsqueda de texto sobre desgloses, papeletas y expedientes
+#
+# Cada entidad tiene un "documento" de búsqueda: sus columnas de texto
+# concatenadas en una sola expresión. El filtro es un ILIKE por palabra sobre
+# esa expresión, que con pg_trgm usa un índice GIN (migracion_busqueda.sql).
+# El ranking de /api/buscar usa word_similarity() cuando pg_trgm está
+# instalado; en PostgreSQL sin extensiones se ordena por coincidencia de clave.
+
+from flask import current_app
+from sqlalchemy import literal_column, text
+
+from app.models import db
+
+# Las expresiones deben ser idénticas a las de los índices para que el
+# planificador los use: coalesce(col, '') || ' | ' || ...
+ENTIDADES = {
+    'desgloses': ('numero_boleto', 'pasajero_nombre', 'clave_reserva', 'clave_sabre', 'ruta'),
+    'papeletas': ('folio', 'clave_sabre', 'clave_reserva', 'pasajero_nombre', 'facturar_a', 'solicito'),
+    'expedientes': ('clave', 'pasajero'),
+}
+
+MODOS = ('trigram', 'basico')
+
+_modo_detectado = None
+
+
+def documento(entidad, alias=None):
+    """Expresión SQL del documento de búsqueda de una entidad"""
+    tabla = alias or entidad
+    return " || ' | ' || ".join(f"coalesce({tabla}.{c}, '')" for c in ENTIDADES[entidad])
+
+
+def palabras(termino):
+    """Divide el término en palabras y las convierte en patrones ILIKE escapados"""
+    patrones = []
+    for palabra in (termino or '').split():
+        palabra = palabra.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        patrones.append(f'%{palabra}%')
+    return patrones
+
+
+def modo_busqueda():
+    """'trigram' si pg_trgm está instalado (o forzado en BUSQUEDA_MODO), si no 'basico'"""
+    global _modo_detectado
+
+    configurado = current_app.config.get('BUSQUEDA_MODO', 'auto')
+    if configurado in MODOS:
+        return configurado
+
+    if _modo_detectado is None:
+        instalada = db.session.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        ).scalar()
+        _modo_detectado = 'trigram' if instalada else 'basico'
+    return _modo_detectado
+
+
+def filtro_busqueda(entidad, termino):
+    """
+    Condición para query.filter(): todas las palabras del término deben
+    aparecer en el documento de la entidad.
+
+    Uso:
+        query = query.filter(filtro_busqueda('desgloses', buscar))
+    """
+    doc = literal_column(documento(entidad))
+    return db.and_(*[doc.ilike(p) for p in palabras(termino)])
+
+
+def condicion_sql(entidad, termino, params, alias=None, prefijo='busqueda'):
+    """
+    Igual que filtro_busqueda() pero como fragmento de SQL crudo; agrega los
+    parámetros a params. Retorna '' si el término está vacío.
+    """
+    doc = documento(entidad, alias)
+    condiciones = []
+    for i, patron in enumerate(palabras(termino)):
+        nombre = f'{prefijo}_{i}'
+        params[nombre] = patron
+        condiciones.append(f'({doc}) ILIKE :{nombre}')
+    return '(' + ' AND '.join(condiciones) + ')' if condiciones else ''
+
+
+# =============================================================================
+# BÚSQUEDA GLOBAL (/api/buscar)
+# =============================================================================
+
+# Una subconsulta por entidad con las mismas columnas; {score}, {filtro} y
+# {usuario} se completan según el modo y los permisos
+_SQL_GLOBAL = {
+    'desgloses': """
+        SELECT 'desglose' AS tipo, d.folio::text AS id,
+               coalesce(nullif(d.clave_sabre, ''), d.clave_reserva) AS clave,
+               coalesce(d.pasajero_nombre, '') AS titulo,
+               concat_ws(' · ', nullif(d.numero_boleto, ''), nullif(d.ruta, '')) AS detalle,
+               d.fecha_emision AS fecha, {score} AS score
+        FROM desgloses d
+        WHERE {filtro} {usuario}
+        ORDER BY score DESC, d.fecha_emision DESC NULLS LAST
+        LIMIT :limite
+    """,
+    'papeletas': """
+        SELECT 'papeleta' AS tipo, p.id::text AS id,
+               p.clave_sabre AS clave,
+               coalesce(nullif(p.pasajero_nombre, ''), p.solicito, '') AS titulo,
+               concat_ws(' · ', p.folio, nullif(p.facturar_a, '')) AS detalle,
+               p.fecha_venta AS fecha, {score} AS score
+        FROM papeletas p
+        WHERE {filtro} {usuario}
+        ORDER BY score DESC, p.fecha_venta DESC NULLS LAST
+        LIMIT :limite
+    """,
+    'expedientes': """
+        SELECT 'expediente' AS tipo, x.clave AS id,
+               x.clave AS clave,
+               coalesce(x.pasajero, '') AS titulo,
+               CASE WHEN x.completo THEN 'Completo' ELSE 'Pendiente' END AS detalle,
+               x.fecha AS fecha, {score} AS score
+        FROM expedientes x
+        WHERE {filtro} {usuario}
+        ORDER BY score DESC, x.fecha DESC NULLS LAST
+        LIMIT :limite
+    """,
+}
+
+_ALIAS = {'desgloses': 'd', 'papeletas': 'p', 'expedientes': 'x'}
+_CLAVE = {
+    'desgloses': "upper(coalesce(nullif(d.clave_sabre, ''), d.clave_reserva, ''))",
+    'papeletas': "upper(coalesce(p.clave_sabre, ''))",
+    'expedientes': 'x.clave',
+}
+_USUARIO = {
+    'desgloses': 'AND d.usuario_id = :usuario_id',
+    'papeletas': 'AND p.usuario_id = :usuario_id',
+    'expedientes': 'AND x.usuario_ids @> ARRAY[CAST(:usuario_id AS bigint)]',
+}
+
+
+def _score(entidad, modo):
+    """Puntaje de relevancia: coincidencia exacta de clave primero"""
+    clave_exacta = f'CASE WHEN {_CLAVE[entidad]} = :termino_mayus THEN 1.0 ELSE 0.0 END'
+    if modo == 'trigram':
+        return f'({clave_exacta} + word_similarity(:termino, {documento(entidad, _ALIAS[entidad])}))'
+    # Sin pg_trgm: clave exacta > clave que empieza con el término > resto
+    return (f"({clave_exacta} + CASE WHEN {_CLAVE[entidad]} LIKE :termino_prefijo "
+            f"THEN 0.5 ELSE 0.1 END)")
+
+
+def buscar_global(termino, usuario_id=None, limite=20, entidades=None):
+    """
+    Busca en desgloses, papeletas y expedientes y regresa los resultados
+    mezclados y ordenados por relevancia.
+
+    Args:
+        termino: Texto libre (varias palabras = todas deben aparecer)
+        usuario_id: Si se indica, solo documentos de ese usuario (agentes)
+        limite: Máximo de resultados en total
+        entidades: Subconjunto de ENTIDADES (default: todas)
+
+    Returns:
+        (modo, lista de dicts con tipo, id, clave, titulo, detalle, fecha y score)
+    """
+    termino = (termino or '').strip()
+    if not termino:
+        return modo_busqueda(), []
+
+    modo = modo_busqueda()
+    params = {
+        'termino': termino,
+        'termino_mayus': termino.upper(),
+        'termino_prefijo': termino.upper().replace('%', '').replace('_', '') + '%',
+        'limite': limite,
+    }
+    if usuario_id is not None:
+        params['usuario_id'] = usuario_id
+
+    partes = []
+    for entidad in entidades or ENTIDADES:
+        filtro = condicion_sql(entidad, termino, params, alias=_ALIAS[entidad], prefijo=f'b_{entidad}')
+        partes.append('(' + _SQL_GLOBAL[entidad].format(
+            score=_score(entidad, modo),
+            filtro=filtro,
+            usuario=_USUARIO[entidad] if usuario_id is not None else '',
+        ) + ')')
+
+    sql = text(
+        'SELECT * FROM (' + ' UNION ALL '.join(partes) + ') r '
+        'ORDER BY r.score DESC, r.fecha DESC NULLS LAST LIMIT :limite'
+    )
+    filas = db.session.execute(sql, params).all()
+    return modo, [dict(f._mapping) for f in filas]
@@ -0,0 +1,333 @@
+# app/services/conciliacion.py
+# Núcleo común de las conciliaciones por archivo (BSP, Volaris, Viva Aerobus)
+#
+# Toda conciliación sigue los mismos pasos: leer el archivo, buscar por lotes
+# los registros del sistema que tienen la misma clave (una consulta IN por
+# lote), marcar los pendientes con un UPDATE por lote y guardar el run. Cada
+# archivo se describe con una Fuente: cómo se lee, qué claves trae cada
+# registro y cómo se compara con lo encontrado. El cruce, la caché de
+# archivos, el run y el trabajo en segundo plano (tareas_conciliacion) son
+# los mismos para todas.
+#
+# Agregar una aerolínea o GDS es escribir su parser y una subclase de Fuente
+# registrada con @fuente; el trabajo 'conciliar_<nombre>' queda disponible.
+
+import os
+from abc import ABC, abstractmethod
+from datetime import date
+
+from werkzeug.datastructures import FileStorage
+
+from app.models import db, Desglose, Papeleta, Usuario, Aerolinea
+from app.services.archivos_conciliacion import parsear_con_cache
+
+# Máximo de parámetros por consulta IN / registros por lote de cruce
+TAMANO_LOTE = 2000
+
+# Patrón (ILIKE) del nombre de la aerolínea de cada reporte; el mismo de su listado
+AEROLINEA_VOLARIS = '%volaris%'
+AEROLINEA_VIVA = '%viva%'
+
+# Diferencias de monto menores a esto se consideran redondeo
+TOLERANCIA_MONTO = 0.01
+
+# Contador del resumen por resultado del cruce
+CONTADORES = {
+    'conciliado': 'conciliados_ahora',
+    'ya_conciliado': 'ya_conciliados',
+    'no_encontrado': 'no_encontrados',
+}
+
+# Clases registradas con @fuente: {nombre: clase}
+FUENTES = {}
+
+
+def fuente(clase):
+    """Registra una fuente de conciliación; su trabajo es 'conciliar_<nombre>'"""
+    FUENTES[clase.nombre] = clase
+    return clase
+
+
+def lotes(iterable, tamano=TAMANO_LOTE):
+    """Agrupa un iterable (lista o generador) en listas de hasta `tamano` elementos"""
+    lote = []
+    for elemento in iterable:
+        lote.append(elemento)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+class Papeletas:
+    """
+    Papeletas por PNR: primero por clave_reserva y, si no hay, por clave_sabre.
+    Con `aerolinea` (patrón del nombre) solo se buscan y concilian papeletas
+    de esa aerolínea, para que un PNR repetido en otra no se concilie con el
+    reporte equivocado.
+    """
+
+    nombre = 'papeletas'
+
+    def __init__(self, aerolinea=None):
+        self.aerolinea = aerolinea
+
+    def _condiciones(self):
+        if not self.aerolinea:
+            return []
+        return [Papeleta.aerolinea_id.in_(
+            db.select(Aerolinea.id).where(Aerolinea.nombre.ilike(self.aerolinea))
+        )]
+
+    def buscar(self, claves):
+        """{pnr: [fila, ...]} en orden de fecha_venta; una consulta IN por lote"""
+        claves = list({c for c in claves if c})
+        por_reserva = {}
+        por_sabre = {}
+        for i in range(0, len(claves), TAMANO_LOTE):
+            lote = claves[i:i + TAMANO_LOTE]
+            en_lote = set(lote)
+            filas = db.session.query(
+                Papeleta.id,
+                Papeleta.folio,
+                Papeleta.total_ticket,
+                Papeleta.comision_agencia,
+                Papeleta.pasajero_nombre,
+                Papeleta.solicito,
+                Papeleta.facturar_a,
+                Papeleta.clave_reserva,
+                Papeleta.clave_sabre,
+                Papeleta.conciliada,
+                Usuario.nombre.label('agente'),
+            ).outerjoin(
+                Usuario, Papeleta.usuario_id == Usuario.id
+            ).filter(db.or_(
+                Papeleta.clave_reserva.in_(lote),
+                Papeleta.clave_sabre.in_(lote),
+            ), *self._condiciones()).order_by(Papeleta.fecha_venta, Papeleta.id).all()
+
+            for fila in filas:
+                if fila.clave_reserva in en_lote:
+                    por_reserva.setdefault(fila.clave_reserva, []).append(fila)
+                if fila.clave_sabre in en_lote:
+                    por_sabre.setdefault(fila.clave_sabre, []).append(fila)
+        return {clave: por_reserva.get(clave) or por_sabre[clave] for clave in por_reserva.keys() | por_sabre.keys()}
+
+    def aplicar(self, ids, usuario_id, periodo, fecha):
+        """Marca como conciliadas las papeletas indicadas con un UPDATE por lote. No hace commit."""
+        ids = list(ids)
+        actualizadas = 0
+        for i in range(0, len(ids), TAMANO_LOTE):
+            actualizadas += db.session.query(Papeleta).filter(
+                Papeleta.id.in_(ids[i:i + TAMANO_LOTE]),
+                db.or_(Papeleta.conciliada == False, Papeleta.conciliada.is_(None)),
+                *self._condiciones()
+            ).update({
+                Papeleta.conciliada: True,
+                Papeleta.fecha_conciliacion: fecha,
+                Papeleta.conciliada_por_id: usuario_id,
+                Papeleta.periodo_conciliacion: periodo,
+            }, synchronize_session=False)
+        return actualizadas
+
+
+class Desgloses:
+    """Desgloses por número de boleto normalizado (numero_boleto_norm, índice único)"""
+
+    nombre = 'desgloses'
+
+    def buscar(self, claves):
+        """{numero_boleto_norm: [fila]}; una consulta IN por lote"""
+        claves = list({c for c in claves if c})
+        encontrados = {}
+        for i in range(0, len(claves), TAMANO_LOTE):
+            filas = db.session.query(
+                Desglose.folio.label('id'),
+                Desglose.folio,
+                Desglose.numero_boleto_norm,
+                Desglose.pasajero_nombre,
+                Desglose.conciliada,
+                # El BSP reporta el boleto sin el cargo por servicio de la agencia
+                (Desglose.total - Desglose.cargo_por_servicio).label('monto_boleto'),
+                Desglose.tarifa_base,
+            ).filter(Desglose.numero_boleto_norm.in_(claves[i:i + TAMANO_LOTE])).all()
+            for fila in filas:
+                encontrados[fila.numero_boleto_norm] = [fila]
+        return encontrados
+
+    def aplicar(self, folios, usuario_id, periodo, fecha):
+        """Marca como conciliados los desgloses indicados con un UPDATE por lote. No hace commit."""
+        folios = list(folios)
+        actualizados = 0
+        for i in range(0, len(folios), TAMANO_LOTE):
+            actualizados += db.session.query(Desglose).filter(
+                Desglose.folio.in_(folios[i:i + TAMANO_LOTE]),
+                db.or_(Desglose.conciliada == False, Desglose.conciliada.is_(None))
+            ).update({
+                Desglose.conciliada: True,
+                Desglose.fecha_conciliacion: fecha,
+                Desglose.conciliada_por_id: usuario_id,
+                Desglose.periodo_bsp: periodo,
+            }, synchronize_session=False)
+        return actualizados
+
+
+PAPELETAS_VOLARIS = Papeletas(AEROLINEA_VOLARIS)
+PAPELETAS_VIVA = Papeletas(AEROLINEA_VIVA)
+DESGLOSES = Desgloses()
+
+
+class Fuente(ABC):
+    """
+    Un tipo de archivo a conciliar; se instancia una vez por trabajo y lleva
+    el resumen de esa conciliación.
+
+    Las subclases definen nombre, etiqueta, destino, claves(), comparar() y
+    linea(), y parsear() (o leer() si el archivo no pasa por la caché); una
+    subclase incompleta falla al instanciarse, no dentro del trabajo. Lo
+    demás tiene un comportamiento por omisión pensado para los reportes de
+    aerolínea y se puede extender (BSP agrega cancelaciones y periodos).
+    """
+
+    nombre = None  # Tipo del run ('volaris'); el trabajo es 'conciliar_<nombre>'
+    etiqueta = None  # Para mensajes ('Volaris')
+    destino = None  # PAPELETAS_VOLARIS, PAPELETAS_VIVA o DESGLOSES
+    tipo_cache = None  # Tipo en archivos_conciliacion
+    version_parser = '1'  # Subir al cambiar parsear() para invalidar la caché
+    clave_total = 'total_reporte'  # Contador del resumen con los registros leídos
+    sin_registros = 'No se encontraron registros en el archivo'
+
+    def __init__(self, parametros, progreso, usuario_id):
+        if type(self).parsear is Fuente.parsear and type(self).leer is Fuente.leer:
+            raise TypeError(f'{type(self).__name__} debe definir parsear() o leer()')
+        self.parametros = parametros
+        self.progreso = progreso
+        self.usuario_id = usuario_id
+        self.fecha = date.fromisoformat(parametros['fecha'])
+        self.periodo = ''
+        self.resumen = self.resumen_inicial()
+
+    # --- Lectura ---
+
+    def abrir_archivo(self):
+        """FileStorage sobre el archivo guardado por el request, para reutilizar los parsers del upload"""
+        return FileStorage(
+            stream=open(self.parametros['ruta'], 'rb'),
+            filename=self.parametros.get('nombre_archivo') or os.path.basename(self.parametros['ruta']),
+        )
+
+    def parsear(self, archivo):
+        """{'periodo': ..., 'documentos': [...]} de un FileStorage (lo usa leer() por omisión)"""
+
+    def leer(self):
+        """
+        Registros del archivo (lista o generador) y self.periodo. Por omisión
+        parsear() con la caché de archivos_conciliacion.
+        """
+        archivo = self.abrir_archivo()
+        try:
+            lectura, _ = parsear_con_cache(archivo, self.tipo_cache, self.version_parser, self.parsear, self.usuario_id)
+        finally:
+            archivo.close()
+        self.periodo = lectura.get('periodo') or ''
+        self.progreso.actualizar(documentos=len(lectura['documentos']))
+        return lectura['documentos']
+
+    # --- Cruce ---
+
+    @abstractmethod
+    def claves(self, doc):
+        """Claves del registro en orden de prioridad (se usa la primera que exista en el sistema)"""
+
+    @abstractmethod
+    def comparar(self, doc, filas):
+        """Registro del resultado para un documento encontrado (filas del destino con su clave)"""
+
+    @abstractmethod
+    def linea(self, doc, resultado):
+        """Renglón de conciliacion_lineas (conciliacion_runs.linea_*)"""
+
+    # --- Resumen ---
+
+    def resumen_inicial(self):
+        return {
+            self.clave_total: 0,
+            'encontrados': 0,
+            'ya_conciliados': 0,
+            'conciliados_ahora': 0,
+            'no_encontrados': 0,
+            'con_diferencia_monto': 0,
+        }
+
+    def preparar(self):
+        """Antes de crear el run, con el periodo ya leído"""
+
+    def registros(self, documentos):
+        """Documentos que se cruzan; cuenta los leídos"""
+        for doc in documentos:
+            self.resumen[self.clave_total] += 1
+            yield doc
+
+    def con_diferencia(self, doc):
+        """True si el monto no coincide con el del sistema (mismo criterio que el reporte de diferencias)"""
+        return abs(doc.get('diferencia') or 0) > TOLERANCIA_MONTO
+
+    def contar(self, resultado, doc):
+        """Suma un documento cruzado al resumen"""
+        self.resumen[CONTADORES[resultado]] += 1
+        if resultado != 'no_encontrado':
+            self.resumen['encontrados'] += 1
+            if self.con_diferencia(doc):
+                self.resumen['con_diferencia_monto'] += 1
+
+    def terminar(self, run):
+        """Al terminar el cruce; regresa líneas adicionales para el run"""
+        return []
+
+    def mensaje(self):
+        return (
+            f'Conciliación {self.etiqueta} completada: {self.resumen["conciliados_ahora"]} conciliados, '
+            f'{self.resumen["ya_conciliados"]} ya estaban conciliados, '
+            f'{self.resumen["no_encontrados"]} no encontrados en el sistema'
+        )
+
+
+def cruzar(fuente, documentos):
+    """
+    Cruza los documentos de una fuente con su destino y concilia los pendientes, por lotes.
+
+    documentos puede ser una lista o un generador: se consume de TAMANO_LOTE
+    en TAMANO_LOTE con una consulta IN y un UPDATE por lote, así que la
+    memoria depende del lote y no del archivo. Un documento puede cruzar con
+    varios registros (un PNR con varias papeletas); se concilian todos los
+    pendientes. Si un registro ya lo tomó otro documento del archivo, el
+    segundo cuenta como ya conciliado. No hace commit.
+
+    Yields:
+        (resultado, doc) en el orden de documentos; resultado es 'conciliado',
+        'ya_conciliado' o 'no_encontrado' y doc es lo que regresó
+        fuente.comparar() (o el documento original si no se encontró)
+    """
+    for lote in lotes(documentos):
+        por_clave = fuente.destino.buscar(c for doc in lote for c in fuente.claves(doc))
+        por_conciliar = set()
+        salida = []
+
+        for doc in lote:
+            filas = next((por_clave[c] for c in fuente.claves(doc) if c in por_clave), None)
+            if not filas:
+                salida.append(('no_encontrado', doc))
+                continue
+
+            resultado_doc = fuente.comparar(doc, filas)
+            # Los conciliados en lotes anteriores ya llegan con conciliada=True
+            pendientes = [f.id for f in filas if not f.conciliada and f.id not in por_conciliar]
+            if pendientes:
+                por_conciliar.update(pendientes)
+                salida.append(('conciliado', resultado_doc))
+            else:
+                salida.append(('ya_conciliado', resultado_doc))
+
+        fuente.destino.aplicar(por_conciliar, fuente.usuario_id, fuente.periodo, fuente.fecha)
+        yield from salida
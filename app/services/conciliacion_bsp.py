@@ -0,0 +1,314 @@
+# app/services/conciliacion_bsp.py
+# Cruce de documentos BSP (FCAGBILLDET) contra desgloses
+#
+# Los desgloses guardan numero_boleto_norm (solo dígitos, 13 con el prefijo
+# de la aerolínea), así que el cruce es por igualdad sobre un índice único
+# (conciliacion.DESGLOSES). La misma consulta trae los montos del desglose
+# para comparar cada par contra lo que reporta el BSP.
+#
+# Cada periodo guarda en conciliacion_bsp_documentos qué documentos trae y con
+# qué desglose cruzó cada uno. Al reconciliar un periodo (BSP revisado) solo
+# se aplica la diferencia contra esa membresía: altas, bajas y documentos que
+# ahora cruzan con otro desglose (p. ej. un reemisión +RTDN).
+
+import re
+
+from flask import current_app
+from sqlalchemy import insert, text
+
+from app.models import db, Desglose, ConciliacionBspDocumento
+from app.services.conciliacion import Fuente, fuente, DESGLOSES, TAMANO_LOTE
+from app.services.conciliacion_runs import linea_bsp, linea_bsp_removida
+from app.services.logs import span
+from app.services.parser_bsp import parsear_bsp_pdf, iterar_bsp_txt, periodo_de_nombre, VERSION_PARSER_PDF
+
+# Prefijo numérico (código contable IATA) por código de aerolínea de 2 letras,
+# para completar los boletos que se capturaron sin prefijo
+PREFIJOS_BOLETO = {
+    'AA': '001', 'DL': '006', 'AC': '014', 'UA': '016', 'AS': '027',
+    'LA': '045', 'AF': '057', 'KL': '074', 'IB': '075', 'BA': '125',
+    'AV': '134', 'AM': '139', 'QR': '157', 'EK': '176', 'LH': '220',
+    'CM': '230', 'TK': '235', 'UX': '996',
+}
+
+# Boleto en conjunción: número completo y los últimos dígitos del siguiente
+# ('1395463633094/95', '139-5463633094/5')
+_CONJUNCION = re.compile(r'^([\d\s-]+?)\s*/\s*\d{1,2}$')
+
+
+def normalizar_numero_boleto(numero, codigo_iata=None):
+    """
+    Forma canónica de un número de boleto: solo dígitos, 13 con prefijo.
+
+    '139-5463633094', '139 5463633094' y '1395463633094' → '1395463633094'.
+    Un boleto en conjunción ('1395463633094/95') se guarda con el primero.
+    Si se capturó solo el documento (10 dígitos) se completa con el prefijo
+    de la aerolínea cuando se conoce; si no, se guardan los dígitos tal cual.
+
+    Raises:
+        ValueError: si quedan más de 13 dígitos (no se recorta: el resultado
+            va a un índice único y podría chocar con otro boleto)
+    """
+    numero = (numero or '').strip()
+    conjuncion = _CONJUNCION.match(numero)
+    if conjuncion:
+        numero = conjuncion.group(1)
+    digitos = re.sub(r'\D', '', numero)
+    if not digitos:
+        return None
+    if len(digitos) == 10 and codigo_iata:
+        prefijo = PREFIJOS_BOLETO.get(codigo_iata.strip().upper())
+        if prefijo:
+            return prefijo + digitos
+    if len(digitos) > 13:
+        raise ValueError(f'El número de boleto {numero} tiene más de 13 dígitos')
+    return digitos
+
+
+def claves_boleto(doc):
+    """
+    Claves normalizadas de un documento BSP, en orden de prioridad: número
+    completo (CIA + documento) y, para boletos capturados sin prefijo de una
+    aerolínea sin prefijo conocido, solo el documento.
+    """
+    claves = []
+    for numero in (doc['numero_completo'], doc['document_number']):
+        try:
+            clave = normalizar_numero_boleto(numero)
+        except ValueError:
+            # Más de 13 dígitos: no puede cruzar con ningún desglose
+            continue
+        if clave:
+            claves.append(clave)
+    return claves
+
+
+def comparar_montos(doc, fila):
+    """
+    Agrega al documento los montos del desglose y las diferencias contra el BSP
+    (sistema - BSP, como en Volaris). La tarifa solo se compara cuando el
+    documento la trae (el PDF; el TXT solo tiene el monto de la transacción).
+    """
+    monto_sistema = float(fila.monto_boleto or 0)
+    doc['monto_sistema'] = monto_sistema
+    doc['diferencia'] = round(monto_sistema - (doc.get('transaction_amount') or 0), 2)
+
+    tarifa_sistema = float(fila.tarifa_base or 0)
+    doc['tarifa_sistema'] = tarifa_sistema
+    if doc.get('tarifa') is not None:
+        doc['diferencia_tarifa'] = round(tarifa_sistema - doc['tarifa'], 2)
+
+
+def clave_documento(doc):
+    """Clave del documento dentro de su periodo: el número completo normalizado"""
+    claves = claves_boleto(doc)
+    return claves[0] if claves else None
+
+
+def bloquear_periodo(periodo):
+    """
+    Serializa las conciliaciones de un mismo periodo (advisory lock de
+    PostgreSQL); se libera con el commit o rollback del trabajo.
+    """
+    db.session.execute(text('SELECT pg_advisory_xact_lock(hashtext(:llave))'), {'llave': f'bsp:{periodo}'})
+
+
+def membresia_periodo(periodo):
+    """Documentos del periodo según su última conciliación: {clave: (folio, tipo_documento, monto)}"""
+    filas = db.session.query(
+        ConciliacionBspDocumento.clave,
+        ConciliacionBspDocumento.folio,
+        ConciliacionBspDocumento.tipo_documento,
+        ConciliacionBspDocumento.monto,
+    ).filter(ConciliacionBspDocumento.periodo == periodo)
+    return {f.clave: (f.folio, f.tipo_documento, f.monto) for f in filas}
+
+
+def aplicar_cambios_periodo(periodo, actuales, run_id):
+    """
+    Deja la membresía del periodo igual al archivo recién cruzado, tocando
+    solo lo que cambió. No hace commit.
+
+    Los documentos que ya no vienen en el archivo, o que ahora cruzan con otro
+    desglose, salen de la membresía; su desglose anterior se desconcilia si lo
+    concilió este mismo periodo y ningún documento del archivo lo sigue
+    cruzando. Los documentos sin cambio no se tocan.
+
+    Args:
+        periodo: Periodo BSP (desgloses.periodo_bsp)
+        actuales: {clave: (folio, tipo_documento, monto)} del archivo
+        run_id: Run que se está guardando
+
+    Returns:
+        (cambios, removidos): cambios con agregados, removidos, sin_cambio y
+        desconciliados; removidos = [(clave, (folio, tipo_documento, monto))]
+        de la membresía anterior que ya no aplica
+    """
+    anteriores = membresia_periodo(periodo)
+
+    removidos = [
+        (clave, previo) for clave, previo in anteriores.items()
+        if clave not in actuales or actuales[clave][0] != previo[0]
+    ]
+    nuevas = [
+        (clave, actual) for clave, actual in actuales.items()
+        if clave not in anteriores or anteriores[clave][0] != actual[0]
+    ]
+
+    claves_removidas = [clave for clave, _ in removidos]
+    for i in range(0, len(claves_removidas), TAMANO_LOTE):
+        db.session.query(ConciliacionBspDocumento).filter(
+            ConciliacionBspDocumento.periodo == periodo,
+            ConciliacionBspDocumento.clave.in_(claves_removidas[i:i + TAMANO_LOTE]),
+        ).delete(synchronize_session=False)
+
+    filas = [{
+        'periodo': periodo,
+        'clave': clave,
+        'folio': folio,
+        'tipo_documento': tipo_documento,
+        'monto': monto,
+        'run_id': run_id,
+    } for clave, (folio, tipo_documento, monto) in nuevas]
+    for i in range(0, len(filas), TAMANO_LOTE):
+        db.session.execute(insert(ConciliacionBspDocumento), filas[i:i + TAMANO_LOTE])
+
+    # Un desglose puede seguir cruzado por otro documento del archivo
+    folios_vigentes = {folio for folio, _, _ in actuales.values() if folio}
+    por_desconciliar = list({
+        folio for _, (folio, _, _) in removidos if folio and folio not in folios_vigentes
+    })
+    desconciliados = 0
+    for i in range(0, len(por_desconciliar), TAMANO_LOTE):
+        desconciliados += db.session.query(Desglose).filter(
+            Desglose.folio.in_(por_desconciliar[i:i + TAMANO_LOTE]),
+            Desglose.periodo_bsp == periodo,
+            Desglose.conciliada == True,
+        ).update({
+            Desglose.conciliada: False,
+            Desglose.fecha_conciliacion: None,
+            Desglose.conciliada_por_id: None,
+            Desglose.periodo_bsp: None,
+        }, synchronize_session=False)
+
+    cambios = {
+        'agregados': len(nuevas),
+        'removidos': len(removidos),
+        'sin_cambio': len(actuales) - len(nuevas),
+        'desconciliados': desconciliados,
+    }
+    return cambios, removidos
+
+
+def _leer_txt(ruta):
+    """Documentos del TXT en stream; el archivo se cierra al terminar de recorrerlo"""
+    with open(ruta, 'rb') as stream:
+        yield from iterar_bsp_txt(stream)
+
+
+@fuente
+class FuenteBsp(Fuente):
+    """
+    FCAGBILLDET (PDF o TXT) contra desgloses. Las cancelaciones (CANX) se
+    cuentan pero no se concilian; con periodo, al final se aplica la
+    diferencia contra la conciliación anterior del mismo periodo
+    (aplicar_cambios_periodo) y los documentos que salieron se agregan al run
+    como 'removido'.
+    """
+
+    nombre = 'bsp'
+    etiqueta = 'BSP'
+    destino = DESGLOSES
+    tipo_cache = 'bsp_pdf'
+    version_parser = VERSION_PARSER_PDF
+    clave_total = 'total_bsp'
+    sin_registros = 'No se encontraron documentos en el archivo'
+
+    def __init__(self, parametros, progreso, usuario_id):
+        super().__init__(parametros, progreso, usuario_id)
+        # {clave: (folio, tipo_documento, monto)} para la diferencia del periodo
+        self.actuales = {}
+
+    def parsear(self, archivo):
+        # El archivo ya está en disco: pdfplumber lo lee directo de la ruta
+        with span('bsp.parsear_pdf') as campos:
+            resultado = parsear_bsp_pdf(
+                self.parametros['ruta'],
+                procesos=current_app.config.get('BSP_PDF_PROCESOS', 1),
+                avance=lambda leidas, total: self.progreso.actualizar(paginas_leidas=leidas, paginas_total=total),
+            )
+            campos['paginas'] = resultado['paginas']
+        return resultado
+
+    def leer(self):
+        if self.parametros['formato'] == 'pdf':
+            documentos = super().leer()
+            self.progreso.actualizar(documentos=sum(1 for d in documentos if d['trnc'] != 'CANX'))
+            return documentos
+        # El TXT no pasa por la caché: se lee en stream y se cruza por lotes
+        self.periodo = periodo_de_nombre(self.parametros.get('nombre_archivo'))
+        return _leer_txt(self.parametros['ruta'])
+
+    def resumen_inicial(self):
+        resumen = super().resumen_inicial()
+        resumen.update({
+            'total_a_conciliar': 0,
+            'cancelaciones': 0,
+            'por_tipo': {'TKTT': 0, 'EMDS': 0, 'EMDA': 0},
+            'revisados': 0,
+        })
+        return resumen
+
+    def preparar(self):
+        if self.periodo:
+            bloquear_periodo(self.periodo)
+
+    def registros(self, documentos):
+        # Filtrar CANX (cancelaciones) — no se concilian
+        for doc in super().registros(documentos):
+            if doc['trnc'] == 'CANX':
+                self.resumen['cancelaciones'] += 1
+                continue
+            self.resumen['total_a_conciliar'] += 1
+            if doc['trnc'] in self.resumen['por_tipo']:
+                self.resumen['por_tipo'][doc['trnc']] += 1
+            if doc.get('es_revisado'):
+                self.resumen['revisados'] += 1
+            yield doc
+
+    def claves(self, doc):
+        return claves_boleto(doc)
+
+    def comparar(self, doc, filas):
+        fila = filas[0]
+        doc['folio_desglose'] = fila.folio
+        doc['pasajero'] = fila.pasajero_nombre or ''
+        comparar_montos(doc, fila)
+        return doc
+
+    def linea(self, doc, resultado):
+        return linea_bsp(doc, resultado)
+
+    def contar(self, resultado, doc):
+        super().contar(resultado, doc)
+        clave = clave_documento(doc)
+        if self.periodo and clave:
+            self.actuales[clave] = (doc.get('folio_desglose'), doc['trnc'], doc.get('transaction_amount'))
+
+    def terminar(self, run):
+        if not self.periodo:
+            return []
+        self.progreso.actualizar(forzar=True, etapa='Aplicando cambios del periodo')
+        cambios, removidos = aplicar_cambios_periodo(self.periodo, self.actuales, run.id)
+        self.resumen['cambios_periodo'] = cambios
+        return [linea_bsp_removida(clave, *previo) for clave, previo in removidos]
+
+    def mensaje(self):
+        mensaje = super().mensaje()
+        cambios = self.resumen.get('cambios_periodo')
+        if cambios and cambios['removidos']:
+            mensaje += (
+                f'; {cambios["removidos"]} documentos ya no aplican al periodo '
+                f'({cambios["desconciliados"]} desgloses desconciliados)'
+            )
+        return mensaje
@@ -0,0 +1,197 @@
+# app/services/conciliacion_runs.py
+# Resultados de conciliación guardados en la base de datos
+#
+# Cada archivo conciliado genera un registro en conciliacion_runs con los
+# contadores del resumen y un renglón en conciliacion_lineas por documento.
+# En la sesión solo se guarda el id del run; las páginas de resultado leen
+# las líneas paginadas y filtradas desde aquí.
+
+from sqlalchemy import insert
+
+from app.models import db, ConciliacionRun, ConciliacionLinea
+from app.services.busqueda import palabras
+
+# Renglones por INSERT al guardar las líneas
+TAMANO_LOTE = 1000
+
+# 'removido' = documento que traía la conciliación anterior del periodo BSP y ya no aplica
+RESULTADOS = ('conciliado', 'ya_conciliado', 'no_encontrado', 'removido')
+
+
+def _texto(valor, largo):
+    return str(valor)[:largo] if valor not in (None, '') else None
+
+
+def linea_bsp(doc, resultado):
+    """Renglón de conciliacion_lineas para un documento BSP"""
+    return {
+        'resultado': resultado,
+        'clave': _texto(doc.get('numero_completo') or doc.get('document_number'), 30),
+        'tipo_documento': _texto(doc.get('trnc'), 10),
+        'scope': _texto(doc.get('scope'), 20),
+        'folio': _texto(doc.get('folio_desglose'), 255),
+        'pasajero': _texto(doc.get('pasajero'), 255),
+        'monto': doc.get('transaction_amount'),
+        'monto_sistema': doc.get('monto_sistema'),
+        'diferencia': doc.get('diferencia'),
+        'neto': doc.get('balance_payable'),
+        'datos': doc,
+    }
+
+
+def linea_bsp_removida(clave, folio, tipo_documento, monto):
+    """Renglón de un documento que salió del periodo BSP (membresía anterior)"""
+    doc = {
+        'airline_code': clave[:3],
+        'numero_completo': clave,
+        'trnc': tipo_documento,
+        'folio_desglose': folio,
+        'transaction_amount': float(monto or 0),
+    }
+    return linea_bsp(doc, 'removido')
+
+
+def linea_volaris(doc, resultado):
+    """Renglón de conciliacion_lineas para un registro del reporte de Volaris"""
+    encontrado = resultado != 'no_encontrado'
+    return {
+        'resultado': resultado,
+        'clave': _texto(doc.get('pnr'), 30),
+        'folio': _texto(doc.get('folio'), 255),
+        'pasajero': _texto(doc.get('pasajero_sistema') if encontrado else doc.get('pasajero'), 255),
+        'monto': doc.get('monto_volaris') if encontrado else doc.get('pago'),
+        'monto_sistema': doc.get('monto_sistema'),
+        'diferencia': doc.get('diferencia'),
+        'datos': doc,
+    }
+
+
+def linea_viva(doc, resultado):
+    """Renglón de conciliacion_lineas para un registro del reporte de Viva Aerobus"""
+    encontrado = resultado != 'no_encontrado'
+    return {
+        'resultado': resultado,
+        'clave': _texto(doc.get('pnr'), 30),
+        'folio': _texto(doc.get('folio'), 255),
+        'pasajero': _texto(doc.get('pasajero_sistema') if encontrado else doc.get('pasajero'), 255),
+        'monto': doc.get('monto_viva') if encontrado else doc.get('total'),
+        'monto_sistema': doc.get('monto_sistema'),
+        'diferencia': doc.get('diferencia'),
+        'datos': doc,
+    }
+
+
+def crear_run(tipo, periodo, usuario_id=None, nombre_archivo=None, resumen=None):
+    """Crea el run (con id asignado) para ir agregando sus líneas. No hace commit."""
+    run = ConciliacionRun(
+        tipo=tipo,
+        periodo=periodo or None,
+        resumen=resumen or {},
+        usuario_id=usuario_id,
+        nombre_archivo=(nombre_archivo or '')[:255] or None,
+    )
+    db.session.add(run)
+    db.session.flush()
+    return run
+
+
+def agregar_lineas(run_id, lineas, orden_inicial=0):
+    """
+    Inserta líneas de un run en lotes de TAMANO_LOTE. No hace commit.
+
+    Returns:
+        El orden que le toca a la siguiente línea
+    """
+    filas = [dict(linea, run_id=run_id, orden=orden_inicial + i) for i, linea in enumerate(lineas)]
+    for i in range(0, len(filas), TAMANO_LOTE):
+        db.session.execute(insert(ConciliacionLinea), filas[i:i + TAMANO_LOTE])
+    return orden_inicial + len(filas)
+
+
+def guardar_run(tipo, periodo, resumen, lineas, usuario_id=None, nombre_archivo=None):
+    """
+    Guarda un run con todas sus líneas. No hace commit.
+
+    Args:
+        tipo: 'bsp', 'volaris' o 'viva'
+        periodo: Periodo del archivo
+        resumen: Contadores para la página de resultado
+        lineas: Renglones de linea_bsp()/linea_volaris()/linea_viva(), en orden del archivo
+        usuario_id: Quién concilió
+        nombre_archivo: Nombre del archivo subido
+
+    Returns:
+        ConciliacionRun (con id asignado)
+    """
+    run = crear_run(tipo, periodo, usuario_id, nombre_archivo, resumen)
+    agregar_lineas(run.id, lineas)
+    return run
+
+
+def _diferencia_comision():
+    """Diferencia de compensación de un renglón de Viva (va en datos, no tiene columna)"""
+    return ConciliacionLinea.datos['diferencia_comision'].as_float()
+
+
+def filtrar_lineas(run_id, resultado=None, buscar=None, tipo_documento=None, scope=None,
+                   con_diferencia=False, con_diferencia_comision=False):
+    """Query de las líneas de un run con los filtros de la página de resultado"""
+    query = ConciliacionLinea.query.filter(ConciliacionLinea.run_id == run_id)
+
+    if resultado:
+        query = query.filter(ConciliacionLinea.resultado == resultado)
+    if tipo_documento:
+        query = query.filter(ConciliacionLinea.tipo_documento == tipo_documento)
+    if scope:
+        query = query.filter(ConciliacionLinea.scope == scope)
+    if con_diferencia:
+        query = query.filter(db.func.abs(ConciliacionLinea.diferencia) > 0.01)
+    if con_diferencia_comision:
+        query = query.filter(db.func.abs(_diferencia_comision()) > 0.01)
+    for patron in palabras(buscar):
+        query = query.filter(db.or_(
+            ConciliacionLinea.clave.ilike(patron),
+            ConciliacionLinea.folio.ilike(patron),
+            ConciliacionLinea.pasajero.ilike(patron),
+        ))
+
+    return query
+
+
+def consultar_lineas(run_id, pagina=1, por_pagina=50, **filtros):
+    """
+    Página de líneas de un run y totales del conjunto filtrado.
+
+    Con con_diferencia=True (o con_diferencia_comision=True) las líneas salen
+    de mayor a menor diferencia absoluta (reporte de diferencias); si no, en
+    el orden del archivo.
+
+    Returns:
+        (lineas, totales) donde totales tiene registros, monto, monto_sistema,
+        diferencia y neto sumados en SQL
+    """
+    query = filtrar_lineas(run_id, **filtros)
+
+    fila = query.with_entities(
+        db.func.count(ConciliacionLinea.id),
+        db.func.coalesce(db.func.sum(ConciliacionLinea.monto), 0),
+        db.func.coalesce(db.func.sum(ConciliacionLinea.monto_sistema), 0),
+        db.func.coalesce(db.func.sum(ConciliacionLinea.diferencia), 0),
+        db.func.coalesce(db.func.sum(ConciliacionLinea.neto), 0),
+    ).one()
+    totales = {
+        'registros': fila[0],
+        'monto': float(fila[1]),
+        'monto_sistema': float(fila[2]),
+        'diferencia': float(fila[3]),
+        'neto': float(fila[4]),
+    }
+
+    if filtros.get('con_diferencia'):
+        orden = (db.func.abs(ConciliacionLinea.diferencia).desc(), ConciliacionLinea.orden)
+    elif filtros.get('con_diferencia_comision'):
+        orden = (db.func.abs(_diferencia_comision()).desc(), ConciliacionLinea.orden)
+    else:
+        orden = (ConciliacionLinea.orden,)
+    lineas = query.order_by(*orden).offset((pagina - 1) * por_pagina).limit(por_pagina).all()
+    return lineas, totales
@@ -0,0 +1,76 @@
+# app/services/conciliacion_viva.py
+# Cruce del reporte de agencia de Viva Aerobus contra papeletas
+#
+# Igual que Volaris: los PNR se buscan por lotes contra las papeletas de
+# Viva Aerobus (conciliacion.PAPELETAS_VIVA) y la conciliación se aplica con
+# un UPDATE por lote. Además del monto del boleto se compara la compensación
+# de la agencia.
+
+from app.services.conciliacion import Fuente, fuente, PAPELETAS_VIVA, TOLERANCIA_MONTO
+from app.services.conciliacion_runs import linea_viva
+from app.services.parser_viva import parsear_viva, VERSION_PARSER_VIVA
+
+
+def _diferencia(sistema, viva):
+    """sistema - Viva redondeado, o None si el reporte no trae ese monto"""
+    if viva is None:
+        return None
+    return round(sistema - viva, 2)
+
+
+@fuente
+class FuenteViva(Fuente):
+    """
+    Reporte de ventas o compensaciones de Viva Aerobus (.csv o .xlsx). El
+    total se compara contra total_ticket y la compensación contra
+    comision_agencia, sumados si el PNR tiene varias papeletas.
+    """
+
+    nombre = 'viva'
+    etiqueta = 'Viva Aerobus'
+    destino = PAPELETAS_VIVA
+    tipo_cache = 'viva'
+    version_parser = VERSION_PARSER_VIVA
+    sin_registros = 'No se encontraron registros en el archivo (revisa que tenga las columnas PNR y total o compensación)'
+
+    def parsear(self, archivo):
+        return parsear_viva(archivo)
+
+    def claves(self, doc):
+        return [doc['pnr']]
+
+    def comparar(self, doc, papeletas_found):
+        monto_sistema = sum(float(p.total_ticket or 0) for p in papeletas_found)
+        comision_sistema = sum(float(p.comision_agencia or 0) for p in papeletas_found)
+
+        primera = papeletas_found[0]
+        return {
+            'pnr': doc['pnr'],
+            'fecha': doc['fecha'],
+            'agente_viva': doc['agente'],
+            'pasajero_viva': doc['pasajero'],
+            'monto_viva': doc['total'],
+            'monto_sistema': monto_sistema,
+            'diferencia': _diferencia(monto_sistema, doc['total']),
+            'comision_viva': doc['compensacion'],
+            'comision_sistema': comision_sistema,
+            'diferencia_comision': _diferencia(comision_sistema, doc['compensacion']),
+            'agente_sistema': primera.agente or '',
+            'pasajero_sistema': primera.pasajero_nombre or primera.solicito or primera.facturar_a or '',
+            'folio': ', '.join(p.folio for p in papeletas_found),
+            'clave_reserva': primera.clave_reserva or '',
+            'num_papeletas': len(papeletas_found)
+        }
+
+    def linea(self, doc, resultado):
+        return linea_viva(doc, resultado)
+
+    def resumen_inicial(self):
+        resumen = super().resumen_inicial()
+        resumen['con_diferencia_comision'] = 0
+        return resumen
+
+    def contar(self, resultado, doc):
+        super().contar(resultado, doc)
+        if resultado != 'no_encontrado' and abs(doc.get('diferencia_comision') or 0) > TOLERANCIA_MONTO:
+            self.resumen['con_diferencia_comision'] += 1
@@ -0,0 +1,61 @@
+# app/services/conciliacion_volaris.py
+# Cruce del reporte de ventas de Volaris contra papeletas
+#
+# Los PNR del reporte se buscan por lotes contra clave_reserva y clave_sabre
+# de las papeletas de Volaris (conciliacion.PAPELETAS_VOLARIS) y la
+# conciliación se aplica con un UPDATE por lote. Las claves se guardan
+# normalizadas (normalizar_pnr), así que el IN usa sus índices.
+
+from app.services.conciliacion import Fuente, fuente, PAPELETAS_VOLARIS
+from app.services.conciliacion_runs import linea_volaris
+from app.services.parser_volaris import parsear_volaris_xlsx, VERSION_PARSER_VOLARIS
+
+
+@fuente
+class FuenteVolaris(Fuente):
+    """
+    Reporte de ventas de Volaris (.xlsx). Un PNR puede tener varias
+    papeletas: se comparan los montos sumados y se concilian todas las que
+    falten.
+    """
+
+    nombre = 'volaris'
+    etiqueta = 'Volaris'
+    destino = PAPELETAS_VOLARIS
+    tipo_cache = 'volaris_xlsx'
+    version_parser = VERSION_PARSER_VOLARIS
+
+    def parsear(self, archivo):
+        return parsear_volaris_xlsx(archivo)
+
+    def claves(self, doc):
+        return [doc['pnr']]
+
+    def comparar(self, doc, papeletas_found):
+        # Sumar totales de todas las papeletas con esta clave
+        # Usar total_ticket (no total) porque Volaris reporta el monto del boleto
+        # sin comisión ni cargo de servicio de la agencia
+        monto_sistema = sum(float(p.total_ticket or 0) for p in papeletas_found)
+        monto_volaris = doc['pago']
+
+        # Datos del primer registro para mostrar
+        primera = papeletas_found[0]
+
+        return {
+            'pnr': doc['pnr'],
+            'fecha': doc['fecha'],
+            'agente_volaris': doc['agente'],
+            'pasajero_volaris': doc['pasajero'],
+            'monto_volaris': monto_volaris,
+            'monto_sistema': monto_sistema,
+            'diferencia': round(monto_sistema - monto_volaris, 2),
+            'agente_sistema': primera.agente or '',
+            # Pasajero: preferir pasajero_nombre, luego solicito
+            'pasajero_sistema': primera.pasajero_nombre or primera.solicito or primera.facturar_a or '',
+            'folio': ', '.join(p.folio for p in papeletas_found),
+            'clave_reserva': primera.clave_reserva or '',
+            'num_papeletas': len(papeletas_found)
+        }
+
+    def linea(self, doc, resultado):
+        return linea_volaris(doc, resultado)
@@ -0,0 +1,373 @@
+# app/services/expedientes.py
+# Expedientes materializados en la tabla `expedientes`
+#
+# Un expediente agrupa desgloses y papeletas por clave normalizada
+# (clave_sabre o clave_reserva, en mayúsculas). La tabla tiene un renglón por
+# clave con folio de desglose, papeleta, factura, totales y completitud; se
+# recalcula por clave al escribir desgloses y papeletas (eventos del ORM) y se
+# reconstruye completa con `flask reconstruir-expedientes`. La vista de
+# expedientes y los cruces de facturación leen solo esta tabla.
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import object_session
+
+from app.models import db, Desglose, Papeleta, Expediente
+from app.services.busqueda import condicion_sql
+
+POR_PAGINA = 60
+
+# Misma normalización en SQL (índices de expresión) y en Python (eventos)
+_CLAVE_DESGLOSE = "upper(coalesce(nullif(clave_sabre, ''), nullif(clave_reserva, ''), 'SIN-CLAVE'))"
+_CLAVE_PAPELETA = "upper(coalesce(nullif(clave_sabre, ''), 'SIN-CLAVE'))"
+
+_COLUMNAS = (
+    'clave', 'desglose_folio', 'papeleta_id', 'papeleta_folio', 'pasajero', 'ruta',
+    'total', 'fecha', 'empresa_id', 'aerolinea_id', 'factura', 'requiere_papeleta',
+    'docs_requeridos', 'docs_completos', 'completo', 'usuario_ids', 'ultima_actividad',
+)
+
+# Desgloses y papeletas agregados por clave; cuando hay varios documentos con
+# la misma clave se toma el más reciente (folio/id mayor).
+_SQL_AGREGADO = """
+WITH d AS (
+    SELECT
+        """ + _CLAVE_DESGLOSE + """ AS clave,
+        max(folio) AS folio,
+        max(total) AS total,
+        max(fecha_emision) AS fecha,
+        (array_agg(pasajero_nombre ORDER BY folio DESC)
+            FILTER (WHERE coalesce(pasajero_nombre, '') <> ''))[1] AS pasajero,
+        (array_agg(ruta ORDER BY folio DESC) FILTER (WHERE coalesce(ruta, '') <> ''))[1] AS ruta,
+        (array_agg(empresa_id ORDER BY folio))[1] AS empresa_id,
+        (array_agg(aerolinea_id ORDER BY folio))[1] AS aerolinea_id,
+        (array_agg(numero_factura ORDER BY folio)
+            FILTER (WHERE coalesce(numero_factura, '') <> ''))[1] AS factura,
+        array_agg(DISTINCT usuario_id) AS usuarios,
+        max(coalesce(updated_at, created_at)) AS actividad
+    FROM desgloses
+    {filtro_desgloses}
+    GROUP BY 1
+),
+p AS (
+    SELECT
+        """ + _CLAVE_PAPELETA + """ AS clave,
+        max(id) AS id,
+        (array_agg(folio ORDER BY id DESC))[1] AS folio,
+        (array_agg(facturar_a ORDER BY id))[1] AS facturar_a,
+        (array_agg(total ORDER BY id))[1] AS total,
+        min(fecha_venta) AS fecha,
+        (array_agg(empresa_id ORDER BY id))[1] AS empresa_id,
+        (array_agg(aerolinea_id ORDER BY id))[1] AS aerolinea_id,
+        (array_agg(numero_factura ORDER BY id DESC)
+            FILTER (WHERE coalesce(numero_factura, '') <> ''))[1] AS factura,
+        array_agg(DISTINCT usuario_id) AS usuarios,
+        max(coalesce(updated_at, created_at)) AS actividad
+    FROM papeletas
+    {filtro_papeletas}
+    GROUP BY 1
+),
+e AS (
+    SELECT
+        coalesce(d.clave, p.clave) AS clave,
+        d.folio AS desglose_folio,
+        p.id AS papeleta_id,
+        p.folio AS papeleta_folio,
+        coalesce(d.pasajero, CASE WHEN d.clave IS NULL THEN nullif(p.facturar_a, '') END, 'Sin nombre') AS pasajero,
+        d.ruta,
+        coalesce(d.total, p.total, 0) AS total,
+        coalesce(d.fecha, p.fecha) AS fecha,
+        coalesce(d.empresa_id, p.empresa_id) AS empresa_id,
+        coalesce(d.aerolinea_id, p.aerolinea_id) AS aerolinea_id,
+        coalesce(p.factura, d.factura) AS factura,
+        (p.clave IS NOT NULL) AS requiere_papeleta,
+        -- Desglose y factura siempre se requieren; la papeleta solo si es low cost
+        2 + (p.clave IS NOT NULL)::int AS docs_requeridos,
+        (d.clave IS NOT NULL)::int
+            + (p.clave IS NOT NULL)::int
+            + (coalesce(p.factura, d.factura) IS NOT NULL)::int AS docs_completos,
+        ARRAY(
+            SELECT DISTINCT u
+            FROM unnest(coalesce(d.usuarios, '{{}}'::bigint[]) || coalesce(p.usuarios, '{{}}'::bigint[])) AS u
+            WHERE u IS NOT NULL
+        ) AS usuario_ids,
+        greatest(d.actividad, p.actividad) AS ultima_actividad
+    FROM d
+    FULL OUTER JOIN p ON p.clave = d.clave
+)
+SELECT
+    clave, desglose_folio, papeleta_id, papeleta_folio, pasajero, ruta,
+    total, fecha, empresa_id, aerolinea_id, factura, requiere_papeleta,
+    docs_requeridos, docs_completos, docs_completos >= docs_requeridos AS completo,
+    usuario_ids, ultima_actividad
+FROM e
+"""
+
+_SQL_UPSERT = (
+    'INSERT INTO expedientes (' + ', '.join(_COLUMNAS) + ')\n'
+    + _SQL_AGREGADO
+    + 'ON CONFLICT (clave) DO UPDATE SET '
+    + ', '.join(f'{c} = EXCLUDED.{c}' for c in _COLUMNAS if c != 'clave')
+)
+
+# Claves que se quedaron sin documentos (borrados o cambio de clave)
+_SQL_PURGAR = f"""
+DELETE FROM expedientes x
+WHERE x.clave = ANY(:claves)
+  AND NOT EXISTS (SELECT 1 FROM desgloses WHERE {_CLAVE_DESGLOSE} = x.clave)
+  AND NOT EXISTS (SELECT 1 FROM papeletas WHERE {_CLAVE_PAPELETA} = x.clave)
+"""
+
+# Página de la vista: el filtro, el conteo y el orden corren sobre la tabla
+# materializada; empresa y aerolínea solo se resuelven para la página
+_SQL_CONSULTA = """
+WITH pagina AS (
+    SELECT
+        x.*,
+        count(*) OVER () AS total_filas,
+        count(*) FILTER (WHERE x.completo) OVER () AS total_completos,
+        count(*) FILTER (WHERE x.fecha = :hoy) OVER () AS total_hoy
+    FROM expedientes x
+    {filtro}
+    ORDER BY x.fecha DESC NULLS LAST, x.clave
+    LIMIT :limite OFFSET :desplazamiento
+)
+SELECT
+    pagina.*,
+    (pagina.docs_completos * 100) / pagina.docs_requeridos AS progreso,
+    coalesce(em.nombre_empresa, '') AS empresa,
+    coalesce(a.nombre, 'Sin aerolínea') AS aerolinea
+FROM pagina
+LEFT JOIN empresas em ON em.id = pagina.empresa_id
+LEFT JOIN aerolineas a ON a.id = pagina.aerolinea_id
+ORDER BY pagina.fecha DESC NULLS LAST, pagina.clave
+"""
+
+
+def normalizar_pnr(clave):
+    """
+    Forma canónica de una clave de reservación (clave_sabre / clave_reserva):
+    sin espacios alrededor y en mayúsculas; vacía = None. Se aplica al
+    guardar, así las búsquedas por clave comparan por igualdad sobre el índice.
+    """
+    clave = (clave or '').strip().upper()
+    return clave or None
+
+
+def clave_desglose(clave_sabre, clave_reserva):
+    """Clave de expediente de un desglose (misma regla que _CLAVE_DESGLOSE)"""
+    return (clave_sabre or clave_reserva or 'SIN-CLAVE').upper()
+
+
+def clave_papeleta(clave_sabre):
+    """Clave de expediente de una papeleta (misma regla que _CLAVE_PAPELETA)"""
+    return (clave_sabre or 'SIN-CLAVE').upper()
+
+
+# =============================================================================
+# MANTENIMIENTO DE LA TABLA
+# =============================================================================
+
+def recalcular_expedientes(claves, conexion=None):
+    """Recalcula (upsert) los expedientes de las claves indicadas y borra los que quedaron vacíos"""
+    claves = sorted({c for c in claves if c})
+    if not claves:
+        return
+    conexion = conexion or db.session
+    params = {'claves': claves}
+    conexion.execute(text(_SQL_UPSERT.format(
+        filtro_desgloses=f'WHERE {_CLAVE_DESGLOSE} = ANY(:claves)',
+        filtro_papeletas=f'WHERE {_CLAVE_PAPELETA} = ANY(:claves)',
+    )), params)
+    conexion.execute(text(_SQL_PURGAR), params)
+
+
+def reconstruir_expedientes():
+    """Vacía y vuelve a llenar la tabla expedientes desde desgloses y papeletas. No hace commit."""
+    db.session.execute(text('TRUNCATE expedientes'))
+    db.session.execute(text(_SQL_UPSERT.format(filtro_desgloses='', filtro_papeletas='')))
+    return db.session.query(Expediente).count()
+
+
+_CLAVES_PENDIENTES = 'expedientes_claves_pendientes'
+
+
+def _valores(estado, atributo):
+    """Valor actual y anterior (si cambió en este flush) de un atributo"""
+    historial = estado.attrs[atributo].history
+    actual = (historial.added or historial.unchanged or [None])[0]
+    anterior = historial.deleted[0] if historial.deleted else actual
+    return actual, anterior
+
+
+def _marcar(target, claves):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_CLAVES_PENDIENTES, set()).update(claves)
+
+
+def _desglose_escrito(mapper, connection, target):
+    estado = inspect(target)
+    sabre, sabre_ant = _valores(estado, 'clave_sabre')
+    reserva, reserva_ant = _valores(estado, 'clave_reserva')
+    _marcar(target, {clave_desglose(sabre, reserva), clave_desglose(sabre_ant, reserva_ant)})
+
+
+def _papeleta_escrita(mapper, connection, target):
+    sabre, sabre_ant = _valores(inspect(target), 'clave_sabre')
+    _marcar(target, {clave_papeleta(sabre), clave_papeleta(sabre_ant)})
+
+
+for _evento in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Desglose, _evento, _desglose_escrito)
+    event.listen(Papeleta, _evento, _papeleta_escrita)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _actualizar_expedientes(session, flush_context):
+    """Recalcula una sola vez por flush las claves tocadas, en la misma transacción"""
+    claves = session.info.pop(_CLAVES_PENDIENTES, None)
+    if claves:
+        recalcular_expedientes(claves, session.connection())
+
+
+# =============================================================================
+# CONSULTAS
+# =============================================================================
+
+def _armar_expediente(fila):
+    """Convierte una fila del SQL en el dict que usa expedientes.html"""
+    return {
+        'clave': fila.clave,
+        'pasajero': fila.pasajero,
+        'ruta': fila.ruta,
+        'total': float(fila.total or 0),
+        'fecha': fila.fecha,
+        'empresa_id': fila.empresa_id,
+        'empresa': fila.empresa,
+        'aerolinea_id': fila.aerolinea_id,
+        'aerolinea': fila.aerolinea,
+        'desglose': {'folio': fila.desglose_folio} if fila.desglose_folio else None,
+        'papeleta': {'id': fila.papeleta_id, 'folio': fila.papeleta_folio} if fila.papeleta_id else None,
+        'factura': fila.factura,
+        'es_lowcost': fila.requiere_papeleta,
+        'es_facturacion': True,
+        'requiere_desglose': True,
+        'requiere_papeleta': fila.requiere_papeleta,
+        'requiere_factura': True,
+        'docs_requeridos': fila.docs_requeridos,
+        'docs_completos': fila.docs_completos,
+        'progreso': fila.progreso,
+        'completo': fila.completo,
+    }
+
+
+def consultar_expedientes(hoy, usuario_id=None, q='', estatus='', empresa_id=None,
+                          fecha_desde=None, fecha_hasta=None, pagina=1, por_pagina=POR_PAGINA):
+    """
+    Devuelve una página de expedientes y las estadísticas del conjunto filtrado.
+
+    Args:
+        hoy: Fecha de referencia para la estadística 'hoy'
+        usuario_id: Si se indica, solo expedientes con documentos de ese usuario (agentes)
+        q: Texto a buscar en clave o pasajero
+        estatus: 'completo', 'pendiente' o ''
+        empresa_id, fecha_desde, fecha_hasta: Filtros opcionales
+        pagina, por_pagina: Paginación (1-based)
+
+    Returns:
+        dict con 'expedientes', 'stats', 'total', 'pagina' y 'total_paginas'
+    """
+    params = {'hoy': hoy}
+
+    condiciones = []
+    if usuario_id is not None:
+        condiciones.append('x.usuario_ids @> ARRAY[CAST(:usuario_id AS bigint)]')
+        params['usuario_id'] = usuario_id
+    if q:
+        condiciones.append(condicion_sql('expedientes', q, params, alias='x'))
+    if estatus == 'completo':
+        condiciones.append('x.completo')
+    elif estatus == 'pendiente':
+        condiciones.append('NOT x.completo')
+    if empresa_id:
+        condiciones.append('x.empresa_id = :empresa_id')
+        params['empresa_id'] = int(empresa_id)
+    if fecha_desde:
+        condiciones.append('x.fecha >= :fecha_desde')
+        params['fecha_desde'] = fecha_desde
+    if fecha_hasta:
+        condiciones.append('x.fecha <= :fecha_hasta')
+        params['fecha_hasta'] = fecha_hasta
+
+    sql = text(_SQL_CONSULTA.format(
+        filtro=('WHERE ' + ' AND '.join(condiciones)) if condiciones else '',
+    ))
+
+    pagina = max(int(pagina or 1), 1)
+    params['limite'] = por_pagina
+    params['desplazamiento'] = (pagina - 1) * por_pagina
+    filas = db.session.execute(sql, params).all()
+
+    # Página fuera de rango: volver a la primera para no perder las estadísticas
+    if not filas and pagina > 1:
+        pagina = 1
+        params['desplazamiento'] = 0
+        filas = db.session.execute(sql, params).all()
+
+    total = filas[0].total_filas if filas else 0
+    completos = filas[0].total_completos if filas else 0
+
+    return {
+        'expedientes': [_armar_expediente(f) for f in filas],
+        'stats': {
+            'total': total,
+            'completos': completos,
+            'pendientes': total - completos,
+            'hoy': filas[0].total_hoy if filas else 0,
+        },
+        'total': total,
+        'pagina': pagina,
+        'total_paginas': (total + por_pagina - 1) // por_pagina,
+    }
+
+
+def desgloses_por_clave(claves):
+    """
+    Desglose vigente de cada clave (para los cruces papeleta → desglose de facturación).
+
+    Resuelve el folio en la tabla expedientes y carga solo esos desgloses. Las
+    claves que no resuelve se buscan en desgloses.clave_reserva, porque un
+    desglose con clave_sabre propia también se cruza por su clave de reserva.
+    Returns: {clave_original: Desglose}
+    """
+    normalizadas = {c: clave_papeleta(c) for c in claves if c}
+    if not normalizadas:
+        return {}
+
+    folios = dict(db.session.query(Expediente.clave, Expediente.desglose_folio).filter(
+        Expediente.clave.in_(set(normalizadas.values())),
+        Expediente.desglose_folio.isnot(None)
+    ).all())
+
+    desgloses = {}
+    if folios:
+        desgloses = {d.folio: d for d in Desglose.query.filter(Desglose.folio.in_(set(folios.values())))}
+    resultado = {}
+    for original, clave in normalizadas.items():
+        desglose = desgloses.get(folios.get(clave))
+        if desglose is not None:
+            resultado[original] = desglose
+
+    # Sin expediente propio: por clave de reserva (idx_desgloses_clave_reserva)
+    pendientes = {c: n for c, n in normalizadas.items() if c not in resultado}
+    if pendientes:
+        por_reserva = {}
+        for d in Desglose.query.filter(
+            Desglose.clave_reserva.in_(set(pendientes) | set(pendientes.values()))
+        ).order_by(Desglose.folio):
+            por_reserva[d.clave_reserva] = d
+        for original, clave in pendientes.items():
+            desglose = por_reserva.get(original) or por_reserva.get(clave)
+            if desglose is not None:
+                resultado[original] = desglose
+    return resultado
@@ -0,0 +1,154 @@
+# app/services/exportaciones.py
+# Exportación de papeletas y reportes de ventas a CSV o Excel
+#
+# Las filas se leen del cursor del servidor por lotes (yield_per) como tuplas
+# de columnas, sin objetos del ORM, y se escriben conforme llegan: el CSV se
+# entrega por bloques mientras se genera y el Excel se arma con openpyxl en
+# modo write_only sobre un archivo temporal que luego se envía por bloques.
+# La memoria no depende del rango de fechas exportado.
+
+import csv
+import io
+import tempfile
+
+from flask import Response, stream_with_context
+
+from app.models import db, Papeleta, ReporteVenta, TarjetaCorporativa, Aerolinea, Usuario, Sucursal
+
+# Filas por lote leídas del cursor (y por bloque del CSV)
+TAMANO_LOTE = 1000
+
+# Bytes por bloque al enviar el Excel
+TAMANO_BLOQUE = 64 * 1024
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# (encabezado, expresión) de cada columna exportada
+COLUMNAS_PAPELETAS = (
+    ('Folio', Papeleta.folio),
+    ('Fecha venta', Papeleta.fecha_venta),
+    ('Tarjeta', db.func.coalesce(TarjetaCorporativa.numero_tarjeta, Papeleta.tarjeta)),
+    ('Nombre tarjeta', TarjetaCorporativa.nombre_tarjeta),
+    ('Facturar a', Papeleta.facturar_a),
+    ('Solicitó', Papeleta.solicito),
+    ('Pasajero', Papeleta.pasajero_nombre),
+    ('Aerolínea', Aerolinea.nombre),
+    ('Clave Sabre', Papeleta.clave_sabre),
+    ('Clave reserva', Papeleta.clave_reserva),
+    ('Forma de pago', Papeleta.forma_pago),
+    ('Total ticket', Papeleta.total_ticket),
+    ('Comisión', Papeleta.diez_porciento),
+    ('Cargo', Papeleta.cargo),
+    ('Total', Papeleta.total),
+    ('Agente', Usuario.nombre),
+    ('Reporte de venta', ReporteVenta.folio),
+    ('Factura', Papeleta.numero_factura),
+)
+
+COLUMNAS_REPORTES = (
+    ('Folio', ReporteVenta.folio),
+    ('Fecha', ReporteVenta.fecha),
+    ('Agente', Usuario.nombre),
+    ('Sucursal', Sucursal.nombre),
+    ('Estatus', ReporteVenta.estatus),
+    ('Boletos', ReporteVenta.total_boletos),
+    ('Recibos', ReporteVenta.total_recibos),
+    ('BSP', ReporteVenta.total_bsp),
+    ('Volaris', ReporteVenta.total_volaris),
+    ('VivaAerobus', ReporteVenta.total_vivaerobus),
+    ('Compra TC', ReporteVenta.total_compra_tc),
+    ('Cargo exp.', ReporteVenta.total_cargo_expedicion),
+    ('Cargo 3.15%', ReporteVenta.total_cargo_315),
+    ('Seguros', ReporteVenta.total_seguros),
+    ('Hoteles', ReporteVenta.total_hoteles_paquetes),
+    ('Terrestre', ReporteVenta.total_transporte_terrestre),
+    ('Pago TC', ReporteVenta.total_pago_directo_tc),
+    ('Voucher TC', ReporteVenta.total_voucher_tc),
+    ('Efectivo', ReporteVenta.total_efectivo),
+    ('Total', ReporteVenta.total_general),
+)
+
+
+def filas_papeletas(query):
+    """Filas de COLUMNAS_PAPELETAS de una consulta de Papeleta (ya filtrada), por fecha de venta"""
+    return query.outerjoin(
+        TarjetaCorporativa, TarjetaCorporativa.id == Papeleta.tarjeta_id
+    ).outerjoin(
+        Aerolinea, Aerolinea.id == Papeleta.aerolinea_id
+    ).outerjoin(
+        Usuario, Usuario.id == Papeleta.usuario_id
+    ).outerjoin(
+        ReporteVenta, ReporteVenta.id == Papeleta.reporte_venta_id
+    ).with_entities(
+        *(columna for _, columna in COLUMNAS_PAPELETAS)
+    ).order_by(Papeleta.fecha_venta, Papeleta.id).yield_per(TAMANO_LOTE)
+
+
+def filas_reportes(query):
+    """Filas de COLUMNAS_REPORTES de una consulta de ReporteVenta (ya filtrada), por fecha"""
+    return query.outerjoin(
+        Usuario, Usuario.id == ReporteVenta.usuario_id
+    ).outerjoin(
+        Sucursal, Sucursal.id == ReporteVenta.sucursal_id
+    ).with_entities(
+        *(columna for _, columna in COLUMNAS_REPORTES)
+    ).order_by(ReporteVenta.fecha, ReporteVenta.id).yield_per(TAMANO_LOTE)
+
+
+def _csv(columnas, filas):
+    """Bloques del CSV (UTF-8 con BOM para que Excel respete los acentos)"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    buffer.write('\ufeff')
+    escritor.writerow([encabezado for encabezado, _ in columnas])
+    for n, fila in enumerate(filas, 1):
+        escritor.writerow(fila)
+        if n % TAMANO_LOTE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _xlsx(columnas, filas, hoja):
+    """
+    Bloques del .xlsx. openpyxl en write_only escribe cada fila a disco al
+    agregarla; el libro se cierra en un archivo temporal y se envía por partes.
+    """
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(hoja)
+    ws.append([encabezado for encabezado, _ in columnas])
+    for fila in filas:
+        ws.append(list(fila))
+
+    with tempfile.TemporaryFile() as archivo:
+        wb.save(archivo)
+        archivo.seek(0)
+        yield from iter(lambda: archivo.read(TAMANO_BLOQUE), b'')
+
+
+def respuesta_exportacion(nombre, formato, columnas, filas):
+    """
+    Response que genera el archivo mientras se envía.
+
+    Args:
+        nombre: Nombre del archivo sin extensión (también nombre de la hoja)
+        formato: 'csv' o 'xlsx'
+        columnas: COLUMNAS_PAPELETAS o COLUMNAS_REPORTES
+        filas: filas_papeletas() / filas_reportes() de la consulta filtrada
+    """
+    if formato == 'csv':
+        cuerpo = _csv(columnas, filas)
+    else:
+        formato = 'xlsx'
+        cuerpo = _xlsx(columnas, filas, nombre[:31])
+    return Response(
+        stream_with_context(cuerpo),
+        mimetype=FORMATOS[formato],
+        headers={'Content-Disposition': f'attachment; filename="{nombre}.{formato}"'}
+    )
@@ -0,0 +1,224 @@
+# app/services/logs.py
+# Logging estructurado para Kinessia Hub
+#
+# - Cada request recibe un id de correlación (header X-Request-ID) que se
+#   agrega a todas las líneas de log emitidas durante el request.
+# - span() mide el tiempo de bloques de I/O (BD, archivos) y lo registra.
+# - Los mensajes DEBUG se muestrean por request (LOG_DEBUG_SAMPLE_RATE).
+# - Los handlers reales corren en un hilo aparte (QueueHandler/QueueListener),
+#   así el request nunca espera a que se escriba en stderr.
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+LOGGER_RAIZ = 'kinessia'
+
+_listener = None
+
+
+def obtener_logger(nombre):
+    """Retorna un logger hijo de 'kinessia' (ej. obtener_logger('desgloses'))"""
+    return logging.getLogger(f'{LOGGER_RAIZ}.{nombre}')
+
+
+def request_id_actual():
+    """Id de correlación del request en curso, o None fuera de un request"""
+    if has_request_context():
+        return getattr(g, 'request_id', None)
+    return None
+
+
+class ContextoRequestFilter(logging.Filter):
+    """Agrega request_id al record y aplica el muestreo de mensajes DEBUG"""
+
+    def __init__(self, tasa_debug=1.0):
+        super().__init__()
+        self.tasa_debug = tasa_debug
+
+    def filter(self, record):
+        record.request_id = request_id_actual()
+
+        if record.levelno > logging.DEBUG:
+            return True
+
+        # El muestreo se decide una sola vez por request para que un request
+        # muestreado conserve todas sus líneas de debug
+        if has_request_context():
+            if not hasattr(g, 'log_debug_activo'):
+                g.log_debug_activo = random.random() < self.tasa_debug
+            return g.log_debug_activo
+        return random.random() < self.tasa_debug
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por record; los campos de extra={'campos': {...}} se incluyen tal cual"""
+
+    def format(self, record):
+        datos = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            datos['request_id'] = request_id
+        campos = getattr(record, 'campos', None)
+        if campos:
+            datos.update(campos)
+        excepcion = getattr(record, 'excepcion', None)
+        if excepcion:
+            datos['excepcion'] = excepcion
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class FormatoTexto(logging.Formatter):
+    """Formato legible para desarrollo: campos como clave=valor al final"""
+
+    def format(self, record):
+        linea = super().format(record)
+        campos = getattr(record, 'campos', None)
+        if campos:
+            linea += ' ' + ' '.join(f'{k}={v}' for k, v in campos.items())
+        excepcion = getattr(record, 'excepcion', None)
+        if excepcion:
+            linea += '\n' + excepcion
+        return linea
+
+
+class ColaHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que deja el traceback en record.excepcion en vez de pegarlo
+    al mensaje, para que los formatos lo emitan como campo propio.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.excepcion = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+
+@contextmanager
+def span(nombre, logger=None, nivel=logging.INFO, **campos):
+    """
+    Mide la duración de un bloque y la registra al salir.
+
+    Uso:
+        with span('desglose.commit', folio=folio):
+            db.session.commit()
+    """
+    logger = logger or obtener_logger('span')
+    inicio = time.perf_counter()
+    error = None
+    try:
+        yield campos
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duracion_ms = round((time.perf_counter() - inicio) * 1000, 2)
+        datos = {'span': nombre, 'duracion_ms': duracion_ms, **campos}
+        if error:
+            datos['error'] = error
+        logger.log(nivel, nombre, extra={'campos': datos})
+
+
+def _registrar_tiempos_bd(app, db):
+    """Acumula tiempo y número de consultas SQL del request en g"""
+    from sqlalchemy import event
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_inicio_consulta', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _despues(conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info['_inicio_consulta'].pop()
+        if has_request_context():
+            g.bd_ms = getattr(g, 'bd_ms', 0.0) + (time.perf_counter() - inicio) * 1000
+            g.bd_consultas = getattr(g, 'bd_consultas', 0) + 1
+
+
+@atexit.register
+def _detener_listener():
+    """Detiene el listener actual (una sola vez); también corre al salir del intérprete"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configurar_logging(app, db=None):
+    """Configura el logger 'kinessia' con cola no bloqueante y hooks de request"""
+    global _listener
+
+    nivel = getattr(logging, str(app.config.get('LOG_LEVEL', 'INFO')).upper(), logging.INFO)
+    tasa_debug = float(app.config.get('LOG_DEBUG_SAMPLE_RATE', 1.0))
+
+    handler_salida = logging.StreamHandler(sys.stderr)
+    if app.config.get('LOG_FORMAT', 'json') == 'json':
+        handler_salida.setFormatter(FormatoJSON())
+    else:
+        handler_salida.setFormatter(FormatoTexto('%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'))
+
+    # El filtro va en el QueueHandler: corre en el hilo del request,
+    # que es donde existen flask.g y el request_id
+    cola = queue.SimpleQueue()
+    handler_cola = ColaHandler(cola)
+    handler_cola.addFilter(ContextoRequestFilter(tasa_debug))
+
+    _detener_listener()
+    _listener = logging.handlers.QueueListener(cola, handler_salida, respect_handler_level=True)
+    _listener.start()
+
+    raiz = logging.getLogger(LOGGER_RAIZ)
+    raiz.handlers = [handler_cola]
+    raiz.setLevel(nivel)
+    raiz.propagate = False
+
+    if db is not None:
+        _registrar_tiempos_bd(app, db)
+
+    log_requests = obtener_logger('request')
+
+    @app.before_request
+    def _iniciar_request():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.inicio_request = time.perf_counter()
+
+    @app.after_request
+    def _terminar_request(response):
+        response.headers['X-Request-ID'] = g.get('request_id', '')
+        inicio = g.get('inicio_request')
+        if inicio is not None and not request.path.startswith('/static/'):
+            log_requests.info('request', extra={'campos': {
+                'metodo': request.method,
+                'ruta': request.path,
+                'status': response.status_code,
+                'duracion_ms': round((time.perf_counter() - inicio) * 1000, 2),
+                'bd_ms': round(g.get('bd_ms', 0.0), 2),
+                'bd_consultas': g.get('bd_consultas', 0),
+            }})
+        return response
+
+    return raiz
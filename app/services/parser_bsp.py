@@ -0,0 +1,260 @@
+# app/services/parser_bsp.py
+# Lectura del reporte FCAGBILLDET de BSP (PDF y TXT simplificado)
+#
+# PDF: cada página se convierte en una lista de "eventos" en orden de
+# aparición: periodo, documento o +RTDN. Extraer el texto y aplicar las
+# expresiones regulares es lo costoso y no depende de otras páginas, así que
+# puede repartirse entre procesos (opcional, BSP_PDF_PROCESOS). Los procesos
+# se crean con 'spawn': quien los lanza ya tiene hilos (el de logging) y un
+# fork heredaría sus locks. Los eventos se combinan después en orden de
+# página, en un solo paso, para que un +RTDN al inicio de una página se
+# asigne al último documento de la página anterior igual que en modo serial.
+#
+# TXT: se lee como stream con el módulo csv (iterar_bsp_txt) y el cruce lo
+# consume por lotes, sin cargar el archivo completo.
+
+import csv
+import io
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# Subir al cambiar el formato de los documentos para invalidar la caché
+# de archivos_conciliacion
+VERSION_PARSER_PDF = '2'
+
+# Con menos páginas que esto no vale la pena levantar procesos
+MIN_PAGINAS_PARALELO = 20
+
+# En modo serial con reporte de avance, páginas por bloque
+PAGINAS_POR_AVANCE = 25
+
+_DOC_PATTERN = re.compile(
+    r'^(\d{3})\s+'                    # CIA (3 dígitos)
+    r'(TKTT|EMDS|EMDA|CANX)\s+'       # TRNC
+    r'(\d{7,10})\s+'                   # NO. DOCUMENTO
+    r'(\d{2}[A-Z]{3}\d{2})\s+'        # FECHA EMISION
+    r'(\S+)\s+'                        # CPN
+)
+_RTDN_PATTERN = re.compile(r'^\+RTDN:\s*(\d{7,10})')
+_PERIODO_PATTERN = re.compile(r'Billing Period:(\d{6})')
+_MONTO_PATTERN = re.compile(r'-?[\d,]+\.\d{2}')
+_FOP_PATTERN = re.compile(r'\s([ID])\s+(CA|CC)\s')
+
+# Líneas a ignorar
+_SKIP_PREFIXES = (
+    'ESAC:', 'ISSUES TOTAL', 'FCAGBILLDET', 'SCOPE', 'CIA ', 'NO. DE',
+    '***', 'GRAND TOTAL', 'DOMESTIC TOTAL', 'INTERNATIONAL TOTAL',
+    'ISSUES', 'CA ', 'CC ', '**'
+)
+
+
+def _monto(texto):
+    return float(texto.replace(',', ''))
+
+
+def parsear_texto_pagina(texto):
+    """
+    Convierte el texto de una página en eventos:
+    ('periodo', '260104'), ('doc', {...}) o ('rtdn', '5463633094').
+    """
+    eventos = []
+    if not texto:
+        return eventos
+
+    for line in texto.split('\n'):
+        line = line.strip()
+
+        pm = _PERIODO_PATTERN.search(line)
+        if pm:
+            eventos.append(('periodo', pm.group(1)))
+            continue
+
+        # +RTDN (revisado/cambio) del documento anterior
+        rm = _RTDN_PATTERN.match(line)
+        if rm:
+            eventos.append(('rtdn', rm.group(1)))
+            continue
+
+        if line.startswith(_SKIP_PREFIXES) or 'Page :' in line:
+            continue
+
+        dm = _DOC_PATTERN.match(line)
+        if not dm:
+            continue
+
+        airline_code = dm.group(1)
+        document_number = dm.group(3)
+
+        # Montos del resto de la línea
+        montos = _MONTO_PATTERN.findall(line[dm.end():])
+
+        fop = 'CA'
+        scope = 'Doméstico'
+        fm = _FOP_PATTERN.search(line)
+        if fm:
+            fop = fm.group(2)
+            if fm.group(1) == 'I':
+                scope = 'Internacional'
+
+        eventos.append(('doc', {
+            'airline_code': airline_code,
+            'trnc': dm.group(2),
+            'document_number': document_number,
+            'numero_completo': airline_code + document_number,
+            'fecha_emision': dm.group(4),
+            'fop': fop,
+            'scope': scope,
+            'transaction_amount': _monto(montos[0]) if montos else 0.0,
+            'tarifa': _monto(montos[1]) if len(montos) >= 2 else 0.0,
+            'balance_payable': _monto(montos[-1]) if montos else 0.0,
+            'es_revisado': False,
+            'rtdn': None,
+        }))
+
+    return eventos
+
+
+def _extraer_rango(filepath, inicio, fin):
+    """Eventos de las páginas [inicio, fin) del PDF. Corre en un proceso del pool."""
+    import pdfplumber
+
+    # pages= limita a pdfplumber a cargar solo el rango (numeración 1-based)
+    with pdfplumber.open(filepath, pages=list(range(inicio + 1, fin + 1))) as pdf:
+        return [parsear_texto_pagina(page.extract_text()) for page in pdf.pages]
+
+
+def combinar_eventos(eventos_por_pagina):
+    """Une los eventos de todas las páginas, en orden, en el resultado del parser"""
+    documentos = []
+    periodo = ''
+    ultimo_doc = None
+
+    for eventos in eventos_por_pagina:
+        for tipo, valor in eventos:
+            if tipo == 'periodo':
+                periodo = valor
+            elif tipo == 'rtdn':
+                if ultimo_doc:
+                    ultimo_doc['rtdn'] = valor
+                    ultimo_doc['es_revisado'] = True
+            else:
+                documentos.append(valor)
+                ultimo_doc = valor
+
+    return {
+        'periodo': periodo,
+        'documentos': documentos,
+    }
+
+
+def contar_paginas(filepath):
+    import pdfplumber
+
+    with pdfplumber.open(filepath) as pdf:
+        return len(pdf.pages)
+
+
+def _rangos(paginas, tamano):
+    return [(i, min(i + tamano, paginas)) for i in range(0, paginas, tamano)]
+
+
+def parsear_bsp_pdf(filepath, procesos=1, avance=None):
+    """
+    Parsear archivo FCAGBILLDET en formato PDF.
+
+    Args:
+        filepath: Ruta del PDF
+        procesos: 1 = serial; >1 = reparte rangos de páginas entre ese número
+                  de procesos; 0/None = uno por CPU disponible
+        avance: Función opcional avance(paginas_leidas, paginas_total)
+
+    Returns:
+        dict con 'periodo', 'documentos' y 'paginas'
+    """
+    paginas = contar_paginas(filepath)
+    if not procesos or procesos < 0:
+        procesos = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    procesos = min(procesos, paginas)
+
+    eventos_por_pagina = []
+    if procesos <= 1 or paginas < MIN_PAGINAS_PARALELO:
+        # Por bloques solo si hay que reportar avance; si no, se abre el PDF una vez
+        for inicio, fin in _rangos(paginas, PAGINAS_POR_AVANCE if avance else max(paginas, 1)):
+            eventos_por_pagina.extend(_extraer_rango(filepath, inicio, fin))
+            if avance:
+                avance(fin, paginas)
+    else:
+        # Rangos contiguos (varios por proceso para balancear páginas densas)
+        rangos = _rangos(paginas, max(1, -(-paginas // (procesos * 4))))
+        # spawn y no fork: el proceso (gunicorn o el worker) ya tiene hilos corriendo
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futuros = [pool.submit(_extraer_rango, filepath, inicio, fin) for inicio, fin in rangos]
+            # Los resultados se toman en el orden de los rangos, no de terminación
+            for futuro, (_, fin) in zip(futuros, rangos):
+                eventos_por_pagina.extend(futuro.result())
+                if avance:
+                    avance(fin, paginas)
+
+    resultado = combinar_eventos(eventos_por_pagina)
+    resultado['paginas'] = paginas
+    return resultado
+
+
+def periodo_de_nombre(nombre):
+    """Periodo (AAMMDD) del nombre del archivo: FCAGBILLDETSIMP_MX_86506696_260104.txt → '260104'"""
+    base = os.path.splitext(os.path.basename(nombre or ''))[0]
+    for parte in base.split('_'):
+        if len(parte) == 6 and parte.isdigit():
+            return parte
+    return ''
+
+
+def _monto_txt(texto):
+    """Monto del TXT: acepta separador de miles ('1,234.50', en campo entre comillas); vacío o inválido = 0"""
+    try:
+        return _monto(texto.strip())
+    except ValueError:
+        return 0.0
+
+
+def iterar_bsp_txt(stream):
+    """
+    Documentos de un FCAGBILLDETSIMP (.txt/.csv), uno por uno.
+
+    Lee el stream binario del upload en bloques (TextIOWrapper + csv), así que
+    la memoria no depende del tamaño del archivo y los campos entre comillas
+    con comas se respetan. Incluye las cancelaciones (CANX); el cruce las separa.
+    """
+    # utf-8-sig quita el BOM que agregan algunos exportadores
+    texto = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='ignore', newline='')
+    try:
+        for campos in csv.reader(texto):
+            if len(campos) < 8:
+                continue
+
+            airline_code = campos[0].strip()
+            # Encabezados (Agent Code, Airline Code) y comentarios
+            if not airline_code or airline_code.startswith('#') or not airline_code.isdigit():
+                continue
+
+            airline_code = airline_code.zfill(3)  # Asegurar 3 dígitos: 001, 006, etc.
+            document_number = campos[2].strip()
+
+            yield {
+                'airline_code': airline_code,
+                'trnc': campos[1].strip(),
+                'document_number': document_number,
+                'numero_completo': airline_code + document_number,
+                'fop': campos[3].strip(),
+                'transaction_amount': _monto_txt(campos[4]),
+                'tax_on_commission': _monto_txt(campos[5]),
+                'balance_payable': _monto_txt(campos[6]),
+                'currency': campos[7].strip() or 'MXN',
+                'es_revisado': False,
+                'rtdn': None,
+            }
+    finally:
+        # Soltar el stream sin cerrarlo (es del upload / del worker)
+        texto.detach()
@@ -0,0 +1,202 @@
+# app/services/parser_viva.py
+# Lectura del reporte de agencia de Viva Aerobus (.csv o .xlsx)
+#
+# El portal de agencias exporta el reporte de ventas y el de compensaciones en
+# CSV o Excel, con columnas en distinto orden según el reporte. Las columnas se
+# ubican por su encabezado (PNR, total, compensación, ...) y el archivo se lee
+# en stream: el CSV con TextIOWrapper + csv y el Excel en modo read_only.
+
+import codecs
+import csv
+import io
+import re
+import unicodedata
+from datetime import datetime
+
+# Subir al cambiar parsear_viva para invalidar los resultados en caché
+VERSION_PARSER_VIVA = '1'
+
+# Encabezados reconocidos por campo (sin acentos, en mayúsculas)
+_ENCABEZADOS = {
+    'pnr': ('PNR', 'RESERVA', 'CLAVE DE RESERVACION', 'CLAVE RESERVACION', 'RECORD LOCATOR', 'LOCALIZADOR'),
+    'fecha': ('FECHA', 'FECHA DE VENTA', 'FECHA VENTA', 'FECHA DE EMISION', 'FECHA DE RESERVACION'),
+    'agente': ('AGENTE', 'USUARIO', 'CREADO POR'),
+    'pasajero': ('PASAJERO', 'NOMBRE DEL PASAJERO', 'NOMBRE'),
+    'total': ('TOTAL', 'MONTO', 'IMPORTE', 'TOTAL PAGADO', 'MONTO TOTAL', 'PAGO'),
+    'compensacion': ('COMPENSACION', 'COMISION', 'COMPENSACION AGENCIA', 'MONTO COMPENSACION', 'COMISION AGENCIA'),
+}
+
+# Renglones del inicio en los que se busca el encabezado (título, filtros del portal)
+_RENGLONES_ENCABEZADO = 20
+
+_FORMATOS_FECHA = ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y %H:%M', '%Y-%m-%d %H:%M:%S')
+
+
+def _normalizar(texto):
+    """Encabezado sin acentos, en mayúsculas y con espacios simples"""
+    texto = unicodedata.normalize('NFKD', str(texto or ''))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.upper().split())
+
+
+def _columnas(fila):
+    """{campo: índice} si el renglón es el encabezado del reporte, o None"""
+    columnas = {}
+    for indice, valor in enumerate(fila):
+        nombre = _normalizar(valor)
+        for campo, nombres in _ENCABEZADOS.items():
+            if campo not in columnas and nombre in nombres:
+                columnas[campo] = indice
+                break
+    if 'pnr' in columnas and ('total' in columnas or 'compensacion' in columnas):
+        return columnas
+    return None
+
+
+def _monto(valor):
+    """Monto de una celda ('$1,234.50', '1234.5', número); None si está vacía o no es número"""
+    if valor is None or valor == '':
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    texto = re.sub(r'[^\d.\-]', '', str(valor))
+    try:
+        return float(texto)
+    except ValueError:
+        return None
+
+
+def _fecha(valor):
+    """Fecha de una celda como date, o None"""
+    if hasattr(valor, 'date') and callable(valor.date):
+        return valor.date()
+    if hasattr(valor, 'strftime'):
+        return valor
+    texto = str(valor or '').strip()
+    for formato in _FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _documento(fila, columnas):
+    """Registro de un renglón del reporte, o None si no es un renglón de venta"""
+    def celda(campo):
+        indice = columnas.get(campo)
+        if indice is None or indice >= len(fila):
+            return None
+        return fila[indice]
+
+    pnr = str(celda('pnr') or '').strip().upper()
+    if len(pnr) < 3 or pnr.startswith('=') or _normalizar(pnr) in _ENCABEZADOS['pnr']:
+        return None
+
+    total = _monto(celda('total'))
+    compensacion = _monto(celda('compensacion'))
+    if total is None and compensacion is None:
+        return None
+
+    fecha = _fecha(celda('fecha'))
+    return {
+        'fecha': fecha.strftime('%d/%m/%Y') if fecha else str(celda('fecha') or '').strip(),
+        'pnr': pnr,
+        'agente': str(celda('agente') or '').strip(),
+        'pasajero': str(celda('pasajero') or '').strip(),
+        'total': total,
+        'compensacion': compensacion,
+    }
+
+
+def _documentos(filas):
+    """Registros de una tabla (iterable de renglones): busca el encabezado y lee lo que sigue"""
+    columnas = None
+    for numero, fila in enumerate(filas):
+        if columnas is None:
+            if numero >= _RENGLONES_ENCABEZADO:
+                return
+            columnas = _columnas(fila)
+            continue
+        documento = _documento(fila, columnas)
+        if documento:
+            yield documento
+
+
+def _codificacion_csv(muestra):
+    """
+    'utf-8-sig' si la muestra decodifica como UTF-8 (con o sin BOM); si no,
+    'cp1252', que es como guarda Excel el CSV en Windows en español.
+    """
+    try:
+        # Incremental: un carácter cortado al final de la muestra no es error
+        codecs.getincrementaldecoder('utf-8-sig')().decode(muestra, final=False)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'cp1252'
+
+
+def _filas_csv(stream):
+    """Renglones de un CSV leído en bloques; detecta ',' ';' o tabulador con la primera parte del archivo"""
+    muestra = stream.read(8192)
+    stream.seek(0)
+    codificacion = _codificacion_csv(muestra)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra.decode(codificacion, errors='replace'), delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+
+    # utf-8-sig quita el BOM que agrega Excel al guardar como CSV; un byte
+    # inválido más adelante queda como '\ufffd' en vez de perder el carácter
+    texto = io.TextIOWrapper(stream, encoding=codificacion, errors='replace', newline='')
+    try:
+        yield from csv.reader(texto, dialecto)
+    finally:
+        # Soltar el stream sin cerrarlo (es del upload / del worker)
+        texto.detach()
+
+
+def iterar_viva(archivo):
+    """
+    Registros del reporte de Viva Aerobus, uno por uno.
+
+    Args:
+        archivo: FileStorage del upload (.csv o .xlsx)
+
+    Yields:
+        Un dict por renglón con fecha, pnr, agente, pasajero, total y
+        compensacion (None si el reporte no trae esa columna)
+    """
+    if (archivo.filename or '').lower().endswith('.csv'):
+        yield from _documentos(_filas_csv(archivo.stream))
+        return
+
+    import openpyxl
+
+    wb = openpyxl.load_workbook(archivo.stream, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            yield from _documentos(ws.iter_rows(values_only=True))
+    finally:
+        # En read_only el libro mantiene abierto el zip hasta cerrarlo
+        wb.close()
+
+
+def parsear_viva(archivo):
+    """
+    Parsear reporte de agencia de Viva Aerobus (.csv o .xlsx).
+
+    El reporte no trae el periodo en un lugar fijo; se toma de la primera y
+    la última fecha de venta ('01/03/2026 AL 31/03/2026').
+    """
+    documentos = list(iterar_viva(archivo))
+
+    fechas = [f for f in (_fecha(d['fecha']) for d in documentos) if f]
+    periodo = ''
+    if fechas:
+        periodo = f'{min(fechas):%d/%m/%Y} AL {max(fechas):%d/%m/%Y}'
+
+    return {
+        'periodo': periodo,
+        'documentos': documentos
+    }
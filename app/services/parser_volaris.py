@@ -0,0 +1,83 @@
+# app/services/parser_volaris.py
+# Lectura del reporte de ventas de Volaris (.xlsx)
+#
+# El libro se abre en modo read_only y se recorre con iter_rows(values_only):
+# openpyxl lee el XML de cada hoja en stream y entrega tuplas de valores, sin
+# construir los objetos Cell del libro completo.
+
+# Subir al cambiar parsear_volaris_xlsx para invalidar los resultados en caché
+VERSION_PARSER_VOLARIS = '1'
+
+# Columnas del reporte (base 0): fecha, PNR, agente, pasajero, -, pago
+_COLUMNAS = 6
+
+
+def _documento(fila):
+    """Registro de un renglón del reporte, o None si no es un renglón de venta"""
+    fecha, pnr, agente, pasajero, _, pago = (tuple(fila) + (None,) * _COLUMNAS)[:_COLUMNAS]
+
+    if not pnr or not isinstance(pnr, str) or len(pnr.strip()) < 3:
+        return None
+
+    pnr = pnr.strip().upper()
+
+    if pnr.startswith('=') or pnr == 'PNR':
+        return None
+
+    try:
+        pago_num = float(pago) if pago else 0.0
+    except (ValueError, TypeError):
+        return None
+
+    return {
+        'fecha': fecha.strftime('%d/%m/%Y') if hasattr(fecha, 'strftime') else str(fecha or ''),
+        'pnr': pnr,
+        'agente': str(agente or '').strip(),
+        'pasajero': str(pasajero or '').strip(),
+        'pago': pago_num
+    }
+
+
+def iterar_volaris_xlsx(archivo):
+    """
+    Renglones del reporte de ventas de Volaris, uno por uno.
+
+    Yields:
+        ('periodo', texto) con el título de cada hoja y ('doc', registro) por
+        cada renglón de venta, en el orden del archivo
+    """
+    import openpyxl
+
+    wb = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            filas = ws.iter_rows(values_only=True)
+            encabezado = next(filas, None)
+            titulo = encabezado[0] if encabezado else None
+            if titulo:
+                yield 'periodo', str(titulo).replace('REPORTE DE VENTAS DEL ', '').strip()
+
+            for fila in filas:
+                documento = _documento(fila)
+                if documento:
+                    yield 'doc', documento
+    finally:
+        # En read_only el libro mantiene abierto el zip hasta cerrarlo
+        wb.close()
+
+
+def parsear_volaris_xlsx(archivo):
+    """Parsear reporte de ventas de Volaris (.xlsx): fecha, PNR, agente, pasajero y pago por renglón"""
+    documentos = []
+    periodo = ''
+
+    for tipo, valor in iterar_volaris_xlsx(archivo):
+        if tipo == 'periodo':
+            periodo = periodo or valor
+        else:
+            documentos.append(valor)
+
+    return {
+        'periodo': periodo,
+        'documentos': documentos
+    }
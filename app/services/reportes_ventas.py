@@ -0,0 +1,440 @@
+# app/services/reportes_ventas.py
+# Reportes de ventas: líneas desde papeletas y totales
+#
+# Los totales de reportes_ventas (montos, boletos, recibos y boletos por
+# aerolínea) se mantienen al escribir cada línea: se aplica la diferencia
+# entre los valores anteriores y los nuevos de la línea con un solo UPDATE,
+# sin leer las demás líneas. recalcular_totales() los calcula desde cero en
+# SQL y `flask verificar-totales-reportes` compara ambos.
+#
+# Las papeletas de mostrador se agregan por lotes (agregar_papeletas): se
+# toman con un UPDATE, se clasifican en memoria y sus líneas se insertan en
+# un solo INSERT. generar_reporte_dia() arma así el reporte diario de un
+# agente; lo usan el botón "Generar del día" y `flask generar-reportes-ventas`.
+#
+# La columna de cada línea sale de tarjetas_corporativas.categoria y
+# papeletas.forma_pago_clase, que se calculan al guardar con
+# categoria_tarjeta() y clase_forma_pago() (migracion_clasificacion_pagos.sql
+# llena los registros anteriores con las mismas reglas).
+#
+# El listado se pagina por llave (fecha, id) con pagina_reportes() y cuenta
+# los reportes por estatus en una consulta agrupada (conteo_por_estatus).
+
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from app.models import db, ReporteVenta, DetalleReporteVenta, Papeleta
+
+# Papeletas de hasta estos días antes de la fecha del reporte se pueden agregar
+DIAS_PAPELETAS_DISPONIBLES = 30
+
+# Reportes por página en el listado
+POR_PAGINA_REPORTES = 50
+
+# Clases de forma de pago que van a la columna efectivo del reporte
+CLASES_EFECTIVO = ('efectivo', 'deposito')
+
+# Columna de detalle_reporte_ventas -> columna de reportes_ventas
+COLUMNAS_TOTALES = (
+    ('monto_bsp', 'total_bsp'),
+    ('monto_volaris', 'total_volaris'),
+    ('monto_vivaerobus', 'total_vivaerobus'),
+    ('monto_compra_tc', 'total_compra_tc'),
+    ('cargo_expedicion', 'total_cargo_expedicion'),
+    ('cargo_315', 'total_cargo_315'),
+    ('monto_seguros', 'total_seguros'),
+    ('monto_hoteles_paquetes', 'total_hoteles_paquetes'),
+    ('monto_transporte_terrestre', 'total_transporte_terrestre'),
+    ('pago_directo_tc', 'total_pago_directo_tc'),
+    ('voucher_tc', 'total_voucher_tc'),
+    ('efectivo', 'total_efectivo'),
+    ('total_linea', 'total_general'),
+)
+
+# Boletos por clave de aerolínea: los del JSON guardado más los renglones
+# (clave, boletos) de :claves/:boletos; se omiten las claves que quedan en 0.
+_BOLETOS_AEROLINEA = """(
+    SELECT coalesce(json_object_agg(clave, boletos), '{}'::json)
+    FROM (
+        SELECT clave, sum(boletos) AS boletos
+        FROM (
+            SELECT key AS clave, value::int AS boletos
+            FROM json_each_text(coalesce(r.boletos_aerolinea, '{}'::json))
+            UNION ALL
+            SELECT * FROM unnest(CAST(:claves AS text[]), CAST(:boletos AS int[]))
+        ) movimientos
+        WHERE coalesce(clave, '') <> ''
+        GROUP BY clave
+        HAVING sum(boletos) <> 0
+    ) por_clave
+)"""
+
+_SQL_DELTA = (
+    'UPDATE reportes_ventas r SET '
+    + ', '.join(f'{total} = coalesce({total}, 0) + CAST(:{total} AS numeric)' for _, total in COLUMNAS_TOTALES)
+    + ', total_boletos = coalesce(total_boletos, 0) + :total_boletos'
+    + ', total_recibos = coalesce(total_recibos, 0) + :total_recibos'
+    + ', boletos_aerolinea = ' + _BOLETOS_AEROLINEA
+    + ' WHERE r.id = :reporte_id'
+)
+
+# Totales exactos desde las líneas; {filtro} limita a un reporte
+_SQL_CALCULADOS = """
+SELECT
+    r.id,
+    """ + ',\n    '.join(f'coalesce(sum(d.{linea}), 0) AS {total}' for linea, total in COLUMNAS_TOTALES) + """,
+    coalesce(sum(d.num_boletos), 0) AS total_boletos,
+    count(d.id) AS total_recibos,
+    coalesce((
+        SELECT json_object_agg(clave_aerolinea, boletos)
+        FROM (
+            SELECT clave_aerolinea, sum(num_boletos) AS boletos
+            FROM detalle_reporte_ventas
+            WHERE reporte_id = r.id AND coalesce(clave_aerolinea, '') <> ''
+            GROUP BY clave_aerolinea
+            HAVING sum(num_boletos) <> 0
+        ) por_clave
+    ), '{{}}'::json) AS boletos_aerolinea
+FROM reportes_ventas r
+LEFT JOIN detalle_reporte_ventas d ON d.reporte_id = r.id
+{filtro}
+GROUP BY r.id
+"""
+
+_COLUMNAS_RECALCULO = [total for _, total in COLUMNAS_TOTALES] + ['total_boletos', 'total_recibos', 'boletos_aerolinea']
+
+_SQL_RECALCULAR = (
+    'UPDATE reportes_ventas r SET '
+    + ', '.join(f'{c} = c.{c}' for c in _COLUMNAS_RECALCULO)
+    + ' FROM (' + _SQL_CALCULADOS + ') c WHERE r.id = c.id'
+)
+
+# Reportes cuyos totales guardados no coinciden con los calculados
+_SQL_DIFERENCIAS = (
+    'SELECT r.id, r.folio FROM reportes_ventas r JOIN (' + _SQL_CALCULADOS + ') c ON c.id = r.id WHERE '
+    + ' OR '.join(
+        f'coalesce(r.{c}, 0) <> c.{c}' for c in _COLUMNAS_RECALCULO if c != 'boletos_aerolinea'
+    )
+    + " OR coalesce(r.boletos_aerolinea, '{{}}'::json)::jsonb <> c.boletos_aerolinea::jsonb"
+    + ' ORDER BY r.id'
+)
+
+
+def valores_linea(detalle):
+    """Valores de una línea que cuentan para los totales (antes de modificarla o al agregarla)"""
+    valores = {linea: float(getattr(detalle, linea) or 0) for linea, _ in COLUMNAS_TOTALES}
+    valores['num_boletos'] = int(detalle.num_boletos or 0)
+    valores['clave_aerolinea'] = detalle.clave_aerolinea or ''
+    return valores
+
+
+def aplicar_delta(reporte_id, anterior=None, nuevo=None):
+    """
+    Actualiza los totales del reporte con la diferencia de una línea, en un solo UPDATE.
+
+    anterior y nuevo son valores_linea() de la línea antes y después del
+    cambio: solo nuevo al agregar, solo anterior al eliminar. No hace commit;
+    los totales del objeto ReporteVenta se recargan en el commit.
+    """
+    vacio = {linea: 0 for linea, _ in COLUMNAS_TOTALES}
+    antes = anterior or dict(vacio, num_boletos=0, clave_aerolinea='')
+    despues = nuevo or dict(vacio, num_boletos=0, clave_aerolinea='')
+
+    parametros = {
+        total: round(despues[linea] - antes[linea], 2) for linea, total in COLUMNAS_TOTALES
+    }
+    parametros.update(
+        reporte_id=reporte_id,
+        total_boletos=despues['num_boletos'] - antes['num_boletos'],
+        total_recibos=(nuevo is not None) - (anterior is not None),
+        claves=[antes['clave_aerolinea'], despues['clave_aerolinea']],
+        boletos=[-antes['num_boletos'], despues['num_boletos']],
+    )
+    db.session.execute(text(_SQL_DELTA), parametros)
+
+
+def recalcular_totales(reporte_id=None):
+    """
+    Recalcula desde las líneas los totales de un reporte (o de todos) en un
+    solo UPDATE. Regresa los reportes actualizados. No hace commit.
+    """
+    if reporte_id is None:
+        return db.session.execute(text(_SQL_RECALCULAR.format(filtro=''))).rowcount
+    return db.session.execute(
+        text(_SQL_RECALCULAR.format(filtro='WHERE r.id = :reporte_id')), {'reporte_id': reporte_id}
+    ).rowcount
+
+
+def reportes_con_diferencias():
+    """[(id, folio)] de los reportes cuyos totales guardados no coinciden con sus líneas"""
+    return db.session.execute(text(_SQL_DIFERENCIAS.format(filtro=''))).all()
+
+
+def generar_folio():
+    """Genera folio automático RV-YYYY-NNNN"""
+    anio = date.today().year
+    ultimo = ReporteVenta.query.filter(
+        ReporteVenta.folio.like(f'RV-{anio}-%')
+    ).order_by(ReporteVenta.folio.desc()).first()
+    
+    if ultimo and ultimo.folio:
+        try:
+            num = int(ultimo.folio.split('-')[-1]) + 1
+        except (ValueError, IndexError):
+            num = 1
+    else:
+        num = 1
+    return f'RV-{anio}-{num:04d}'
+
+
+def categoria_tarjeta(nombre_tarjeta):
+    """
+    Categoría de una tarjeta corporativa por su nombre: 'volaris' (CREDITO
+    VOLARIS / CVOL), 'vivaaerobus' (CREDITO VIVAAEROBUS / CVIV) o
+    'compra_tc' para cualquier otra (VISA, MASTER, INVEX, etc.).
+    """
+    nombre = (nombre_tarjeta or '').upper()
+    if 'VOLARIS' in nombre or 'CVOL' in nombre or nombre.startswith('CREDITO VOL'):
+        return 'volaris'
+    if 'VIVA' in nombre or 'CVIV' in nombre or nombre.startswith('CREDITO VIV'):
+        return 'vivaaerobus'
+    return 'compra_tc'
+
+
+def clase_forma_pago(forma_pago):
+    """
+    Clase de la forma de pago del cliente: 'efectivo' (efectivo / contado),
+    'deposito' (depósito / transferencia) o 'voucher' para lo demás.
+    """
+    forma = (forma_pago or '').lower()
+    if 'efectivo' in forma or 'contado' in forma:
+        return 'efectivo'
+    if 'depósito' in forma or 'deposito' in forma or 'transferencia' in forma:
+        return 'deposito'
+    return 'voucher'
+
+
+def linea_papeleta(papeleta):
+    """
+    Valores de la línea del reporte para una papeleta: clave de aerolínea y
+    columna del costo según la tarjeta corporativa, efectivo o voucher según
+    cómo pagó el cliente. Sin reporte_id ni orden.
+    """
+    # Determinar clave de aerolínea
+    clave_aerolinea = ''
+    if papeleta.aerolinea:
+        clave_aerolinea = papeleta.aerolinea.codigo_iata or papeleta.aerolinea.nombre[:2].upper()
+    
+    # Categoría de la tarjeta corporativa usada (sin tarjeta_id, por el
+    # texto legacy) y clase de la forma de pago del cliente
+    if papeleta.tarjeta_rel:
+        categoria = papeleta.tarjeta_rel.categoria or categoria_tarjeta(papeleta.tarjeta_rel.nombre_tarjeta)
+    else:
+        categoria = categoria_tarjeta(papeleta.tarjeta)
+    forma_pago_clase = papeleta.forma_pago_clase or clase_forma_pago(papeleta.forma_pago)
+    total_ticket = float(papeleta.total_ticket or 0)
+    total = float(papeleta.total or 0)
+    
+    # Inicializar montos
+    monto_volaris = 0
+    monto_vivaerobus = 0
+    monto_compra_tc = 0
+    voucher_tc = 0
+    efectivo = 0
+    pago_directo_tc = 0
+    
+    # ============================================================
+    # CLASIFICACIÓN POR TARJETA CORPORATIVA USADA
+    # ============================================================
+    # - CREDITO VOLARIS (CVOL) → Columna Volaris
+    # - CREDITO VIVAAEROBUS (CVIV) → Columna VivaAerobus  
+    # - Otras tarjetas (VISA, MASTER, INVEX, etc.) → Columna Compra TC
+    # ============================================================
+    
+    # Clasificar según la tarjeta corporativa
+    if categoria == 'volaris':
+        monto_volaris = total_ticket
+    elif categoria == 'vivaaerobus':
+        monto_vivaerobus = total_ticket
+    else:
+        # Cualquier otra tarjeta va a Compra TC
+        monto_compra_tc = total_ticket
+    
+    # El total va a efectivo (efectivo, depósito o transferencia) o voucher
+    if forma_pago_clase in CLASES_EFECTIVO:
+        efectivo = total
+    else:
+        voucher_tc = total
+    
+    return {
+        'papeleta_id': papeleta.id,
+        'clave_aerolinea': clave_aerolinea,
+        'num_boletos': 1,
+        'reserva': papeleta.clave_reserva or papeleta.clave_sabre or '',
+        'num_recibo': '',
+        'num_papeleta': papeleta.folio,
+        'monto_volaris': monto_volaris,
+        'monto_vivaerobus': monto_vivaerobus,
+        'monto_compra_tc': monto_compra_tc,
+        'cargo_expedicion': float(papeleta.cargo or 0),
+        'cargo_315': float(papeleta.diez_porciento or 0),
+        'voucher_tc': voucher_tc,
+        'efectivo': efectivo,
+        'pago_directo_tc': pago_directo_tc,
+        'total_linea': total,
+    }
+
+
+def filtro_papeletas_disponibles(usuario_id, fecha):
+    """
+    Condiciones de las papeletas de MOSTRADOR del agente que no están en
+    ningún reporte, vendidas en los DIAS_PAPELETAS_DISPONIBLES días hasta
+    fecha. Mostrador = sin empresa asignada o facturar_a = 'MOSTRADOR'.
+    """
+    condiciones = [
+        Papeleta.reporte_venta_id.is_(None),
+        Papeleta.fecha_venta >= fecha - timedelta(days=DIAS_PAPELETAS_DISPONIBLES),
+        Papeleta.fecha_venta <= fecha,
+        db.or_(
+            Papeleta.empresa_id.is_(None),
+            Papeleta.facturar_a.ilike('%MOSTRADOR%')
+        ),
+    ]
+    if usuario_id is not None:
+        condiciones.append(Papeleta.usuario_id == usuario_id)
+    return condiciones
+
+
+def agregar_papeletas(reporte_id, *condiciones):
+    """
+    Agrega al reporte las papeletas libres que cumplen las condiciones.
+
+    Un UPDATE ... RETURNING las toma (si otra petición agregó alguna al
+    mismo tiempo, no se regresa), se leen con su aerolínea y tarjeta en una
+    consulta, se clasifican con linea_papeleta() y las líneas se insertan en
+    un INSERT de varios renglones, en orden de fecha de venta. Los totales
+    se recalculan una vez. No hace commit.
+
+    Returns:
+        set con los ids de las papeletas agregadas
+    """
+    tomadas = set(db.session.execute(
+        db.update(Papeleta)
+        .where(Papeleta.reporte_venta_id.is_(None), *condiciones)
+        .values(reporte_venta_id=reporte_id)
+        .returning(Papeleta.id)
+    ).scalars())
+    if not tomadas:
+        return tomadas
+
+    papeletas = Papeleta.query.options(
+        db.joinedload(Papeleta.aerolinea),
+        db.joinedload(Papeleta.tarjeta_rel)
+    ).filter(Papeleta.id.in_(tomadas)).order_by(Papeleta.fecha_venta, Papeleta.id).all()
+
+    max_orden = db.session.query(db.func.max(DetalleReporteVenta.orden)).filter_by(reporte_id=reporte_id).scalar() or 0
+
+    db.session.execute(db.insert(DetalleReporteVenta), [
+        dict(linea_papeleta(papeleta), reporte_id=reporte_id, orden=max_orden + n)
+        for n, papeleta in enumerate(papeletas, start=1)
+    ])
+    recalcular_totales(reporte_id)
+    return tomadas
+
+
+def generar_reporte_dia(usuario, fecha, notas=''):
+    """
+    Reporte del día de un agente con todas sus papeletas de mostrador disponibles.
+
+    Igual que al crear el reporte a mano: si el agente ya tiene uno de esa
+    fecha sin vale de entrega se usa ese (si sigue en borrador); si no, se
+    crea con el siguiente folio. Si no hay papeletas no se crea nada. No
+    hace commit, para que el llamador escriba todo en una transacción.
+
+    Returns:
+        (reporte o None, papeletas agregadas, True si el reporte es nuevo)
+    """
+    reporte = ReporteVenta.query.filter_by(fecha=fecha, usuario_id=usuario.id).order_by(ReporteVenta.id.desc()).first()
+    if reporte and not reporte.entrega_corte:
+        if not reporte.puede_editar:
+            return reporte, 0, False
+        return reporte, len(agregar_papeletas(reporte.id, *filtro_papeletas_disponibles(usuario.id, fecha))), False
+
+    reporte = ReporteVenta(
+        folio=generar_folio(),
+        fecha=fecha,
+        usuario_id=usuario.id,
+        sucursal_id=usuario.sucursal_id,
+        notas=notas
+    )
+    db.session.add(reporte)
+    db.session.flush()
+
+    agregadas = agregar_papeletas(reporte.id, *filtro_papeletas_disponibles(usuario.id, fecha))
+    if not agregadas:
+        db.session.delete(reporte)
+        db.session.flush()
+        return None, 0, False
+    return reporte, len(agregadas), True
+
+
+def conteo_por_estatus(query):
+    """{estatus: reportes} de una consulta de ReporteVenta, en una sola consulta agrupada"""
+    filas = query.with_entities(ReporteVenta.estatus, db.func.count()).group_by(ReporteVenta.estatus).all()
+    return dict(filas)
+
+
+def _cursor(reporte):
+    return f'{reporte.fecha.isoformat()}.{reporte.id}'
+
+
+def _leer_cursor(valor):
+    """(fecha, id) de un cursor 'AAAA-MM-DD.id', o None si no viene o no es válido"""
+    try:
+        fecha, reporte_id = valor.split('.')
+        return date.fromisoformat(fecha), int(reporte_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def pagina_reportes(query, despues=None, antes=None, por_pagina=POR_PAGINA_REPORTES):
+    """
+    Una página del listado de reportes, del más reciente al más antiguo
+    (fecha, id descendentes). En vez de OFFSET se busca desde la llave del
+    cursor: despues = cursor del último renglón de la página anterior,
+    antes = cursor del primero de la página siguiente. El agente de cada
+    reporte viene en la misma consulta.
+
+    Returns:
+        (reportes, cursor de la página anterior, cursor de la siguiente);
+        los cursores son None si no hay más reportes en esa dirección.
+    """
+    llave = db.tuple_(ReporteVenta.fecha, ReporteVenta.id)
+    query = query.options(db.joinedload(ReporteVenta.usuario))
+
+    desde_antes = _leer_cursor(antes)
+    if desde_antes:
+        # Hacia atrás: los siguientes en orden ascendente, luego se invierten
+        reportes = query.filter(llave > desde_antes).order_by(
+            ReporteVenta.fecha, ReporteVenta.id
+        ).limit(por_pagina + 1).all()
+        hay_anterior, hay_siguiente = len(reportes) > por_pagina, True
+        reportes = reportes[:por_pagina][::-1]
+    else:
+        desde_despues = _leer_cursor(despues)
+        if desde_despues:
+            query = query.filter(llave < desde_despues)
+        reportes = query.order_by(
+            ReporteVenta.fecha.desc(), ReporteVenta.id.desc()
+        ).limit(por_pagina + 1).all()
+        hay_anterior, hay_siguiente = desde_despues is not None, len(reportes) > por_pagina
+        reportes = reportes[:por_pagina]
+
+    if not reportes:
+        return [], None, None
+    return (
+        reportes,
+        _cursor(reportes[0]) if hay_anterior else None,
+        _cursor(reportes[-1]) if hay_siguiente else None,
+    )
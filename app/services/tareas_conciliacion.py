@@ -0,0 +1,58 @@
+# app/services/tareas_conciliacion.py
+# Conciliaciones por archivo como trabajos en segundo plano
+#
+# El request guarda el archivo en directorio_trabajos() y encola el trabajo
+# 'conciliar_<fuente>'; aquí la fuente lee el archivo (con la caché de
+# archivos_conciliacion, o en stream), se cruza contra el sistema por lotes y
+# se guarda el run. La conciliación, el run y el estatus del trabajo se
+# confirman en un solo commit; el archivo lo borra ejecutar().
+
+from functools import partial
+
+# Cada módulo registra su fuente con @fuente al importarse
+from app.services import conciliacion_bsp, conciliacion_volaris, conciliacion_viva  # noqa: F401
+from app.services.conciliacion import FUENTES, cruzar, lotes
+from app.services.conciliacion_runs import crear_run, agregar_lineas
+from app.services.logs import span
+from app.services.trabajos import tarea
+
+
+def conciliar_archivo(clase, parametros, progreso, usuario_id):
+    """
+    Concilia el archivo de un trabajo con la fuente indicada y guarda el run.
+
+    Los documentos (lista o generador) se cruzan por lotes; el resumen se
+    cuenta al pasar y las líneas se insertan conforme se cruzan, así que un
+    archivo leído en stream no se junta completo en memoria.
+    """
+    fuente = clase(parametros, progreso, usuario_id)
+
+    progreso.actualizar(forzar=True, etapa='Leyendo archivo')
+    documentos = fuente.leer()
+    fuente.preparar()
+    run = crear_run(fuente.nombre, fuente.periodo, usuario_id, parametros.get('nombre_archivo'))
+
+    progreso.actualizar(forzar=True, etapa=f'Cruzando con {fuente.destino.nombre}')
+    orden = 0
+    with span(f'{fuente.nombre}.cruce') as campos:
+        for lote in lotes(cruzar(fuente, fuente.registros(documentos))):
+            for resultado, doc in lote:
+                fuente.contar(resultado, doc)
+            orden = agregar_lineas(run.id, [fuente.linea(doc, resultado) for resultado, doc in lote], orden)
+            progreso.actualizar(documentos_cruzados=orden, encontrados=fuente.resumen['encontrados'])
+        campos['documentos'] = fuente.resumen[fuente.clave_total]
+
+    if not fuente.resumen[fuente.clave_total]:
+        raise ValueError(fuente.sin_registros)
+
+    cruzados = orden
+    agregar_lineas(run.id, fuente.terminar(run), orden)
+    run.resumen = fuente.resumen
+    progreso.actualizar(forzar=True, etapa='Guardando resultado', documentos_cruzados=cruzados,
+                        encontrados=fuente.resumen['encontrados'])
+
+    return {'run_id': run.id, 'mensaje': fuente.mensaje()}
+
+
+for _nombre, _clase in FUENTES.items():
+    tarea(f'conciliar_{_nombre}')(partial(conciliar_archivo, _clase))
@@ -0,0 +1,214 @@
+# app/services/trabajos.py
+# Cola de trabajos en segundo plano sobre PostgreSQL
+#
+# El request guarda el trabajo (estatus 'pendiente') y responde de inmediato;
+# un worker (flask procesar-trabajos) lo toma con SELECT ... FOR UPDATE SKIP
+# LOCKED, así que pueden correr varios workers sin tomar el mismo trabajo.
+# El avance se escribe en su propia transacción para que la página de
+# progreso lo vea mientras el trabajo sigue abierto; el resultado y los
+# cambios del trabajo se confirman juntos al final. Cada avance guardado
+# también actualiza actualizado_at: un trabajo 'en_proceso' sin avance en
+# MINUTOS_ABANDONADO es de un worker caído y se reintenta, y al agotar los
+# intentos se marca como error.
+
+import os
+import socket
+import time
+
+from flask import current_app
+from sqlalchemy import text
+
+from app.models import db, Trabajo
+from app.services.logs import obtener_logger, span
+
+log = obtener_logger('trabajos')
+
+# Funciones registradas con @tarea: {tipo: funcion(parametros, progreso, usuario_id) -> resultado}
+TAREAS = {}
+
+# Un trabajo 'en_proceso' sin avance guardado en estos minutos se considera
+# de un worker caído y se reintenta
+MINUTOS_ABANDONADO = 60
+MAX_INTENTOS = 3
+
+_SQL_TOMAR = text("""
+    UPDATE trabajos
+       SET estatus = 'en_proceso',
+           iniciado_at = now(),
+           actualizado_at = now(),
+           intentos = intentos + 1,
+           worker = :worker
+     WHERE id = (
+        SELECT id FROM trabajos
+         WHERE (estatus = 'pendiente'
+                OR (estatus = 'en_proceso' AND actualizado_at < now() - make_interval(mins => :minutos)))
+           AND intentos < :max_intentos
+         ORDER BY id
+         FOR UPDATE SKIP LOCKED
+         LIMIT 1
+     )
+    RETURNING id
+""")
+
+# Abandonados que ya no tienen intentos: se cierran como error para que la
+# página de progreso deje de esperar
+_SQL_AGOTADOS = text("""
+    UPDATE trabajos
+       SET estatus = 'error',
+           error = :error,
+           terminado_at = now()
+     WHERE estatus = 'en_proceso'
+       AND actualizado_at < now() - make_interval(mins => :minutos)
+       AND intentos >= :max_intentos
+    RETURNING id, parametros
+""")
+
+
+def tarea(tipo):
+    """Registra la función que ejecuta los trabajos de un tipo"""
+    def registrar(funcion):
+        TAREAS[tipo] = funcion
+        return funcion
+    return registrar
+
+
+def directorio_trabajos():
+    """Carpeta para los archivos de los trabajos (compartida entre la app y el worker)"""
+    ruta = current_app.config.get('TRABAJOS_DIR') or os.path.join(current_app.instance_path, 'trabajos')
+    os.makedirs(ruta, exist_ok=True)
+    return ruta
+
+
+def encolar(tipo, parametros, usuario_id=None):
+    """Agrega un trabajo pendiente. No hace commit."""
+    trabajo = Trabajo(
+        tipo=tipo,
+        estatus='pendiente',
+        parametros=parametros,
+        progreso={'etapa': 'En cola', 'errores': []},
+        usuario_id=usuario_id,
+    )
+    db.session.add(trabajo)
+    db.session.flush()
+    log.info('trabajo encolado', extra={'campos': {'trabajo_id': trabajo.id, 'tipo': tipo}})
+    return trabajo
+
+
+class Progreso:
+    """Avance de un trabajo en curso; se guarda a lo más cada `intervalo` segundos"""
+
+    def __init__(self, trabajo_id, datos=None, intervalo=1.0):
+        self.trabajo_id = trabajo_id
+        self.datos = dict(datos or {})
+        self.datos.setdefault('errores', [])
+        self.intervalo = intervalo
+        self._ultimo = 0.0
+
+    def actualizar(self, forzar=False, **campos):
+        self.datos.update(campos)
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo < self.intervalo:
+            return
+        self._ultimo = ahora
+        # Conexión aparte: la sesión del trabajo no se confirma hasta el final
+        with db.engine.begin() as conexion:
+            conexion.execute(
+                db.update(Trabajo).where(Trabajo.id == self.trabajo_id).values(
+                    progreso=dict(self.datos), actualizado_at=db.func.now()
+                )
+            )
+
+    def error(self, mensaje):
+        """Registra un error no fatal (el trabajo continúa)"""
+        self.datos['errores'].append(mensaje)
+        self.actualizar(forzar=True)
+
+
+def cerrar_agotados():
+    """Marca como error los trabajos abandonados sin intentos restantes; regresa cuántos"""
+    filas = db.session.execute(_SQL_AGOTADOS, {
+        'error': f'El trabajo se interrumpió {MAX_INTENTOS} veces sin terminar (worker caído)',
+        'minutos': MINUTOS_ABANDONADO,
+        'max_intentos': MAX_INTENTOS,
+    }).all()
+    db.session.commit()
+    for trabajo_id, parametros in filas:
+        log.warning('trabajo sin intentos restantes', extra={'campos': {'trabajo_id': trabajo_id}})
+        _borrar_archivo(parametros or {})
+    return len(filas)
+
+
+def tomar_siguiente(worker):
+    """Marca como en proceso el siguiente trabajo disponible y lo regresa (o None)"""
+    cerrar_agotados()
+    trabajo_id = db.session.execute(_SQL_TOMAR, {
+        'worker': worker,
+        'minutos': MINUTOS_ABANDONADO,
+        'max_intentos': MAX_INTENTOS,
+    }).scalar()
+    db.session.commit()
+    return db.session.get(Trabajo, trabajo_id) if trabajo_id else None
+
+
+def ejecutar(trabajo):
+    """Corre un trabajo ya tomado y guarda su estatus final"""
+    funcion = TAREAS.get(trabajo.tipo)
+    progreso = Progreso(trabajo.id, trabajo.progreso)
+
+    try:
+        if funcion is None:
+            raise ValueError(f'Tipo de trabajo desconocido: {trabajo.tipo}')
+        with span('trabajo.ejecutar', logger=log, trabajo_id=trabajo.id, tipo=trabajo.tipo):
+            resultado = funcion(trabajo.parametros or {}, progreso, trabajo.usuario_id)
+        progreso.datos['etapa'] = 'Completado'
+        trabajo.estatus = 'completado'
+        trabajo.resultado = resultado
+        trabajo.progreso = dict(progreso.datos)
+        trabajo.terminado_at = db.func.now()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        log.exception('Error al ejecutar trabajo', extra={'campos': {'trabajo_id': trabajo.id, 'tipo': trabajo.tipo}})
+        progreso.datos['etapa'] = 'Error'
+        progreso.datos['errores'].append(str(e))
+        trabajo = db.session.get(Trabajo, trabajo.id)
+        trabajo.estatus = 'error'
+        trabajo.error = str(e)
+        trabajo.progreso = dict(progreso.datos)
+        trabajo.terminado_at = db.func.now()
+        db.session.commit()
+
+    _borrar_archivo(trabajo.parametros or {})
+    return trabajo
+
+
+def _borrar_archivo(parametros):
+    """Borra el archivo subido del trabajo (parametros['ruta']) una vez terminado"""
+    ruta = parametros.get('ruta')
+    if not ruta:
+        return
+    try:
+        os.unlink(ruta)
+    except OSError:
+        pass
+
+
+def procesar(una_vez=False, intervalo=2.0, worker=None):
+    """
+    Ciclo del worker: toma y ejecuta trabajos; si no hay, espera `intervalo` segundos.
+
+    Returns:
+        Número de trabajos ejecutados (solo termina por sí mismo con una_vez)
+    """
+    worker = worker or f'{socket.gethostname()}:{os.getpid()}'
+    ejecutados = 0
+    while True:
+        trabajo = tomar_siguiente(worker)
+        if trabajo is not None:
+            ejecutar(trabajo)
+            ejecutados += 1
+            continue
+        if una_vez:
+            return ejecutados
+        db.session.remove()
+        time.sleep(intervalo)
@@ -0,0 +1,116 @@
+// Conciliación masiva en los listados de boletos / papeletas por aerolínea
+//
+// La tabla (.tabla-conciliable) trae un renglón por registro con data-id y
+// la clase "conciliada" si ya lo está; los badges y botones de cada estado
+// llevan .solo-conciliada / .solo-pendiente y el CSS muestra los que tocan.
+// Los botones [data-accion] del renglón mandan su id; los de la barra
+// (#barraMasiva) mandan los marcados o, con #masivaFiltros, todos los del
+// filtro actual. El endpoint regresa los contadores y la página se
+// actualiza sin recargar.
+
+function iniciarConciliacionMasiva(opciones) {
+    var tabla = document.querySelector('.tabla-conciliable');
+    var barra = document.getElementById('barraMasiva');
+    if (!tabla || !barra) return;
+
+    var selTodos = document.getElementById('selTodos');
+    var conteo = document.getElementById('masivaConteo');
+    var porFiltros = document.getElementById('masivaFiltros');
+
+    function filas() {
+        return Array.prototype.slice.call(tabla.querySelectorAll('tbody tr[data-id]'));
+    }
+
+    function marcadas() {
+        return filas().filter(function(tr) { return tr.querySelector('.sel-fila').checked; });
+    }
+
+    function actualizarBarra() {
+        var n = marcadas().length;
+        if (porFiltros.checked) {
+            conteo.textContent = opciones.totalFiltrado + ' registros del filtro actual';
+        } else {
+            conteo.textContent = n + (n === 1 ? ' seleccionado' : ' seleccionados');
+        }
+        barra.classList.toggle('activa', n > 0 || porFiltros.checked);
+        selTodos.checked = n > 0 && n === filas().length;
+        selTodos.indeterminate = n > 0 && n < filas().length;
+    }
+
+    function marcarFilas(trs, accion) {
+        trs.forEach(function(tr) {
+            tr.classList.toggle('conciliada', accion === 'conciliar');
+            tr.querySelector('.sel-fila').checked = false;
+        });
+    }
+
+    function actualizarKpis(c) {
+        document.getElementById('kpiTotal').textContent = c.total;
+        document.getElementById('kpiConciliadas').textContent = c.conciliados;
+        document.getElementById('kpiSinConciliar').textContent = c.sin_conciliar;
+    }
+
+    function enviar(accion, datos, trs, botones) {
+        datos.accion = accion;
+        botones.forEach(function(b) { b.disabled = true; });
+        fetch(opciones.url, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(datos)
+        })
+        .then(function(r) { return r.json(); })
+        .then(function(data) {
+            if (!data.success) {
+                alert('Error: ' + (data.error || 'No se pudo actualizar'));
+                return;
+            }
+            marcarFilas(trs, accion);
+            actualizarKpis(data.contadores);
+            porFiltros.checked = false;
+            actualizarBarra();
+        })
+        .catch(function() { alert('Error de conexión'); })
+        .finally(function() { botones.forEach(function(b) { b.disabled = false; }); });
+    }
+
+    selTodos.addEventListener('change', function() {
+        filas().forEach(function(tr) { tr.querySelector('.sel-fila').checked = selTodos.checked; });
+        actualizarBarra();
+    });
+    // Listeners por renglón: el renglón puede tener su propio onclick (ver detalle)
+    filas().forEach(function(tr) {
+        var sel = tr.querySelector('.sel-fila');
+        sel.addEventListener('click', function(e) { e.stopPropagation(); });
+        sel.addEventListener('change', actualizarBarra);
+        tr.querySelectorAll('[data-accion]').forEach(function(boton) {
+            boton.addEventListener('click', function(e) {
+                e.stopPropagation();
+                if (boton.dataset.accion === 'desconciliar' && !confirm('¿Quitar conciliación?')) return;
+                enviar(boton.dataset.accion, {ids: [tr.dataset.id]}, [tr], [boton]);
+            });
+        });
+    });
+    porFiltros.addEventListener('change', actualizarBarra);
+
+    barra.querySelectorAll('[data-accion]').forEach(function(boton) {
+        boton.addEventListener('click', function() {
+            var accion = boton.dataset.accion;
+            var datos, trs, n;
+            if (porFiltros.checked) {
+                datos = {todos: true, filtros: opciones.filtros};
+                trs = filas();
+                n = opciones.totalFiltrado;
+            } else {
+                trs = marcadas();
+                datos = {ids: trs.map(function(tr) { return tr.dataset.id; })};
+                n = trs.length;
+            }
+            if (!n) return;
+            var verbo = accion === 'conciliar' ? 'Conciliar' : 'Quitar conciliación de';
+            if (!confirm('¿' + verbo + ' ' + n + ' registros?')) return;
+            enviar(accion, datos, trs, Array.prototype.slice.call(barra.querySelectorAll('[data-accion]')));
+        });
+    });
+
+    actualizarBarra();
+}
@@ -0,0 +1,126 @@
+# benchmarks/bsp_pdf.py
+# Lectura serial vs. paralela del PDF FCAGBILLDET
+#
+# Genera un PDF sintético con el formato del reporte (incluye +RTDN al inicio
+# de algunas páginas para validar el enlace entre páginas), lo lee en modo
+# serial y en paralelo, compara que el resultado sea idéntico e imprime el
+# throughput de cada modo.
+#
+# Uso:
+#   python -m benchmarks.bsp_pdf --paginas 300 --procesos 4
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app.services.parser_bsp import parsear_bsp_pdf
+
+LINEAS_POR_PAGINA = 70
+
+
+def _escapar(texto):
+    return texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _lineas_pagina(num_pagina, total_paginas, rnd, siguiente_doc):
+    lineas = [
+        f'FCAGBILLDET  BSP MEXICO  Billing Period:260104  Page : {num_pagina + 1} of {total_paginas}',
+        'CIA TRNC NO. DOCUMENTO FECHA CPN STAT FOP TRANSACTION AMOUNT FARE TAX BALANCE PAYABLE',
+    ]
+    # Cada 5 páginas la primera línea útil es un +RTDN del último documento de la página anterior
+    if num_pagina % 5 == 4:
+        lineas.append(f'+RTDN: {rnd.randint(1000000000, 9999999999)}')
+
+    while len(lineas) < LINEAS_POR_PAGINA:
+        trnc = rnd.choice(('TKTT', 'TKTT', 'TKTT', 'EMDS', 'EMDA', 'CANX'))
+        monto = rnd.uniform(800, 25000)
+        tarifa = monto * 0.8
+        lineas.append(
+            f'139 {trnc} {siguiente_doc[0]:010d} 02JAN26 FFVV {rnd.choice("DI")} {rnd.choice(("CA", "CC"))} '
+            f'{monto:,.2f} {tarifa:,.2f} {monto - tarifa:,.2f} 0.00 {monto:,.2f}'
+        )
+        siguiente_doc[0] += 1
+        if rnd.random() < 0.05:
+            lineas.append(f'+RTDN: {rnd.randint(1000000000, 9999999999)}')
+
+    return lineas[:LINEAS_POR_PAGINA]
+
+
+def generar_pdf(ruta, paginas, semilla=7):
+    """Escribe un PDF de texto plano (Courier) con el formato de FCAGBILLDET"""
+    rnd = random.Random(semilla)
+    siguiente_doc = [5463600000]
+
+    objetos = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,  # Pages, se llena al final
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>',
+    ]
+    kids = []
+    for n in range(paginas):
+        contenido = ['BT /F1 7 Tf 9 TL 20 810 Td']
+        for linea in _lineas_pagina(n, paginas, rnd, siguiente_doc):
+            contenido.append(f'({_escapar(linea)}) Tj T*')
+        contenido.append('ET')
+        stream = '\n'.join(contenido).encode('latin-1')
+
+        objetos.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        contenido_id = len(objetos)
+        objetos.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % contenido_id
+        )
+        kids.append(len(objetos))
+
+    objetos[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(b'%d 0 R' % k for k in kids), len(kids)
+    )
+
+    with open(ruta, 'wb') as f:
+        f.write(b'%PDF-1.4\n')
+        offsets = []
+        for i, obj in enumerate(objetos, start=1):
+            offsets.append(f.tell())
+            f.write(b'%d 0 obj\n' % i + obj + b'\nendobj\n')
+        xref = f.tell()
+        f.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objetos) + 1))
+        for off in offsets:
+            f.write(b'%010d 00000 n \n' % off)
+        f.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objetos) + 1, xref))
+
+
+def _medir(ruta, procesos):
+    inicio = time.perf_counter()
+    resultado = parsear_bsp_pdf(ruta, procesos=procesos)
+    return resultado, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lectura serial vs. paralela del PDF FCAGBILLDET')
+    parser.add_argument('--paginas', type=int, default=300)
+    parser.add_argument('--procesos', type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, 'FCAGBILLDET_sintetico.pdf')
+        generar_pdf(ruta, args.paginas)
+        print(f'PDF sintético: {args.paginas} páginas, {os.path.getsize(ruta) / 1024:.0f} KB')
+
+        serial, t_serial = _medir(ruta, 1)
+        paralelo, t_paralelo = _medir(ruta, args.procesos)
+
+    if serial != paralelo:
+        raise SystemExit('ERROR: el resultado en paralelo no coincide con el serial')
+
+    docs = len(serial['documentos'])
+    revisados = sum(1 for d in serial['documentos'] if d['es_revisado'])
+    print(f'Documentos: {docs} ({revisados} con +RTDN), periodo {serial["periodo"]}')
+    print(f'Serial:              {t_serial:7.2f} s  {args.paginas / t_serial:7.1f} pág/s')
+    print(f'Paralelo ({args.procesos:2d} proc): {t_paralelo:7.2f} s  {args.paginas / t_paralelo:7.1f} pág/s')
+    print(f'Aceleración: {t_serial / t_paralelo:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
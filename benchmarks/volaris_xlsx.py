@@ -0,0 +1,109 @@
+# benchmarks/volaris_xlsx.py
+# Lectura del reporte de ventas de Volaris: libro completo vs. read_only
+#
+# Genera un .xlsx sintético con el formato del reporte, lo lee como se hacía
+# antes (load_workbook completo + ws.cell renglón por renglón) y con el
+# parser en stream, compara que el resultado sea idéntico e imprime tiempo y
+# memoria pico (tracemalloc, en una pasada aparte) de cada modo.
+#
+# Uso:
+#   python -m benchmarks.volaris_xlsx --renglones 100000
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from app.services.parser_volaris import parsear_volaris_xlsx, _documento
+
+LETRAS = 'ABCDEFGHJKLMNPQRSTUVWXYZ'
+
+
+def generar_xlsx(ruta, renglones, semilla=7):
+    """
+    Escribe un reporte de Volaris con `renglones` ventas. Se usa el modo normal
+    (no write_only) porque solo así se escribe <dimension>, como en los
+    archivos que exporta Excel; sin ella el modo read_only recorre la hoja una
+    vez de más para calcular su tamaño.
+    """
+    import openpyxl
+
+    rnd = random.Random(semilla)
+    inicio = datetime(2026, 1, 1)
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'Ventas'
+    ws.append(['REPORTE DE VENTAS DEL 01/01/2026 AL 31/03/2026'])
+    ws.append(['FECHA', 'PNR', 'AGENTE', 'PASAJERO', 'RUTA', 'PAGO'])
+    for _ in range(renglones):
+        ws.append([
+            inicio + timedelta(minutes=rnd.randint(0, 90 * 24 * 60)),
+            ''.join(rnd.choice(LETRAS) for _ in range(6)),
+            f'AGENTE {rnd.randint(1, 40)}',
+            f'PASAJERO {rnd.randint(1, 10 ** 6)}',
+            rnd.choice(('TIJ-MEX', 'MEX-CUN', 'GDL-TIJ', 'MTY-CUN')),
+            round(rnd.uniform(600, 9000), 2),
+        ])
+    ws.append(['=SUBTOTAL(9,F3:F%d)' % (renglones + 2)])
+    wb.save(ruta)
+
+
+def leer_libro_completo(ruta):
+    """Lectura anterior: load_workbook completo y ws.cell por renglón"""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(ruta, data_only=True)
+    documentos = []
+    periodo = ''
+    for ws in wb.worksheets:
+        titulo = ws.cell(row=1, column=1).value or ''
+        if not periodo and titulo:
+            periodo = titulo.replace('REPORTE DE VENTAS DEL ', '').strip()
+        for row_num in range(2, ws.max_row + 1):
+            documento = _documento([ws.cell(row=row_num, column=c).value for c in range(1, 7)])
+            if documento:
+                documentos.append(documento)
+    return {'periodo': periodo, 'documentos': documentos}
+
+
+def _medir(funcion, ruta):
+    """Tiempo (sin trazar) y memoria pico (en una segunda pasada con tracemalloc, que la hace más lenta)"""
+    inicio = time.perf_counter()
+    resultado = funcion(ruta)
+    segundos = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    funcion(ruta)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, segundos, pico / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lectura del reporte de Volaris: libro completo vs. read_only')
+    parser.add_argument('--renglones', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = os.path.join(tmp, 'volaris_sintetico.xlsx')
+        generar_xlsx(ruta, args.renglones)
+        print(f'XLSX sintético: {args.renglones} renglones, {os.path.getsize(ruta) / 1024:.0f} KB')
+
+        completo, t_completo, m_completo = _medir(leer_libro_completo, ruta)
+        stream, t_stream, m_stream = _medir(parsear_volaris_xlsx, ruta)
+
+    if completo != stream:
+        raise SystemExit('ERROR: la lectura en stream no coincide con la del libro completo')
+
+    print(f'Registros: {len(stream["documentos"])}, periodo {stream["periodo"]}')
+    print(f'Libro completo: {t_completo:7.2f} s  pico {m_completo:8.1f} MB')
+    print(f'read_only:      {t_stream:7.2f} s  pico {m_stream:8.1f} MB')
+    print(f'Aceleración: {t_completo / t_stream:.2f}x, memoria {m_completo / m_stream:.1f}x menor')
+
+
+if __name__ == '__main__':
+    main()
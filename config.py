@@ -22,4 +22,29 @@ class Config:
     SQLALCHEMY_DATABASE_URI = LOCAL_DB_URI if USE_LOCAL_DB else SUPABASE_DB_URI
 
     # Desactiva el sistema de seguimiento de modificaciones
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # --- Logging ---
+    # Nivel del logger 'kinessia' (DEBUG, INFO, WARNING, ERROR)
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+
+    # Fracción de requests cuyos mensajes DEBUG se emiten (0.0 a 1.0)
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '0.1'))
+
+    # 'json' (una línea JSON por mensaje) o 'texto'
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+
+    # --- Búsqueda ---
+    # 'auto' detecta pg_trgm; 'trigram' o 'basico' fuerzan el modo
+    BUSQUEDA_MODO = os.environ.get('BUSQUEDA_MODO', 'auto')
+
+    # --- Conciliación BSP ---
+    # Procesos para leer el PDF FCAGBILLDET: 1 = serial (default), 0 = uno por CPU.
+    # En el benchmark (benchmarks/bsp_pdf.py) el paralelo no fue más rápido;
+    # medir antes de subirlo
+    BSP_PDF_PROCESOS = int(os.environ.get('BSP_PDF_PROCESOS', '1'))
+
+    # --- Trabajos en segundo plano ---
+    # Carpeta donde la app deja los archivos para el worker (flask procesar-trabajos);
+    # debe ser la misma para ambos procesos. Vacío = instance/trabajos
+    TRABAJOS_DIR = os.environ.get('TRABAJOS_DIR')
@@ -0,0 +1,25 @@
+-- ============================================================================
+-- KINESSIA HUB - CACHÉ DE ARCHIVOS DE CONCILIACIÓN
+-- ============================================================================
+-- Descripción: Resultado del parser (BSP PDF/TXT, Volaris xlsx) por hash del
+-- contenido del archivo, para no volver a leer un archivo que ya se subió.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS public.archivos_conciliacion (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    hash_sha256 VARCHAR(64) NOT NULL,
+    tipo VARCHAR(20) NOT NULL, -- 'bsp_pdf', 'bsp_txt', 'volaris_xlsx'
+    version_parser VARCHAR(20) NOT NULL,
+    nombre_archivo VARCHAR(255),
+    periodo VARCHAR(50),
+    total_documentos INTEGER DEFAULT 0,
+    resultado JSON NOT NULL, -- {"periodo": ..., "documentos": [...]}; TOAST lo comprime
+    usos INTEGER DEFAULT 1,
+    usuario_id BIGINT REFERENCES public.usuarios(id),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    ultimo_uso TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CONSTRAINT uq_archivos_conciliacion_hash UNIQUE (hash_sha256, tipo, version_parser)
+);
+
+COMMENT ON TABLE public.archivos_conciliacion IS 'Caché del resultado del parser por hash de archivo (conciliación BSP y Volaris)';
+COMMENT ON COLUMN public.archivos_conciliacion.version_parser IS 'Versión del parser que generó el resultado; al cambiarla se vuelve a leer el archivo';
@@ -0,0 +1,38 @@
+-- ============================================================================
+-- KINESSIA HUB - ÍNDICES DE BÚSQUEDA (pg_trgm)
+-- ============================================================================
+-- Descripción: Índices GIN de trigramas sobre el "documento" de búsqueda de
+-- desgloses, papeletas y expedientes (ver app/services/busqueda.py).
+-- Si el servidor no permite pg_trgm el script solo avisa; la aplicación
+-- detecta la extensión y usa el modo básico (ILIKE sin índice).
+-- Requiere migracion_expedientes.sql.
+-- ============================================================================
+
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'pg_trgm no disponible (%); la búsqueda usará el modo básico', SQLERRM;
+END $$;
+
+-- Las expresiones deben coincidir con documento() en app/services/busqueda.py
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        RETURN;
+    END IF;
+
+    CREATE INDEX IF NOT EXISTS idx_desgloses_busqueda_trgm ON public.desgloses USING GIN ((
+        coalesce(numero_boleto, '') || ' | ' || coalesce(pasajero_nombre, '') || ' | ' ||
+        coalesce(clave_reserva, '') || ' | ' || coalesce(clave_sabre, '') || ' | ' || coalesce(ruta, '')
+    ) gin_trgm_ops);
+
+    CREATE INDEX IF NOT EXISTS idx_papeletas_busqueda_trgm ON public.papeletas USING GIN ((
+        coalesce(folio, '') || ' | ' || coalesce(clave_sabre, '') || ' | ' || coalesce(clave_reserva, '') || ' | ' ||
+        coalesce(pasajero_nombre, '') || ' | ' || coalesce(facturar_a, '') || ' | ' || coalesce(solicito, '')
+    ) gin_trgm_ops);
+
+    CREATE INDEX IF NOT EXISTS idx_expedientes_busqueda_trgm ON public.expedientes USING GIN ((
+        coalesce(clave, '') || ' | ' || coalesce(pasajero, '')
+    ) gin_trgm_ops);
+END $$;
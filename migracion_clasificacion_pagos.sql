@@ -0,0 +1,53 @@
+-- ============================================================================
+-- KINESSIA HUB - CLASIFICACIÓN DE TARJETAS Y FORMAS DE PAGO
+-- ============================================================================
+-- Descripción: la columna del reporte de ventas (Volaris, VivaAerobus o
+-- Compra TC; efectivo o voucher) y el efectivo del dashboard salían de
+-- buscar texto en nombre_tarjeta y forma_pago en cada consulta. Ahora se
+-- guardan clasificados al escribir (categoria_tarjeta y clase_forma_pago en
+-- app/services/reportes_ventas.py) y se filtran por igualdad con índice.
+-- Este script agrega las columnas, clasifica los renglones existentes con
+-- las mismas reglas y crea los índices.
+-- ============================================================================
+
+ALTER TABLE public.tarjetas_corporativas ADD COLUMN IF NOT EXISTS categoria varchar(20);
+ALTER TABLE public.papeletas ADD COLUMN IF NOT EXISTS forma_pago_clase varchar(20);
+
+-- Renglones existentes (mismo orden de reglas que en Python)
+UPDATE public.tarjetas_corporativas
+   SET categoria = CASE
+           WHEN upper(nombre_tarjeta) LIKE '%VOLARIS%' OR upper(nombre_tarjeta) LIKE '%CVOL%'
+                OR upper(nombre_tarjeta) LIKE 'CREDITO VOL%' THEN 'volaris'
+           WHEN upper(nombre_tarjeta) LIKE '%VIVA%' OR upper(nombre_tarjeta) LIKE '%CVIV%'
+                OR upper(nombre_tarjeta) LIKE 'CREDITO VIV%' THEN 'vivaaerobus'
+           ELSE 'compra_tc'
+       END
+ WHERE categoria IS NULL;
+
+UPDATE public.papeletas
+   SET forma_pago_clase = CASE
+           WHEN lower(forma_pago) LIKE '%efectivo%' OR lower(forma_pago) LIKE '%contado%' THEN 'efectivo'
+           WHEN lower(forma_pago) LIKE '%depósito%' OR lower(forma_pago) LIKE '%deposito%'
+                OR lower(forma_pago) LIKE '%transferencia%' THEN 'deposito'
+           ELSE 'voucher'
+       END
+ WHERE forma_pago_clase IS NULL;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ck_tarjetas_corporativas_categoria') THEN
+        ALTER TABLE public.tarjetas_corporativas ADD CONSTRAINT ck_tarjetas_corporativas_categoria
+            CHECK (categoria IN ('volaris', 'vivaaerobus', 'compra_tc'));
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ck_papeletas_forma_pago_clase') THEN
+        ALTER TABLE public.papeletas ADD CONSTRAINT ck_papeletas_forma_pago_clase
+            CHECK (forma_pago_clase IN ('efectivo', 'deposito', 'voucher'));
+    END IF;
+END $$;
+
+-- Efectivo del día / pendiente en el dashboard (clase + rango de fechas)
+CREATE INDEX IF NOT EXISTS idx_papeletas_forma_pago_clase_fecha ON public.papeletas(forma_pago_clase, fecha_venta);
+CREATE INDEX IF NOT EXISTS idx_tarjetas_corporativas_categoria ON public.tarjetas_corporativas(categoria);
+
+COMMENT ON COLUMN public.tarjetas_corporativas.categoria IS 'Columna del reporte de ventas según nombre_tarjeta: volaris, vivaaerobus o compra_tc';
+COMMENT ON COLUMN public.papeletas.forma_pago_clase IS 'Clase de forma_pago: efectivo (efectivo/contado), deposito (depósito/transferencia) o voucher';
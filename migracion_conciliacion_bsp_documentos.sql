@@ -0,0 +1,27 @@
+-- ============================================================================
+-- KINESSIA HUB - DOCUMENTOS POR PERIODO BSP
+-- ============================================================================
+-- Descripción: Qué documentos trae cada periodo BSP y con qué desglose quedó
+-- cruzado cada uno en la última conciliación del periodo. Al volver a
+-- conciliar un periodo (BSP revisado) se compara el archivo contra esta
+-- tabla y solo se aplican las altas y bajas: los documentos que ya no vienen
+-- o que ahora cruzan con otro desglose se desconcilian.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS public.conciliacion_bsp_documentos (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    periodo VARCHAR(10) NOT NULL,
+    clave VARCHAR(13) NOT NULL,
+    folio BIGINT REFERENCES public.desgloses(folio) ON DELETE SET NULL,
+    tipo_documento VARCHAR(10),
+    monto NUMERIC(12,2),
+    run_id BIGINT REFERENCES public.conciliacion_runs(id) ON DELETE SET NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CONSTRAINT uq_conciliacion_bsp_documentos_periodo_clave UNIQUE (periodo, clave)
+);
+
+COMMENT ON TABLE public.conciliacion_bsp_documentos IS 'Documentos de cada periodo BSP según su última conciliación';
+COMMENT ON COLUMN public.conciliacion_bsp_documentos.periodo IS 'Periodo BSP (mismo valor que desgloses.periodo_bsp)';
+COMMENT ON COLUMN public.conciliacion_bsp_documentos.clave IS 'Número de boleto normalizado (13 dígitos con prefijo)';
+COMMENT ON COLUMN public.conciliacion_bsp_documentos.folio IS 'Desglose con el que cruzó; NULL si no se encontró';
+COMMENT ON COLUMN public.conciliacion_bsp_documentos.run_id IS 'Conciliación que agregó el documento al periodo';
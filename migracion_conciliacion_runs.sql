@@ -0,0 +1,46 @@
+-- ============================================================================
+-- KINESSIA HUB - RESULTADOS DE CONCILIACIÓN
+-- ============================================================================
+-- Descripción: Cada conciliación (BSP o Volaris) se guarda como un run con su
+-- resumen y un renglón por documento del archivo. La sesión solo lleva el id
+-- del run; la página de resultado pagina y filtra estas líneas.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS public.conciliacion_runs (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    tipo VARCHAR(20) NOT NULL, -- 'bsp', 'volaris'
+    periodo VARCHAR(50),
+    nombre_archivo VARCHAR(255),
+    resumen JSON NOT NULL DEFAULT '{}', -- Contadores del resumen
+    usuario_id BIGINT REFERENCES public.usuarios(id),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_conciliacion_runs_tipo_fecha
+    ON public.conciliacion_runs (tipo, created_at DESC);
+
+CREATE TABLE IF NOT EXISTS public.conciliacion_lineas (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    run_id BIGINT NOT NULL REFERENCES public.conciliacion_runs(id) ON DELETE CASCADE,
+    orden INTEGER NOT NULL,
+    resultado VARCHAR(20) NOT NULL, -- 'conciliado', 'ya_conciliado', 'no_encontrado'
+    clave VARCHAR(30),
+    tipo_documento VARCHAR(10),
+    scope VARCHAR(20),
+    folio VARCHAR(255),
+    pasajero VARCHAR(255),
+    monto NUMERIC(12,2),
+    monto_sistema NUMERIC(12,2),
+    diferencia NUMERIC(12,2),
+    neto NUMERIC(12,2),
+    datos JSON
+);
+
+CREATE INDEX IF NOT EXISTS idx_conciliacion_lineas_run_resultado
+    ON public.conciliacion_lineas (run_id, resultado, orden);
+
+COMMENT ON TABLE public.conciliacion_runs IS 'Ejecuciones de conciliación BSP / Volaris con su resumen';
+COMMENT ON TABLE public.conciliacion_lineas IS 'Resultado del cruce por documento de cada conciliación';
+COMMENT ON COLUMN public.conciliacion_lineas.clave IS 'Número completo del boleto (BSP) o PNR (Volaris)';
+COMMENT ON COLUMN public.conciliacion_lineas.monto IS 'Monto según el archivo de la aerolínea / BSP';
+COMMENT ON COLUMN public.conciliacion_lineas.datos IS 'Documento completo del archivo para mostrar en el resultado';
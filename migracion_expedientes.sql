@@ -0,0 +1,46 @@
+-- ============================================================================
+-- KINESSIA HUB - TABLA MATERIALIZADA DE EXPEDIENTES
+-- ============================================================================
+-- Descripción: Un renglón por clave normalizada (desglose + papeleta + factura).
+-- La aplicación la mantiene al guardar desgloses y papeletas; después de
+-- correr este script se llena con:  flask reconstruir-expedientes
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS public.expedientes (
+    clave TEXT PRIMARY KEY, -- upper(coalesce(clave_sabre, clave_reserva, 'SIN-CLAVE'))
+    desglose_folio BIGINT,
+    papeleta_id BIGINT,
+    papeleta_folio TEXT,
+    pasajero TEXT,
+    ruta TEXT,
+    total NUMERIC(10,2) NOT NULL DEFAULT 0,
+    fecha DATE,
+    empresa_id BIGINT,
+    aerolinea_id BIGINT,
+    factura VARCHAR(50),
+    requiere_papeleta BOOLEAN NOT NULL DEFAULT false,
+    docs_requeridos SMALLINT NOT NULL DEFAULT 2,
+    docs_completos SMALLINT NOT NULL DEFAULT 0,
+    completo BOOLEAN NOT NULL DEFAULT false,
+    usuario_ids BIGINT[] NOT NULL DEFAULT '{}',
+    ultima_actividad TIMESTAMPTZ
+);
+
+COMMENT ON TABLE public.expedientes IS 'Expedientes materializados por clave; se actualizan al escribir desgloses y papeletas';
+COMMENT ON COLUMN public.expedientes.usuario_ids IS 'Agentes que crearon algún documento del expediente (vista de agente)';
+
+CREATE INDEX IF NOT EXISTS idx_expedientes_fecha ON public.expedientes(fecha DESC NULLS LAST, clave);
+CREATE INDEX IF NOT EXISTS idx_expedientes_pendientes ON public.expedientes(fecha DESC) WHERE NOT completo;
+CREATE INDEX IF NOT EXISTS idx_expedientes_empresa ON public.expedientes(empresa_id);
+CREATE INDEX IF NOT EXISTS idx_expedientes_desglose ON public.expedientes(desglose_folio);
+CREATE INDEX IF NOT EXISTS idx_expedientes_usuarios ON public.expedientes USING GIN (usuario_ids);
+
+-- Índices de expresión para recalcular un expediente por clave sin recorrer
+-- desgloses y papeletas completos
+CREATE INDEX IF NOT EXISTS idx_desgloses_clave_expediente
+    ON public.desgloses ((upper(coalesce(nullif(clave_sabre, ''), nullif(clave_reserva, ''), 'SIN-CLAVE'))));
+CREATE INDEX IF NOT EXISTS idx_papeletas_clave_expediente
+    ON public.papeletas ((upper(coalesce(nullif(clave_sabre, ''), 'SIN-CLAVE'))));
+
+-- Cruce papeleta → desglose por clave de reserva cuando la clave no tiene expediente propio
+CREATE INDEX IF NOT EXISTS idx_desgloses_clave_reserva ON public.desgloses(clave_reserva);
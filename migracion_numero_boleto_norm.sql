@@ -0,0 +1,13 @@
+-- ============================================================================
+-- KINESSIA HUB - NÚMERO DE BOLETO NORMALIZADO
+-- ============================================================================
+-- Descripción: Forma canónica del número de boleto (solo dígitos, 13 con el
+-- prefijo de la aerolínea) para conciliar BSP con una búsqueda por igualdad.
+-- Después de correr este script:  flask normalizar-boletos
+-- ============================================================================
+
+ALTER TABLE public.desgloses ADD COLUMN IF NOT EXISTS numero_boleto_norm VARCHAR(13);
+
+COMMENT ON COLUMN public.desgloses.numero_boleto_norm IS 'numero_boleto solo dígitos (13 con prefijo de aerolínea); lo llena la aplicación';
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_desgloses_numero_boleto_norm ON public.desgloses(numero_boleto_norm);
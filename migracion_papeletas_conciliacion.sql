@@ -0,0 +1,13 @@
+-- ============================================================================
+-- KINESSIA HUB - CONCILIACIÓN DE PAPELETAS
+-- ============================================================================
+-- Descripción: Quién concilió cada papeleta y con qué periodo del reporte de
+-- la aerolínea (Volaris), igual que desgloses.conciliada_por_id/periodo_bsp.
+-- La conciliación por archivo las llena con un solo UPDATE por lote.
+-- ============================================================================
+
+ALTER TABLE public.papeletas ADD COLUMN IF NOT EXISTS conciliada_por_id BIGINT REFERENCES public.usuarios(id);
+ALTER TABLE public.papeletas ADD COLUMN IF NOT EXISTS periodo_conciliacion VARCHAR(50);
+
+COMMENT ON COLUMN public.papeletas.conciliada_por_id IS 'Usuario que concilió la papeleta';
+COMMENT ON COLUMN public.papeletas.periodo_conciliacion IS 'Periodo del reporte de la aerolínea con el que se concilió';
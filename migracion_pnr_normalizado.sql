@@ -0,0 +1,38 @@
+-- ============================================================================
+-- KINESSIA HUB - CLAVES DE RESERVACIÓN (PNR) NORMALIZADAS
+-- ============================================================================
+-- Descripción: clave_sabre y clave_reserva de papeletas y desgloses se
+-- guardan sin espacios y en mayúsculas (normalizar_pnr en
+-- app/services/expedientes.py), así las búsquedas por PNR son por igualdad
+-- sobre un índice btree en vez de upper()/ILIKE sobre la tabla completa.
+-- Este script normaliza los renglones existentes y crea los índices.
+-- Después de correr este script:  flask reconstruir-expedientes
+-- ============================================================================
+
+-- Renglones existentes (solo los que cambian)
+UPDATE public.papeletas
+   SET clave_sabre = upper(btrim(clave_sabre, E' \t\r\n'))
+ WHERE clave_sabre <> upper(btrim(clave_sabre, E' \t\r\n'));
+
+UPDATE public.papeletas
+   SET clave_reserva = nullif(upper(btrim(clave_reserva, E' \t\r\n')), '')
+ WHERE clave_reserva IS DISTINCT FROM nullif(upper(btrim(clave_reserva, E' \t\r\n')), '');
+
+UPDATE public.desgloses
+   SET clave_reserva = upper(btrim(clave_reserva, E' \t\r\n'))
+ WHERE clave_reserva <> upper(btrim(clave_reserva, E' \t\r\n'));
+
+UPDATE public.desgloses
+   SET clave_sabre = nullif(upper(btrim(clave_sabre, E' \t\r\n')), '')
+ WHERE clave_sabre IS DISTINCT FROM nullif(upper(btrim(clave_sabre, E' \t\r\n')), '');
+
+-- Búsqueda por PNR (conciliación de aerolíneas, expedientes, facturación)
+CREATE INDEX IF NOT EXISTS idx_papeletas_clave_sabre ON public.papeletas(clave_sabre);
+CREATE INDEX IF NOT EXISTS idx_papeletas_clave_reserva ON public.papeletas(clave_reserva);
+CREATE INDEX IF NOT EXISTS idx_desgloses_clave_sabre ON public.desgloses(clave_sabre);
+CREATE INDEX IF NOT EXISTS idx_desgloses_clave_reserva ON public.desgloses(clave_reserva);
+
+COMMENT ON COLUMN public.papeletas.clave_sabre IS 'PNR Sabre, sin espacios y en mayúsculas';
+COMMENT ON COLUMN public.papeletas.clave_reserva IS 'Clave de reservación de la aerolínea, sin espacios y en mayúsculas';
+COMMENT ON COLUMN public.desgloses.clave_sabre IS 'PNR Sabre, sin espacios y en mayúsculas';
+COMMENT ON COLUMN public.desgloses.clave_reserva IS 'Clave de reservación de la aerolínea, sin espacios y en mayúsculas';
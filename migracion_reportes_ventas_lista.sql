@@ -0,0 +1,12 @@
+-- ============================================================================
+-- KINESSIA HUB - LISTADO DE REPORTES DE VENTAS PAGINADO
+-- ============================================================================
+-- Descripción: el listado de reportes de ventas se pagina por llave
+-- (fecha, id) descendente (pagina_reportes en
+-- app/services/reportes_ventas.py): cada página es un rango del índice a
+-- partir del último renglón de la anterior, sin OFFSET. Los agentes solo ven
+-- sus reportes, por eso el segundo índice empieza por usuario_id.
+-- ============================================================================
+
+CREATE INDEX IF NOT EXISTS idx_reportes_ventas_fecha_id ON public.reportes_ventas(fecha DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_reportes_ventas_usuario_fecha_id ON public.reportes_ventas(usuario_id, fecha DESC, id DESC);
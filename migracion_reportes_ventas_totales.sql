@@ -0,0 +1,12 @@
+-- ============================================================================
+-- KINESSIA HUB - TOTALES DE REPORTES DE VENTAS
+-- ============================================================================
+-- Descripción: Boletos por clave de aerolínea guardados en el reporte, junto
+-- a los demás totales. Los totales se mantienen al escribir cada línea (un
+-- UPDATE con la diferencia); después de aplicar esta migración llenar la
+-- columna con `flask verificar-totales-reportes --corregir`.
+-- ============================================================================
+
+ALTER TABLE public.reportes_ventas ADD COLUMN IF NOT EXISTS boletos_aerolinea JSON NOT NULL DEFAULT '{}';
+
+COMMENT ON COLUMN public.reportes_ventas.boletos_aerolinea IS 'Boletos por clave de aerolínea: {"Y4": 3, "AM": 1}';
@@ -0,0 +1,38 @@
+-- ============================================================================
+-- KINESSIA HUB - COLA DE TRABAJOS EN SEGUNDO PLANO
+-- ============================================================================
+-- Descripción: Trabajos largos (conciliación BSP / Volaris) que el request
+-- encola y ejecuta el worker `flask procesar-trabajos`. El worker los toma
+-- con FOR UPDATE SKIP LOCKED y escribe el avance en la columna progreso.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS public.trabajos (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    tipo VARCHAR(50) NOT NULL, -- 'conciliar_bsp', 'conciliar_volaris'
+    estatus VARCHAR(20) NOT NULL DEFAULT 'pendiente', -- pendiente, en_proceso, completado, error
+    parametros JSON NOT NULL DEFAULT '{}',
+    progreso JSON NOT NULL DEFAULT '{}',
+    resultado JSON,
+    error TEXT,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    worker VARCHAR(100),
+    usuario_id BIGINT REFERENCES public.usuarios(id),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    iniciado_at TIMESTAMPTZ,
+    actualizado_at TIMESTAMPTZ,
+    terminado_at TIMESTAMPTZ
+);
+
+-- Instalaciones que ya tenían la tabla
+ALTER TABLE public.trabajos ADD COLUMN IF NOT EXISTS actualizado_at TIMESTAMPTZ;
+UPDATE public.trabajos SET actualizado_at = iniciado_at WHERE actualizado_at IS NULL AND estatus = 'en_proceso';
+
+-- Solo los trabajos por tomar; la tabla crece con el historial
+CREATE INDEX IF NOT EXISTS idx_trabajos_por_tomar
+    ON public.trabajos (id)
+    WHERE estatus IN ('pendiente', 'en_proceso');
+
+COMMENT ON TABLE public.trabajos IS 'Cola de trabajos en segundo plano (flask procesar-trabajos)';
+COMMENT ON COLUMN public.trabajos.progreso IS 'Avance que escribe el worker: etapa, páginas leídas, documentos cruzados, errores';
+COMMENT ON COLUMN public.trabajos.intentos IS 'Veces que un worker lo tomó; un trabajo en proceso abandonado se reintenta hasta 3 veces y luego queda en error';
+COMMENT ON COLUMN public.trabajos.actualizado_at IS 'Último avance guardado por el worker; sin avance en 60 minutos el trabajo se considera abandonado';
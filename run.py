@@ -9,18 +9,20 @@ from dotenv import load_dotenv
 env_path = os.path.join(os.path.dirname(__file__), 'app', '.env')
 load_dotenv(env_path)
 
-# Debug: verificar que se cargaron las variables de email
-print(f"=== Variables de Email ===")
-print(f"EMAIL_SENDER: {os.environ.get('EMAIL_SENDER', 'NO CONFIGURADO')}")
-print(f"EMAIL_PASSWORD: {'****' if os.environ.get('EMAIL_PASSWORD') else 'NO CONFIGURADO'}")
-print(f"EMAIL_DIRECTOR: {os.environ.get('EMAIL_DIRECTOR', 'NO CONFIGURADO')}")
-print(f"SMTP_SERVER: {os.environ.get('SMTP_SERVER', 'NO CONFIGURADO')}")
-
 from app import create_app
 
 # Llama a la función 'create_app' que está en app/__init__.py
 app = create_app()
 
+# Verificar que se cargaron las variables de email (sin exponer valores)
+from app.services.logs import obtener_logger
+obtener_logger('config').info('variables de email', extra={'campos': {
+    'email_sender': bool(os.environ.get('EMAIL_SENDER')),
+    'email_password': bool(os.environ.get('EMAIL_PASSWORD')),
+    'email_director': bool(os.environ.get('EMAIL_DIRECTOR')),
+    'smtp_server': bool(os.environ.get('SMTP_SERVER')),
+}})
+
 # Esta sección se asegura de que el servidor solo se inicie
 # cuando ejecutas directamente el archivo 'run.py'.
 if __name__ == '__main__':
@@ -0,0 +1,81 @@
+# tests/test_parser_bsp.py
+# Lectura en stream del FCAGBILLDETSIMP (.txt/.csv) con iterar_bsp_txt
+
+import io
+
+from app.services.parser_bsp import iterar_bsp_txt
+
+BOM = b'\xef\xbb\xbf'
+
+
+def _stream(*lineas):
+    return io.BytesIO('\r\n'.join(lineas).encode('utf-8') + b'\r\n')
+
+
+def test_campo_entre_comillas_con_coma():
+    docs = list(iterar_bsp_txt(_stream('139,TKTT,5463633094,"CA,CC",1500.00,0.00,1500.00,MXN')))
+
+    assert len(docs) == 1
+    assert docs[0]['fop'] == 'CA,CC'
+    assert docs[0]['transaction_amount'] == 1500.0
+    assert docs[0]['currency'] == 'MXN'
+
+
+def test_monto_con_separador_de_miles():
+    docs = list(iterar_bsp_txt(_stream('139,TKTT,5463633094,CA,"1,234.50","12.30","1,222.20",MXN')))
+
+    assert docs[0]['transaction_amount'] == 1234.5
+    assert docs[0]['tax_on_commission'] == 12.3
+    assert docs[0]['balance_payable'] == 1222.2
+
+
+def test_bom_al_inicio():
+    stream = io.BytesIO(BOM + b'139,TKTT,5463633094,CA,100.00,0,100.00,MXN\r\n')
+
+    docs = list(iterar_bsp_txt(stream))
+
+    assert len(docs) == 1
+    assert docs[0]['airline_code'] == '139'
+    assert docs[0]['numero_completo'] == '1395463633094'
+
+
+def test_omite_encabezados_y_lineas_que_no_son_documentos():
+    stream = _stream(
+        'Agent Code,86506696',
+        'Airline Code,TRNC,Document Number,FOP,Transaction Amount,Tax on Commission,Balance Payable,Currency',
+        '# Periodo 260104,,,,,,,',
+        '',
+        'Total,3',
+        ',,,,,,,',
+        '6,TKTT,2100000001,CC,200.00,0,200.00,',
+        '139,CANX,5463633095,CA,0,0,0,MXN',
+    )
+
+    docs = list(iterar_bsp_txt(stream))
+
+    assert [d['numero_completo'] for d in docs] == ['0062100000001', '1395463633095']
+    assert docs[0]['currency'] == 'MXN'
+    assert docs[1]['trnc'] == 'CANX'
+
+
+def test_no_cierra_el_stream():
+    stream = _stream('139,TKTT,5463633094,CA,100.00,0,100.00,MXN')
+
+    list(iterar_bsp_txt(stream))
+
+    assert not stream.closed
+    stream.seek(0)
+    assert stream.read(3) == b'139'
+
+
+def test_no_cierra_el_stream_si_se_deja_de_leer():
+    stream = _stream(
+        '139,TKTT,5463633094,CA,100.00,0,100.00,MXN',
+        '139,TKTT,5463633095,CA,100.00,0,100.00,MXN',
+    )
+
+    documentos = iterar_bsp_txt(stream)
+    next(documentos)
+    documentos.close()
+
+    assert not stream.closed